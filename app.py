@@ -5,15 +5,16 @@ YouTube视频下载Web应用
 提供网页界面下载YouTube视频
 """
 
+import hmac
+import mimetypes
 import os
+import socket
 import sys
 import json
 import threading
+import time
+from functools import partial
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file, send_from_directory
-from flask_cors import CORS
-import yt_dlp
-from datetime import datetime
 
 # 设置Windows控制台编码为UTF-8
 if sys.platform == 'win32':
@@ -23,6 +24,37 @@ if sys.platform == 'win32':
     except:
         pass
 
+# 直接运行时先检查参数：--help 和参数错误时不加载Flask、yt-dlp，也不创建下载目录、打开任务存储
+if __name__ == '__main__':
+    from server import build_parser
+    _main_args = build_parser().parse_args()
+
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
+from flask_cors import CORS
+import yt_dlp
+from datetime import datetime
+from scheduler import DownloadScheduler, QueueFullError
+from metadata_cache import MetadataCache
+from task_store import FINISHED_STATUSES, INTERRUPTED_STATUSES, REMOTE_METHODS, create_task_store, order_claimable
+from progress_events import TaskEventBroker
+from file_catalog import FileCatalog, SORT_KEYS
+from batches import BatchManager
+from dedup import DownloadDeduplicator, download_key
+from format_policy import CODECS, format_options, parse_quality, policy_key
+from resume import PartialJanitor, backoff_delay, is_transient_error, partial_stem
+from bandwidth import BandwidthManager, parse_rate
+from streaming import available_bytes, iter_growing_file
+from delivery import FileDelivery
+from progress import DOWNLOAD_SHARE, ProgressTracker
+from postprocess import (DEFAULT_STAGES, STAGE_PHASES, PostProcessJob, PostProcessPipeline, download_parts,
+                         parse_stage_workers, parse_stages, thumbnail_path)
+from content_store import POLICIES, ContentStore, parse_size
+from ydl_pool import YoutubeDLPool
+from info_batch import BatchInfoResolver
+from leases import LeaseKeeper, LeaseLostError, LeaseReaper
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, start_metrics_server
+from server import pick_server, run_gunicorn, run_waitress, spawn_download_worker, stop_process, wait_for_signal
+
 app = Flask(__name__)
 CORS(app)
 
@@ -30,85 +62,309 @@ CORS(app)
 DOWNLOAD_DIR = Path("downloads")
 DOWNLOAD_DIR.mkdir(exist_ok=True)
 
-# 存储下载任务状态
-download_tasks = {}
+# 同时进行的下载数量和等待队列长度
+MAX_WORKERS = int(os.environ.get('YTD_MAX_WORKERS', '2'))
+MAX_QUEUE_SIZE = int(os.environ.get('YTD_MAX_QUEUE', '100'))
 
+# 单个批次最多展开的视频数
+BATCH_MAX_ITEMS = int(os.environ.get('YTD_BATCH_MAX_ITEMS', '1000'))
 
-def get_video_info(url):
-    """获取视频信息（不下载）"""
+# 批量获取视频信息（/api/info/batch）：所有批次共用的解析线程数、单个链接的解析超时（秒）、单次最多的链接数
+INFO_WORKERS = int(os.environ.get('YTD_INFO_WORKERS', '8'))
+INFO_TIMEOUT = float(os.environ.get('YTD_INFO_TIMEOUT', '30'))
+INFO_BATCH_MAX_URLS = int(os.environ.get('YTD_INFO_BATCH_MAX_URLS', '500'))
+
+# 分片（DASH/HLS）并发下载数的上限
+MAX_CONCURRENT_FRAGMENTS = 16
+
+# 暂时性网络错误时任务的自动重试次数和首次重试的等待时间（秒，之后按指数增长）
+TASK_MAX_RETRIES = int(os.environ.get('YTD_TASK_RETRIES', '3'))
+RETRY_BASE_DELAY = float(os.environ.get('YTD_RETRY_DELAY', '10'))
+RETRY_MAX_DELAY = 300
+
+# 临时文件（.part等）超过这个时间没有修改、且不属于进行中的任务时清理（秒）
+PARTIAL_MAX_AGE = int(os.environ.get('YTD_PARTIAL_MAX_AGE', str(24 * 3600)))
+JANITOR_INTERVAL = 3600
+
+# 全局下载带宽上限（如 10M，表示10MiB/s），按优先级公平分配给正在下载的任务；不设置时不限制
+BANDWIDTH_LIMIT = parse_rate(os.environ.get('YTD_BANDWIDTH_LIMIT') or None)
+
+# 文件传输方式：direct 由应用发送（支持Range）；x-sendfile / x-accel 交给Apache/nginx发送
+DELIVERY_MODE = os.environ.get('YTD_DELIVERY_MODE', 'direct')
+ACCEL_PREFIX = os.environ.get('YTD_ACCEL_PREFIX', '/protected-downloads/')
+
+# /api/stream 等待下载开始（第一批数据写入）的最长时间（秒）
+STREAM_START_TIMEOUT = 60
+
+# /api/stream 传输期间每隔多久在任务中记录一次 streamed_at（秒）；
+# 最近 STREAM_BUSY_SECONDS 秒内有记录时，处理流水线推迟替换文件的阶段（remux等）
+STREAM_MARK_INTERVAL = 5
+STREAM_BUSY_SECONDS = 30
+
+# 任务存储（SQLite）；多个进程共用同一个文件时共享任务状态
+TASK_DB = os.environ.get('YTD_TASK_DB') or None
+
+# 其他主机上的下载节点：YTD_QUEUE_URL 为网页节点的地址，通过它读写任务存储（不需要 YTD_TASK_DB）；
+# 网页节点和下载节点设置相同的 YTD_WORKER_TOKEN，网页节点只在设置后才接受下载节点的请求
+QUEUE_URL = os.environ.get('YTD_QUEUE_URL') or None
+WORKER_TOKEN = os.environ.get('YTD_WORKER_TOKEN') or None
+
+# 进程角色：all 处理请求并执行下载；web 只处理请求；worker 只执行下载
+# （web 需要 YTD_TASK_DB；worker 需要 YTD_TASK_DB 或 YTD_QUEUE_URL）
+ROLE = os.environ.get('YTD_ROLE') or ('worker' if QUEUE_URL else 'all')
+if ROLE not in ('all', 'web', 'worker'):
+    raise SystemExit(f'YTD_ROLE 无效: {ROLE}，可选: all, web, worker')
+if QUEUE_URL and ROLE != 'worker':
+    raise SystemExit('YTD_QUEUE_URL 只用于下载节点（YTD_ROLE=worker）')
+if QUEUE_URL and not WORKER_TOKEN:
+    raise SystemExit('YTD_QUEUE_URL 需要设置 YTD_WORKER_TOKEN（与网页节点相同）')
+if ROLE != 'all' and not (TASK_DB or QUEUE_URL):
+    raise SystemExit(f'YTD_ROLE={ROLE} 需要设置 YTD_TASK_DB（网页进程和下载进程共用的SQLite任务存储）')
+
+# 节点名（任务的 worker 字段，/api/status 中的 node）；设置固定的节点名后，重启时立即恢复本节点未完成的任务
+NODE_ID = os.environ.get('YTD_NODE_ID') or f'{socket.gethostname()}:{os.getpid()}'
+
+# 下载节点领取任务的租约（秒）：每 1/3 租约时长发送一次心跳，超过租约时长没有心跳的任务重新排队
+LEASE_TTL = float(os.environ.get('YTD_LEASE_TTL', '60'))
+
+# 停止服务时等待进行中的下载完成的最长时间（秒），超时未完成的任务在下次启动时继续
+DRAIN_TIMEOUT = float(os.environ.get('YTD_DRAIN_TIMEOUT', '30'))
+
+# 下载后的处理流水线：启用的阶段（逗号分隔）和各阶段的并发数（如 transcode=2,merge=1），见 postprocess
+try:
+    POSTPROCESS_STAGES = parse_stages(os.environ.get('YTD_POSTPROCESS', ','.join(DEFAULT_STAGES)))
+    POSTPROCESS_WORKERS = parse_stage_workers(os.environ.get('YTD_POSTPROCESS_WORKERS'))
+except ValueError as e:
+    raise SystemExit(f'YTD_POSTPROCESS / YTD_POSTPROCESS_WORKERS 无效: {e}')
+
+# 内容寻址存储：下载完成的文件保存在 YTD_CONTENT_STORE 中，下载目录中的文件名是硬链接，相同内容只保存一份；
+# YTD_DISK_QUOTA（如 50G）为存储的容量上限；淘汰会删除下载目录中的文件，只在 YTD_QUOTA_EVICT=1 时
+# 按 YTD_EVICTION_POLICY（lru/lfu）淘汰，否则超出配额时只打印警告，见 content_store
+CONTENT_STORE_DIR = os.environ.get('YTD_CONTENT_STORE') or None
+EVICTION_POLICY = os.environ.get('YTD_EVICTION_POLICY', 'lru')
+QUOTA_EVICT = os.environ.get('YTD_QUOTA_EVICT', '0') == '1'
+try:
+    DISK_QUOTA = parse_size(os.environ.get('YTD_DISK_QUOTA') or None)
+except ValueError as e:
+    raise SystemExit(f'YTD_DISK_QUOTA 无效: {e}')
+if EVICTION_POLICY not in POLICIES:
+    raise SystemExit(f"YTD_EVICTION_POLICY 无效: {EVICTION_POLICY}，可选: {', '.join(POLICIES)}")
+if DISK_QUOTA and not CONTENT_STORE_DIR:
+    raise SystemExit('YTD_DISK_QUOTA 需要设置 YTD_CONTENT_STORE（按存储中的访问记录淘汰文件）')
+
+# 视频元数据缓存（YTD_METADATA_CACHE_DB 设置后启用磁盘缓存）
+metadata_cache = MetadataCache(
+    max_entries=int(os.environ.get('YTD_METADATA_CACHE_SIZE', '128')),
+    ttl=int(os.environ.get('YTD_METADATA_TTL', '1800')),
+    db_path=os.environ.get('YTD_METADATA_CACHE_DB') or None,
+)
+
+# YoutubeDL实例池：选项相同的解析和下载复用实例（HTTP keep-alive连接、解析器的缓存），见 ydl_pool；
+# YTD_YDL_POOL_SIZE 为每组选项保留的空闲实例数（0表示每次新建，默认与批量解析的线程数相同），
+# YTD_YDL_POOL_IDLE 为空闲实例的保留时间（秒）
+ydl_pool = YoutubeDLPool(
+    size=int(os.environ.get('YTD_YDL_POOL_SIZE', str(INFO_WORKERS))),
+    idle_timeout=float(os.environ.get('YTD_YDL_POOL_IDLE', '300')),
+)
+
+# 下载任务存储（YTD_TASK_DB 设置后使用SQLite，重启后可恢复未完成的任务）
+task_store = create_task_store(
+    TASK_DB,
+    url=QUEUE_URL,
+    token=WORKER_TOKEN,
+    max_finished=int(os.environ.get('YTD_MAX_FINISHED_TASKS', '500')),
+    finished_ttl=int(os.environ.get('YTD_FINISHED_TASK_TTL', str(24 * 3600))),
+)
+
+# 带宽分配
+bandwidth = BandwidthManager(BANDWIDTH_LIMIT)
+
+# 下载进度：内存中按任务记录，合并后写入任务存储（间隔 YTD_PROGRESS_INTERVAL 秒）
+progress_tracker = ProgressTracker(task_store, flush_interval=float(os.environ.get('YTD_PROGRESS_INTERVAL', '0.5')))
+
+# 内容寻址存储和磁盘配额（未设置 YTD_CONTENT_STORE 时不使用）
+content_store = ContentStore(CONTENT_STORE_DIR, quota=DISK_QUOTA, policy=EVICTION_POLICY,
+                             delete_files=QUOTA_EVICT) if CONTENT_STORE_DIR else None
+
+# 文件传输（x-accel模式下 YTD_ACCEL_ROOT 对应nginx中 ACCEL_PREFIX 指向的目录，默认为下载目录）
+file_delivery = FileDelivery(
+    DELIVERY_MODE,
+    accel_prefix=ACCEL_PREFIX,
+    accel_root=os.environ.get('YTD_ACCEL_ROOT') or DOWNLOAD_DIR,
+)
+
+# 已下载文件索引：默认目录 + 任务中使用过的目录
+file_catalog = FileCatalog()
+file_catalog.add_directory(DOWNLOAD_DIR)
+for _task in task_store.all():
+    if _task.get('download_dir'):
+        file_catalog.add_directory(_task['download_dir'])
+
+# 下载去重：合并进行中的相同下载，已下载的文件直接复用（多进程时到任务存储中查找其他进程的下载）
+deduplicator = DownloadDeduplicator(task_store, shared=ROLE != 'all')
+deduplicator.load(task_store.find_by_status('completed'))
+
+# 运行指标（/metrics）：任务数、队列长度等当前值在抓取时读取
+metrics = Registry()
+TASKS_FINISHED = metrics.counter('ytd_tasks_finished_total', '结束的下载任务数', ['status'])
+TASK_RETRIES = metrics.counter('ytd_task_retries_total', '暂时性错误后自动重试的次数')
+TASKS_REASSIGNED = metrics.counter('ytd_tasks_reassigned_total', '下载节点租约过期后重新排队的任务数')
+DOWNLOAD_REQUESTS = metrics.counter(
+    'ytd_download_requests_total', '下载请求数（new 新下载，joined 合并到进行中的下载，reused 复用已有文件）', ['result'])
+DOWNLOADED_BYTES = metrics.counter('ytd_downloaded_bytes_total', '下载的字节数')
+DOWNLOAD_SECONDS = metrics.histogram(
+    'ytd_download_duration_seconds', '任务从开始下载到结束的耗时（秒）', ['status'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600))
+EXTRACT_SECONDS = metrics.histogram(
+    'ytd_extract_duration_seconds', 'yt-dlp解析视频信息的耗时（秒，不含缓存命中）',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+VIDEO_INFO_SECONDS = metrics.histogram('ytd_video_info_duration_seconds', '获取视频信息的耗时（秒，含缓存命中）', ['result'])
+POSTPROCESS_SECONDS = metrics.histogram(
+    'ytd_postprocess_duration_seconds', 'yt-dlp内的后处理（修复等）的耗时（秒）', ['postprocessor'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+POSTPROCESS_STAGE_SECONDS = metrics.histogram(
+    'ytd_postprocess_stage_duration_seconds', '下载后处理流水线各阶段的耗时（秒）', ['stage'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+INFO_BATCH_TIMEOUTS = metrics.counter('ytd_info_batch_timeouts_total', '批量获取视频信息时超时返回的链接数')
+FILE_LISTING_SECONDS = metrics.histogram('ytd_file_listing_duration_seconds', '文件列表请求的耗时（秒）')
+metrics.gauge('ytd_tasks', '各状态的任务数', ['status'], callback=lambda: task_store.count_by_status())
+metrics.gauge('ytd_queue_depth', '等待下载的任务数', callback=lambda: queue_stats()['queued'])
+metrics.gauge('ytd_downloads_running', '正在下载的任务数', callback=lambda: queue_stats()['running'])
+metrics.gauge('ytd_postprocess_queue_depth', '等待各处理阶段的任务数', ['stage'], callback=lambda: {
+    stage: stats['queued'] for stage, stats in postprocessor.stats().items()
+})
+metrics.gauge('ytd_task_speed_bytes', '正在下载的任务的速度（字节/秒）', ['task_id'], callback=lambda: {
+    task['task_id']: task.get('speed') or 0 for task in task_store.find_by_status('downloading')
+})
+metrics.counter('ytd_metadata_cache_hits_total', '视频信息缓存命中次数', callback=lambda: metadata_cache.stats()['hits'])
+metrics.counter('ytd_metadata_cache_misses_total', '视频信息缓存未命中次数', callback=lambda: metadata_cache.stats()['misses'])
+metrics.gauge('ytd_metadata_cache_hit_ratio', '视频信息缓存命中率', callback=lambda: metadata_cache.stats()['hit_ratio'])
+STORAGE_EVICTED = metrics.counter('ytd_storage_evicted_files_total', '超出磁盘配额后淘汰的文件数')
+if content_store is not None:
+    metrics.gauge('ytd_storage_bytes', '内容存储占用的空间（字节）', callback=lambda: content_store.stats()['bytes'])
+    metrics.gauge('ytd_storage_saved_bytes', '相同内容合并为硬链接节省的空间（字节）',
+                  callback=lambda: content_store.stats()['saved_bytes'])
+metrics.gauge('ytd_ydl_pool_instances', 'YoutubeDL实例池中的实例数', ['state'], callback=lambda: {
+    state: ydl_pool.stats()[state] for state in ('idle', 'in_use')
+})
+metrics.counter('ytd_ydl_pool_acquired_total', '从YoutubeDL实例池借出实例的次数（新建/复用）', ['result'], callback=lambda: {
+    result: ydl_pool.stats()[result] for result in ('created', 'reused')
+})
+metrics.gauge('ytd_dedup_completed_files', '可复用的已下载文件数', callback=lambda: deduplicator.stats()['completed'])
+
+
+def extract_video_metadata(url):
+    """调用yt-dlp解析视频信息，返回可缓存（可JSON序列化）的info字典"""
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
     }
-    
+    with EXTRACT_SECONDS.time(), ydl_pool.acquire(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        return ydl.sanitize_info(info, remove_private_keys=True)
+
+
+def video_summary(info):
+    """/api/info 返回的视频信息字段"""
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'thumbnail': info.get('thumbnail', ''),
+        'uploader': info.get('uploader', 'Unknown'),
+        'view_count': info.get('view_count', 0),
+        'success': True
+    }
+
+
+def cached_video_info(url):
+    """缓存中的视频信息（不解析），没有时返回None"""
+    started = time.perf_counter()
+    info = metadata_cache.get(url, count_miss=False)
+    if info is None:
+        return None
+    VIDEO_INFO_SECONDS.observe(time.perf_counter() - started, result='success')
+    return video_summary(info)
+
+
+def get_video_info(url):
+    """获取视频信息（不下载）"""
+    started = time.perf_counter()
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'thumbnail': info.get('thumbnail', ''),
-                'uploader': info.get('uploader', 'Unknown'),
-                'view_count': info.get('view_count', 0),
-                'success': True
-            }
+        info = metadata_cache.get_or_extract(url, extract_video_metadata)
+        VIDEO_INFO_SECONDS.observe(time.perf_counter() - started, result='success')
+        return video_summary(info)
     except Exception as e:
+        VIDEO_INFO_SECONDS.observe(time.perf_counter() - started, result='error')
         return {
             'success': False,
             'error': str(e)
         }
 
 
-def download_video_task(task_id, url, quality="best", download_dir=None):
-    """后台下载任务"""
+def download_video_task(task_id, url, quality="best", download_dir=None, options=None):
+    """
+    后台下载任务
+
+    Args:
+        options: 额外的下载选项，concurrent_fragments 为分片并发下载数，codec 为优先的视频编码，
+                 rate_limit 为任务限速（字节/秒），stream 为只选择单一文件格式（可以边下载边传输），
+                 force 为覆盖已有文件重新下载，transcode 为下载后重新编码为H.264
+
+    文件下载完成后交给处理流水线（合并、检查等），下载线程不等待；任务在流水线结束后完成
+    """
+    options = options or {}
     # 使用自定义目录或默认目录
     if download_dir:
         output_path = Path(download_dir)
     else:
         output_path = DOWNLOAD_DIR
     output_path.mkdir(parents=True, exist_ok=True)
-    has_ffmpeg = False
-    try:
-        import shutil
-        has_ffmpeg = shutil.which('ffmpeg') is not None
-    except:
-        pass
     
     ydl_opts = {
         'outtmpl': str(output_path / '%(title)s.%(ext)s'),
         'noplaylist': True,
         'prefer_free_formats': False,
-        'format_sort': ['ext:mp4', 'ext:webm', 'res', 'codec:h264', 'codec:vp9'],
-        'progress_hooks': [lambda d: update_progress(task_id, d)],
+        # 断点续传：重启或重试后继续使用已下载的 .part 文件
+        'continuedl': True,
+        'retries': 10,
+        'fragment_retries': 10,
+        'retry_sleep_functions': {
+            'http': partial(backoff_delay, base=1.0, cap=30.0),
+            'fragment': partial(backoff_delay, base=1.0, cap=30.0),
+        },
     }
+    if options.get('concurrent_fragments'):
+        ydl_opts['concurrent_fragment_downloads'] = options['concurrent_fragments']
+    if options.get('force'):
+        ydl_opts['overwrites'] = True
     
-    # 格式选择策略（避免MPEG-TS问题）
-    if has_ffmpeg:
-        ydl_opts['merge_output_format'] = 'mp4'
-        if quality == "best":
-            ydl_opts['format'] = 'bestvideo[ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a]/bestvideo[ext=webm][protocol!=m3u8]+bestaudio[ext=webm]/best[ext=mp4][protocol!=m3u8]/best[ext=webm][protocol!=m3u8]/best[protocol!=m3u8]'
-        elif quality == "720p":
-            ydl_opts['format'] = 'bestvideo[height<=720][ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a]/bestvideo[height<=720][ext=webm][protocol!=m3u8]+bestaudio[ext=webm]/best[height<=720][ext=mp4][protocol!=m3u8]/best[height<=720][protocol!=m3u8]'
-        elif quality == "1080p":
-            ydl_opts['format'] = 'bestvideo[height<=1080][ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a]/bestvideo[height<=1080][ext=webm][protocol!=m3u8]+bestaudio[ext=webm]/best[height<=1080][ext=mp4][protocol!=m3u8]/best[height<=1080][protocol!=m3u8]'
-        elif quality == "worst":
-            ydl_opts['format'] = 'worst[ext=mp4][protocol!=m3u8]/worst[ext=webm][protocol!=m3u8]/worst[protocol!=m3u8]'
-    else:
-        if quality == "best":
-            ydl_opts['format'] = 'best[ext=mp4][protocol!=m3u8][vcodec!=none][acodec!=none]/best[ext=webm][protocol!=m3u8][vcodec!=none][acodec!=none]/best[protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "720p":
-            ydl_opts['format'] = 'best[height<=720][ext=mp4][protocol!=m3u8][vcodec!=none][acodec!=none]/best[height<=720][ext=webm][protocol!=m3u8][vcodec!=none][acodec!=none]/best[height<=720][protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "1080p":
-            ydl_opts['format'] = 'best[height<=1080][ext=mp4][protocol!=m3u8][vcodec!=none][acodec!=none]/best[height<=1080][ext=webm][protocol!=m3u8][vcodec!=none][acodec!=none]/best[height<=1080][protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "worst":
-            ydl_opts['format'] = 'worst[ext=mp4][protocol!=m3u8][vcodec!=none][acodec!=none]/worst[ext=webm][protocol!=m3u8][vcodec!=none][acodec!=none]/worst[protocol!=m3u8][vcodec!=none][acodec!=none]'
-    
+    started = time.monotonic()
     try:
-        download_tasks[task_id]['status'] = 'downloading'
-        download_tasks[task_id]['progress'] = 0
+        # 格式选择策略（避免MPEG-TS问题），见 format_policy
+        ydl_opts.update(format_options(quality, merge=False if options.get('stream') else None,
+                                       codec=options.get('codec')))
+        task_store.update(task_id, status='downloading', progress=0, error=None, retry_at=None, worker=NODE_ID)
+        task = task_store.get(task_id) or {}
+        bandwidth.register(task_id, limit=options.get('rate_limit'), priority=task.get('priority', 0))
+        progress_tracker.start(task_id)
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        # 复用选项相同（画质、下载目录等）的YoutubeDL实例，回调只在本任务借用期间绑定
+        with ydl_pool.acquire(ydl_opts,
+                              progress_hooks=[lambda d: update_progress(task_id, d)],
+                              postprocessor_hooks=[lambda d: update_postprocessor(task_id, d)]) as ydl:
+            cached_info = metadata_cache.get(url)
+            info = None
+            if cached_info is not None:
+                # 复用/api/info已解析的结果，不再重复解析
+                try:
+                    info, parts = fetch_video(ydl, task_id, cached_info)
+                except yt_dlp.utils.DownloadError:
+                    # 缓存中的下载地址可能已失效，重新解析
+                    metadata_cache.invalidate(url)
+            if info is None:
+                info = ydl.extract_info(url, download=False)
+                metadata_cache.put(url, ydl.sanitize_info(info, remove_private_keys=True))
+                info, parts = fetch_video(ydl, task_id, info)
             filename = ydl.prepare_filename(info)
             
             # 获取实际下载的文件名
@@ -121,28 +377,528 @@ def download_video_task(task_id, url, quality="best", download_dir=None):
                         actual_file = test_file
                         break
             
-            download_tasks[task_id]['status'] = 'completed'
-            download_tasks[task_id]['progress'] = 100
-            download_tasks[task_id]['filename'] = actual_file.name
-            download_tasks[task_id]['filepath'] = str(actual_file)
-            download_tasks[task_id]['download_dir'] = str(output_path)
+            # 任务已被重新分配给其他节点时不再写入
+            lease_keeper.confirm(task_id)
+            # 合并、检查等在处理流水线中进行，不占用下载线程
+            task_store.update(task_id, phase='postprocessing', progress=DOWNLOAD_SHARE, speed=0, eta=0)
+            postprocessor.submit(PostProcessJob(
+                task_id, actual_file, parts=parts, options=options,
+                context={'started': started, 'download_dir': str(output_path),
+                         'video_id': info.get('id'), 'format_id': info.get('format_id')},
+            ))
             
     except Exception as e:
-        download_tasks[task_id]['status'] = 'error'
-        download_tasks[task_id]['error'] = str(e)
+        if isinstance(e, LeaseLostError) or not lease_keeper.holds(task_id):
+            # 租约过期后任务由其他节点下载，这里不再修改任务状态
+            return
+        task = task_store.get(task_id) or {}
+        attempts = task.get('attempts', 0)
+        if is_transient_error(e) and attempts < TASK_MAX_RETRIES:
+            # 暂时性网络错误：等待一段时间后重新排队，已下载的部分会继续使用
+            delay = backoff_delay(attempts, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+            task_store.update(task_id, status='queued', attempts=attempts + 1, error=str(e),
+                              retry_at=time.time() + delay)
+            schedule_retry(task_id, delay)
+            TASK_RETRIES.inc()
+            return
+        complete_task(task_id, {'status': 'error', 'error': str(e)}, started)
+    finally:
+        bandwidth.unregister(task_id)
+        progress_tracker.finish(task_id)
+        lease_keeper.forget(task_id)
+
+
+def fetch_video(ydl, task_id, info):
+    """
+    按格式选择策略下载视频：单一格式由yt-dlp下载；视频+音频分别下载，合并留给处理流水线
+
+    Returns:
+        (info, 分别下载的文件列表)
+    """
+    selected = ydl.process_ie_result(dict(info), download=False)
+    # 开始下载前记录要下载的格式大小（视频+音频时按字节加权计算总进度）
+    progress_tracker.plan(task_id, selected.get('requested_formats') or [selected])
+    if not selected.get('requested_formats'):
+        return ydl.process_ie_result(info, download=True), []
+    return selected, download_parts(ydl, selected)
+
+
+def complete_task(task_id, result, started):
+    """任务结束：写入最终状态、记录指标，同步给合并到这个下载的其他任务"""
+    task_store.update(task_id, **result)
+    TASKS_FINISHED.inc(status=result['status'])
+    DOWNLOAD_SECONDS.observe(time.monotonic() - started, status=result['status'])
+    deduplicator.finish(task_id, **result)
+
+
+def update_postprocess_stage(task_id, stage, index, count):
+    """处理流水线的阶段开始：更新任务阶段，进度在下载完成后的 95%~100% 之间"""
+    task_store.update(task_id, phase=STAGE_PHASES[stage],
+                      progress=DOWNLOAD_SHARE + (100 - DOWNLOAD_SHARE) * index // count)
+
+
+def finish_postprocess(job, error):
+    """处理流水线结束：写入任务的最终状态（任务已被重新分配给其他节点时不写入）"""
+    holds = lease_keeper.holds(job.task_id)
+    lease_keeper.forget(job.task_id)
+    if not holds:
+        return
+    if error is not None:
+        complete_task(job.task_id, {'status': 'error', 'error': f'处理失败: {error}'}, job.context['started'])
+        return
+    path = Path(job.filepath)
+    if content_store is not None:
+        store_file(path, job)
+    result = dict(
+        job.fields,
+        status='completed',
+        progress=100,
+        phase=None,
+        filename=path.name,
+        filepath=str(path),
+        download_dir=job.context['download_dir'],
+        warnings=job.warnings or None,
+    )
+    file_catalog.add_file(path)
+    complete_task(job.task_id, result, job.context['started'])
+
+
+def store_file(path, job):
+    """把处理完成的文件纳入内容存储（相同内容合并为硬链接），超出磁盘配额时淘汰其他文件"""
+    stored = content_store.ingest(path, video_id=job.context.get('video_id'),
+                                  format_id=job.context.get('format_id'), sha256=job.fields.get('sha256'))
+    if stored is None:
+        return
+    job.fields['sha256'] = stored['sha256']
+    remove_evicted(content_store.evict(protect={stored['sha256']}))
+
+
+def remove_evicted(paths):
+    """淘汰的文件从文件索引中移除，并删除缩略图"""
+    for path in paths:
+        file_catalog.remove_file(path)
+        thumbnail_path(path).unlink(missing_ok=True)
+    STORAGE_EVICTED.inc(len(paths))
+
+
+# 下载后的处理流水线：各阶段使用独立的线程池，不占用下载线程
+postprocessor = PostProcessPipeline(
+    POSTPROCESS_STAGES,
+    POSTPROCESS_WORKERS,
+    on_stage=update_postprocess_stage,
+    on_done=finish_postprocess,
+    on_timing=lambda stage, seconds: POSTPROCESS_STAGE_SECONDS.observe(seconds, stage=stage),
+    busy=lambda job: is_streaming(job.task_id),
+)
 
 
 def update_progress(task_id, d):
-    """更新下载进度"""
-    if task_id in download_tasks:
-        if d['status'] == 'downloading':
-            total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            downloaded = d.get('downloaded_bytes', 0)
-            if total > 0:
-                progress = int((downloaded / total) * 100)
-                download_tasks[task_id]['progress'] = progress
-                download_tasks[task_id]['speed'] = d.get('speed', 0)
-                download_tasks[task_id]['eta'] = d.get('eta', 0)
+    """
+    yt-dlp进度回调（每下载一块数据调用一次）：超出分配的带宽时在这里等待，
+    进度由 progress_tracker 在内存中更新，合并后写入任务存储；
+    任务的租约已过期（已由其他节点下载）时抛出 LeaseLostError 中止下载
+    """
+    lease_keeper.check(task_id)
+    if d['status'] == 'downloading':
+        received = bandwidth.throttle(task_id, d)
+        if received > 0:
+            DOWNLOADED_BYTES.inc(received)
+    progress_tracker.on_download(task_id, d)
+
+
+def update_postprocessor(task_id, d):
+    """yt-dlp后处理回调：更新阶段，记录yt-dlp内的后处理（修复等）的耗时"""
+    seconds = progress_tracker.on_postprocessor(task_id, d)
+    if seconds is not None:
+        POSTPROCESS_SECONDS.observe(seconds, postprocessor=d.get('postprocessor'))
+
+
+# 批量获取视频信息：共用的解析线程池，缓存命中时直接返回
+info_resolver = BatchInfoResolver(get_video_info, cached=cached_video_info, workers=INFO_WORKERS, timeout=INFO_TIMEOUT)
+
+# 下载调度器：固定数量的工作线程从优先级队列中取任务
+scheduler = DownloadScheduler(download_video_task, max_workers=MAX_WORKERS, max_queue=MAX_QUEUE_SIZE)
+
+# 下载节点（worker）：心跳续约正在下载的任务；租约过期（节点失去响应）的任务重新排队
+lease_keeper = LeaseKeeper(
+    task_store, NODE_ID, lambda: scheduler.running_tasks() + postprocessor.active_tasks(), LEASE_TTL,
+    info=lambda: {'workers': MAX_WORKERS, 'running': len(scheduler.running_tasks())},
+)
+lease_reaper = LeaseReaper(task_store, LEASE_TTL / 2, on_reassigned=lambda tasks: TASKS_REASSIGNED.inc(len(tasks)))
+
+
+def task_args(task):
+    """任务记录对应的 download_video_task 参数（task_id之后的部分）"""
+    download_dir = task.get('download_dir')
+    return (
+        task['url'], task.get('quality', 'best'),
+        download_dir if download_dir and download_dir != str(DOWNLOAD_DIR) else None,
+        task.get('options'),
+    )
+
+
+def submit_existing_task(task):
+    """把已有的任务记录重新放入下载队列（恢复和重试时使用，不受队列长度限制）"""
+    scheduler.submit(task['task_id'], *task_args(task), priority=task.get('priority', 0), enforce_limit=False)
+
+
+def enqueue_task(task_id, url, quality, download_dir, options, priority):
+    """
+    放入下载队列；web进程只检查队列长度，任务由下载进程从任务存储中领取
+    队列已满时抛出 QueueFullError
+    """
+    if ROLE == 'web':
+        # 新任务已经以queued状态写入任务存储，与本地队列一样只比较其他等待中的任务
+        if MAX_QUEUE_SIZE and task_store.count_queued_primaries(exclude=task_id) >= MAX_QUEUE_SIZE:
+            raise QueueFullError(f'下载队列已满（最多{MAX_QUEUE_SIZE}个等待任务）')
+        return
+    scheduler.submit(task_id, url, quality, download_dir, options, priority=priority)
+
+
+def claim_next_task():
+    """下载进程的任务来源：从共享的任务存储中领取下一个排队任务"""
+    task = task_store.claim(NODE_ID, lease=LEASE_TTL)
+    if task is None:
+        return None
+    return task['task_id'], task_args(task)
+
+
+_queue_order_lock = threading.Lock()
+_queue_order = {'at': 0, 'positions': {}}
+
+
+def queue_position(task_id):
+    """任务在下载队列中的位置（从1开始），不在队列中返回None"""
+    if ROLE != 'web':
+        return scheduler.position(task_id)
+    # web进程没有本地队列，按任务存储中的排队顺序计算（缓存1秒）
+    with _queue_order_lock:
+        now = time.monotonic()
+        if now - _queue_order['at'] > 1.0:
+            queued = order_claimable(task_store.find_by_status('queued'))
+            _queue_order['positions'] = {task['task_id']: i + 1 for i, task in enumerate(queued)}
+            _queue_order['at'] = now
+        return _queue_order['positions'].get(task_id)
+
+
+def queue_stats():
+    """下载队列统计（/api/queue）"""
+    if ROLE == 'web':
+        counts = task_store.count_by_status()
+        return {
+            'role': ROLE,
+            'running': counts.get('downloading', 0),
+            'queued': task_store.count_queued_primaries(),
+            'max_queue': MAX_QUEUE_SIZE,
+            # 最近一个租约时长内有心跳的下载节点
+            'nodes': task_store.nodes(max_age=LEASE_TTL),
+        }
+    return dict(scheduler.stats(), role=ROLE, node=NODE_ID, postprocess=postprocessor.stats())
+
+
+def schedule_retry(task_id, delay):
+    """等待delay秒后重新排队（进程在此之前退出时，任务会在下次启动时恢复）"""
+    if scheduler.source is not None:
+        # 下载进程按 retry_at 从任务存储中领取，不需要定时器
+        return
+    
+    def resubmit():
+        task = task_store.get(task_id)
+        if task is None or task['status'] != 'queued':
+            return
+        try:
+            submit_existing_task(task)
+        except QueueFullError:
+            pass
+    
+    timer = threading.Timer(delay, resubmit)
+    timer.daemon = True
+    timer.start()
+
+
+def recover_tasks():
+    """把上次运行时未完成的任务重新放入下载队列（已下载的 .part 文件会继续使用）"""
+    if scheduler.source is not None:
+        # 下载节点：只恢复本节点（相同的 YTD_NODE_ID）上次领取的任务，重置为queued后由工作线程领取；
+        # 其他节点的任务在租约过期后重新排队
+        return len(task_store.recover(NODE_ID))
+    tasks = task_store.recover()
+    for task in tasks:
+        # 相同的任务恢复后仍然只下载一次
+        deduplicator.start_or_join(task['task_id'], task.get('dedup_key'),
+                                   lambda task=task: submit_existing_task(task))
+    return len(tasks)
+
+
+def active_partial_stems():
+    """未完成任务的临时文件名，清理时保留用于续传"""
+    return {
+        partial_stem(task['partial'])
+        for task in task_store.find_by_status(*INTERRUPTED_STATUSES)
+        if task.get('partial')
+    }
+
+
+def known_partial_stems():
+    """任务记录中的临时文件名（包括已失败的任务），这些视频未合并的格式文件可以清理"""
+    return {partial_stem(task['partial']) for task in task_store.all() if task.get('partial')}
+
+
+def janitor_directories():
+    """清理临时文件的目录：默认下载目录 + 任务使用过的下载目录（不包括只是在文件列表中浏览过的目录）"""
+    directories = {os.path.abspath(DOWNLOAD_DIR)}
+    for task in task_store.all():
+        if task.get('download_dir'):
+            directories.add(os.path.abspath(task['download_dir']))
+    return sorted(directories)
+
+
+# 定期清理下载目录中过期的临时文件
+partial_janitor = PartialJanitor(
+    janitor_directories,
+    active_partial_stems,
+    max_age=PARTIAL_MAX_AGE,
+    interval=JANITOR_INTERVAL,
+    known=known_partial_stems,
+)
+
+
+def start_background_tasks():
+    """
+    启动下载相关的后台任务：恢复上次未完成的任务、定期清理临时文件
+    web进程不执行下载，不启动；worker进程从共享的任务存储中领取任务
+
+    Returns:
+        恢复的任务数
+    """
+    if ROLE == 'web':
+        return 0
+    if ROLE == 'worker':
+        scheduler.source = claim_next_task
+    else:
+        # 批次在网页进程中展开（gunicorn模式下由 run_production 在启动网页进程前处理）
+        batch_manager.recover()
+    recovered = recover_tasks()
+    if content_store is not None:
+        # 清理已被删除的文件的记录，按当前配额淘汰
+        content_store.prune()
+        remove_evicted(content_store.evict())
+    partial_janitor.start()
+    if ROLE == 'worker':
+        lease_keeper.start()
+        lease_reaper.start()
+    scheduler.start()
+    return recovered
+
+
+def drain_downloads(timeout=DRAIN_TIMEOUT):
+    """
+    停止接收新的下载，等待队列中和进行中的下载完成
+
+    Returns:
+        超时后仍未完成的任务数（使用SQLite任务存储时在下次启动时继续）
+    """
+    partial_janitor.stop()
+    info_resolver.shutdown()
+    if ROLE == 'web':
+        return 0
+    # 等待期间继续发送心跳，下载和处理完成后再停止
+    started = time.monotonic()
+    remaining = scheduler.drain(timeout)
+    remaining += postprocessor.drain(None if timeout is None else max(0, timeout - (time.monotonic() - started)))
+    ydl_pool.close()
+    lease_keeper.stop()
+    lease_reaper.stop()
+    return remaining
+
+
+_task_id_lock = threading.Lock()
+_last_task_id = None
+
+
+def new_task_id():
+    """生成任务ID（同一时刻生成多个时追加序号，避免重复）"""
+    global _last_task_id
+    with _task_id_lock:
+        task_id = f"task_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        if _last_task_id and _last_task_id.startswith(task_id):
+            suffix = int(_last_task_id[len(task_id) + 1:] or 0) + 1
+            task_id = f"{task_id}_{suffix}"
+        _last_task_id = task_id
+        return task_id
+
+
+def create_download_task(url, quality='best', download_dir=None, priority=0, options=None, batch_id=None):
+    """
+    创建下载任务并放入下载队列
+    相同视频、格式和目录的下载正在进行时合并到该下载；已经下载过且文件还在时直接完成
+    （options 中 force 为 True 时重新下载）
+
+    Returns:
+        任务ID；队列已满时抛出 QueueFullError
+    """
+    task_id = new_task_id()
+    options = options or {}
+    policy = policy_key(quality, options.get('codec'), options.get('stream', False))
+    if options.get('transcode'):
+        policy += '-transcode'
+    key = download_key(url, policy, download_dir or DOWNLOAD_DIR)
+    task = {
+        'task_id': task_id,
+        'url': url,
+        'quality': quality,
+        'download_dir': download_dir if download_dir else str(DOWNLOAD_DIR),
+        'priority': priority,
+        'options': options,
+        'batch_id': batch_id,
+        'dedup_key': key,
+        'status': 'queued',
+        'progress': 0,
+        'filename': None,
+        'filepath': None,
+        'error': None
+    }
+    if download_dir:
+        file_catalog.add_directory(download_dir)
+    
+    existing = None if options.get('force') else deduplicator.find_completed(key)
+    if existing is not None:
+        # 已经下载过，直接指向已有文件
+        task.update(status='completed', progress=100, filename=existing['filename'],
+                    filepath=existing['filepath'], sha256=existing.get('sha256'),
+                    thumbnail=existing.get('thumbnail'), reused=True)
+        task_store.create(task)
+        DOWNLOAD_REQUESTS.inc(result='reused')
+        return task_id
+    
+    # 新建任务记录并放入下载队列，由工作线程执行（相同的下载正在进行时合并）
+    try:
+        primary = deduplicator.submit(
+            task, lambda: enqueue_task(task_id, url, quality, download_dir or None, options, priority)
+        )
+    except QueueFullError:
+        task_store.delete(task_id)
+        raise
+    DOWNLOAD_REQUESTS.inc(result='new' if primary == task_id else 'joined')
+    return task_id
+
+
+def parse_download_params(data):
+    """
+    解析 /api/download 和 /api/batch 共用的下载参数
+
+    Returns:
+        (参数字典, None) 或 (None, 错误信息)
+    """
+    quality = data.get('quality') or 'best'
+    download_dir = (data.get('download_dir') or '').strip()
+    try:
+        parse_quality(quality)
+    except ValueError as e:
+        return None, str(e)
+    
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return None, 'priority必须是整数'
+    
+    options = {}
+    if data.get('concurrent_fragments') is not None:
+        try:
+            fragments = int(data['concurrent_fragments'])
+        except (TypeError, ValueError):
+            return None, 'concurrent_fragments必须是整数'
+        if not 1 <= fragments <= MAX_CONCURRENT_FRAGMENTS:
+            return None, f'concurrent_fragments必须在1到{MAX_CONCURRENT_FRAGMENTS}之间'
+        options['concurrent_fragments'] = fragments
+    if data.get('codec'):
+        if data['codec'] not in CODECS:
+            return None, f"不支持的编码: {data['codec']}，可选: {', '.join(CODECS)}"
+        options['codec'] = data['codec']
+    if data.get('rate_limit'):
+        try:
+            options['rate_limit'] = parse_rate(data['rate_limit'])
+        except ValueError as e:
+            return None, f'rate_limit无效: {e}'
+    if data.get('stream'):
+        options['stream'] = True
+    if data.get('force'):
+        options['force'] = True
+    if data.get('transcode'):
+        options['transcode'] = True
+    
+    # 验证下载目录
+    if download_dir:
+        try:
+            download_path = Path(download_dir)
+            # 检查是否为有效路径
+            if not download_path.is_absolute() and not download_path.exists():
+                # 相对路径，检查父目录是否存在
+                parent = download_path.parent
+                if parent and not parent.exists():
+                    return None, f'下载目录无效: {download_dir}'
+        except Exception as e:
+            return None, f'下载目录错误: {str(e)}'
+    
+    return {
+        'quality': quality,
+        'download_dir': download_dir or None,
+        'priority': priority,
+        'options': options,
+    }, None
+
+
+# 批量下载：后台逐条展开播放列表，子任务进入同一个下载队列
+batch_manager = BatchManager(
+    task_store,
+    lambda url, batch_id, **params: create_download_task(url, batch_id=batch_id, **params)
+)
+
+
+def serialize_task(task):
+    """任务状态的对外字段（/api/status 和 /api/events 共用）"""
+    task_id = task['task_id']
+    primary_task_id = task.get('primary_task_id')
+    if primary_task_id and task['status'] not in FINISHED_STATUSES:
+        # 合并到其他任务的下载，显示主任务的进度
+        task = task_store.get(primary_task_id) or task
+    downloading = task['status'] == 'downloading'
+    if downloading:
+        # 本进程中正在下载的任务使用内存中的最新进度
+        task = dict(task, **(progress_tracker.snapshot(task['task_id']) or {}))
+    return {
+        'task_id': task_id,
+        'status': task['status'],
+        'progress': task.get('progress', 0),
+        'phase': task.get('phase') if downloading else None,
+        'downloaded_bytes': task.get('downloaded_bytes') if downloading else None,
+        'filename': task.get('filename'),
+        'error': task.get('error'),
+        'warnings': task.get('warnings'),
+        'sha256': task.get('sha256'),
+        'thumbnail': f'/api/thumbnail/{task_id}' if task.get('thumbnail') else None,
+        'speed': task.get('speed', 0),
+        'eta': task.get('eta', 0),
+        'queue_position': queue_position(task['task_id']) if task['status'] == 'queued' else None,
+        'primary_task_id': primary_task_id,
+        'node': task.get('worker'),
+        'reassigned': task.get('reassigned', 0),
+        'reused': task.get('reused', False),
+        'retries': task.get('attempts', 0),
+        'retry_at': task.get('retry_at'),
+        'rate_limit': (task.get('options') or {}).get('rate_limit'),
+        'rate_allocated': bandwidth.allocation(task['task_id']) if downloading else None
+    }
+
+
+# 进度推送：任务变化时唤醒SSE连接，按最小间隔合并推送
+event_broker = TaskEventBroker(
+    task_store,
+    serialize_task,
+    min_interval=float(os.environ.get('YTD_EVENT_INTERVAL', '0.5')),
+    # web进程收不到下载进程中的变化通知，缩短重新读取任务存储的间隔
+    poll_interval=1 if ROLE == 'web' else 5,
+)
 
 
 @app.route('/')
@@ -164,239 +920,524 @@ def get_info():
     return jsonify(info)
 
 
+@app.route('/api/info/batch', methods=['POST'])
+def get_info_batch():
+    """
+    批量获取视频信息
+    Body: {"urls": [...], "timeout": 单个链接的解析超时（秒，可选）}
+    返回NDJSON（application/x-ndjson）：每解析完一个链接输出一行 {"index", "url", ...与 /api/info 相同的字段}，
+    按完成顺序而不是请求顺序；最后一行为 {"done": true, "total", "succeeded", "failed"}
+    """
+    data = request.json or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list):
+        return jsonify({'success': False, 'error': 'urls必须是链接列表'})
+    urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+    if not urls:
+        return jsonify({'success': False, 'error': 'URL不能为空'})
+    if len(urls) > INFO_BATCH_MAX_URLS:
+        return jsonify({'success': False, 'error': f'一次最多 {INFO_BATCH_MAX_URLS} 个链接'})
+    
+    timeout = INFO_TIMEOUT
+    if data.get('timeout') is not None:
+        try:
+            timeout = float(data['timeout'])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'timeout必须是数字'})
+        if not 0 < timeout <= INFO_TIMEOUT:
+            return jsonify({'success': False, 'error': f'timeout必须在0到{INFO_TIMEOUT:g}秒之间'})
+    
+    def generate():
+        succeeded = 0
+        for index, url, info in info_resolver.iter_results(urls, timeout=timeout):
+            if info.get('success'):
+                succeeded += 1
+            elif info.get('timeout'):
+                # 超时的链接在后台解析完成时由 get_video_info 记录耗时，这里只计数
+                INFO_BATCH_TIMEOUTS.inc()
+            yield json.dumps(dict(info, index=index, url=url), ensure_ascii=False) + '\n'
+        yield json.dumps({'done': True, 'total': len(urls), 'succeeded': succeeded,
+                          'failed': len(urls) - succeeded}) + '\n'
+    
+    # 每解析完一个链接立即发送（禁止nginx缓冲）
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
 @app.route('/api/download', methods=['POST'])
 def start_download():
     """开始下载视频"""
     data = request.json
     url = data.get('url', '')
-    quality = data.get('quality', 'best')
-    download_dir = data.get('download_dir', '').strip()
     
     if not url:
         return jsonify({'success': False, 'error': 'URL不能为空'})
     
-    # 验证下载目录
-    if download_dir:
-        try:
-            download_path = Path(download_dir)
-            # 检查是否为有效路径
-            if not download_path.is_absolute() and not download_path.exists():
-                # 相对路径，检查父目录是否存在
-                parent = download_path.parent
-                if parent and not parent.exists():
-                    return jsonify({'success': False, 'error': f'下载目录无效: {download_dir}'})
-        except Exception as e:
-            return jsonify({'success': False, 'error': f'下载目录错误: {str(e)}'})
+    params, error = parse_download_params(data)
+    if error:
+        return jsonify({'success': False, 'error': error})
     
-    # 生成任务ID
-    task_id = f"task_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    try:
+        task_id = create_download_task(url, **params)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
     
-    # 初始化任务状态
-    download_tasks[task_id] = {
+    task = task_store.get(task_id)
+    return jsonify({
+        'success': True,
         'task_id': task_id,
-        'url': url,
-        'quality': quality,
-        'download_dir': download_dir if download_dir else str(DOWNLOAD_DIR),
-        'status': 'pending',
-        'progress': 0,
-        'filename': None,
-        'filepath': None,
-        'error': None
-    }
+        'queue_position': queue_position(task.get('primary_task_id') or task_id),
+        'primary_task_id': task.get('primary_task_id'),
+        'reused': task.get('reused', False)
+    })
+
+
+@app.route('/api/batch', methods=['POST'])
+def start_batch():
+    """
+    批量下载
+    Body: {"urls": [...]} 或 {"url": 播放列表/频道链接}，其余参数与 /api/download 相同，
+          max_items 限制最多下载的视频数
+    """
+    data = request.json
+    urls = data.get('urls') or ([data['url']] if data.get('url') else [])
+    urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+    
+    if not urls:
+        return jsonify({'success': False, 'error': 'URL不能为空'})
     
-    # 在后台线程中开始下载
-    thread = threading.Thread(target=download_video_task, args=(task_id, url, quality, download_dir if download_dir else None))
-    thread.daemon = True
-    thread.start()
+    params, error = parse_download_params(data)
+    if error:
+        return jsonify({'success': False, 'error': error})
     
+    try:
+        max_items = min(int(data.get('max_items', BATCH_MAX_ITEMS)), BATCH_MAX_ITEMS)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'max_items必须是整数'})
+    
+    batch_id = batch_manager.create(urls, max_items=max_items, **params)
     return jsonify({
         'success': True,
-        'task_id': task_id
+        'batch_id': batch_id
+    })
+
+
+@app.route('/api/batch/<batch_id>')
+def get_batch(batch_id):
+    """获取批量下载的汇总进度"""
+    summary = batch_manager.summary(batch_id)
+    if summary is None:
+        return jsonify({'success': False, 'error': '批次不存在'}), 404
+    
+    return jsonify({
+        'success': True,
+        'batch': summary
     })
 
 
 @app.route('/api/status/<task_id>')
 def get_status(task_id):
     """获取下载状态"""
-    if task_id not in download_tasks:
+    task = task_store.get(task_id)
+    if task is None:
         return jsonify({'success': False, 'error': '任务不存在'})
     
-    task = download_tasks[task_id]
     return jsonify({
         'success': True,
-        'task': {
-            'task_id': task['task_id'],
-            'status': task['status'],
-            'progress': task.get('progress', 0),
-            'filename': task.get('filename'),
-            'error': task.get('error'),
-            'speed': task.get('speed', 0),
-            'eta': task.get('eta', 0)
+        'task': serialize_task(task)
+    })
+
+
+@app.route('/api/events')
+def task_events():
+    """
+    推送下载进度（Server-Sent Events）
+    参数 tasks=<task_id>,<task_id>... 指定要跟踪的任务，不指定时跟踪所有进行中的任务
+    """
+    task_ids = [t for t in request.args.get('tasks', '').split(',') if t.strip()]
+    if len(task_ids) > 100:
+        return jsonify({'success': False, 'error': '一次最多跟踪100个任务'}), 400
+    
+    return Response(
+        stream_with_context(event_broker.stream([t.strip() for t in task_ids])),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         }
+    )
+
+
+def is_streaming(task_id):
+    """任务的文件是否正在通过 /api/stream 传输（网页进程和下载进程分开时也通过任务存储判断）"""
+    task = task_store.get(task_id)
+    return bool(task and time.time() - (task.get('streamed_at') or 0) < STREAM_BUSY_SECONDS)
+
+
+def mark_streaming(task_id, chunks):
+    """传输期间定期在任务中记录 streamed_at"""
+    marked = 0
+    for chunk in chunks:
+        now = time.time()
+        if now - marked >= STREAM_MARK_INTERVAL:
+            task_store.update(task_id, streamed_at=now)
+            marked = now
+        yield chunk
+
+
+def locate_stream_file(task_id):
+    """正在下载的文件位置和任务状态（/api/stream 使用）"""
+    task = task_store.get(task_id)
+    if task is None:
+        return None, 'error'
+    if task['status'] == 'completed':
+        return task.get('filepath'), 'completed'
+    partial = task.get('partial')
+    if partial and partial.endswith('.part') and not os.path.exists(partial):
+        # 下载完成后 .part 已重命名，任务状态还没更新
+        partial = partial[:-len('.part')]
+    return partial, 'error' if task['status'] == 'error' else 'downloading'
+
+
+@app.route('/api/stream/<task_id>')
+def stream_task(task_id):
+    """
+    边下载边传输任务的文件（任务需要以 stream=true 创建，只下载单一文件格式）
+    下载完成后等同于下载文件；文件大小已知时支持Range请求
+    """
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    if task.get('primary_task_id') and task['status'] not in FINISHED_STATUSES:
+        task_id = task['primary_task_id']
+    
+    # 等待第一批数据写入
+    deadline = time.monotonic() + STREAM_START_TIMEOUT
+    while True:
+        task = task_store.get(task_id) or task
+        if task['status'] == 'completed':
+            if not task.get('filepath') or not os.path.isfile(task['filepath']):
+                return jsonify({'success': False, 'error': '文件不存在'}), 404
+            return file_delivery.send(task['filepath'])
+        if task['status'] == 'error':
+            return jsonify({'success': False, 'error': task.get('error') or '下载失败'}), 409
+        if not (task.get('options') or {}).get('stream'):
+            return jsonify({'success': False, 'error': '任务未完成；边下载边传输需要以 stream=true 创建任务'}), 409
+        path, _ = locate_stream_file(task_id)
+        if available_bytes(path):
+            break
+        if time.monotonic() > deadline:
+            return jsonify({'success': False, 'error': '等待下载开始超时'}), 504
+        event_broker.wait_for_change(1.0)
+    
+    name = path[:-len('.part')] if path.endswith('.part') else path
+    total = task.get('total_bytes')
+    headers = {
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'Accept-Ranges': 'bytes' if total else 'none'
+    }
+    start, end, status = 0, None, 200
+    if total:
+        byte_range = request.range
+        end = total - 1
+        if byte_range is not None and byte_range.units == 'bytes':
+            bounds = byte_range.range_for_length(total)
+            if bounds is None:
+                return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+            start, end, status = bounds[0], bounds[1] - 1, 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+        headers['Content-Length'] = str(end - start + 1)
+    
+    return Response(
+        stream_with_context(mark_streaming(task_id, iter_growing_file(
+            lambda: locate_stream_file(task_id), start, end, wait=event_broker.wait_for_change
+        ))),
+        status=status,
+        mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        headers=headers
+    )
+
+
+@app.route('/api/thumbnail/<task_id>')
+def get_thumbnail(task_id):
+    """任务文件的缩略图（处理流水线的thumbnail阶段生成）"""
+    task = task_store.get(task_id)
+    path = task.get('thumbnail') if task else None
+    if not path or not os.path.isfile(path):
+        return jsonify({'success': False, 'error': '缩略图不存在'}), 404
+    return file_delivery.send(path)
+
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """获取元数据缓存命中统计"""
+    return jsonify({
+        'success': True,
+        'metadata': metadata_cache.stats(),
+        'storage': content_store.stats() if content_store is not None else None,
+        'ydl_pool': ydl_pool.stats()
     })
 
 
+@app.route('/api/queue')
+def get_queue():
+    """获取下载队列状态"""
+    return jsonify({
+        'success': True,
+        'queue': queue_stats(),
+        'dedup': deduplicator.stats(),
+        'bandwidth': bandwidth.stats()
+    })
+
+
+@app.route('/api/worker/store/<method>', methods=['POST'])
+def worker_store(method):
+    """
+    其他主机上的下载节点访问任务存储（HTTPTaskStore）
+    需要 Authorization: Bearer <YTD_WORKER_TOKEN>；只在网页节点（YTD_ROLE=web）上可用
+    Body: {"args": [...], "kwargs": {...}}
+    """
+    if ROLE != 'web' or not WORKER_TOKEN:
+        return jsonify({'success': False, 'error': '没有启用远程下载节点（需要 YTD_ROLE=web 和 YTD_WORKER_TOKEN）'}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {WORKER_TOKEN}'):
+        return jsonify({'success': False, 'error': '令牌无效'}), 403
+    if method not in REMOTE_METHODS:
+        return jsonify({'success': False, 'error': f'不支持的方法: {method}'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        result = getattr(task_store, method)(*data.get('args', []), **data.get('kwargs', {}))
+    except TypeError as e:
+        return jsonify({'success': False, 'error': f'参数错误: {e}'}), 400
+    return jsonify({'success': True, 'result': result})
+
+
+@app.route('/metrics')
+def get_metrics():
+    """运行指标（Prometheus文本格式）"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 @app.route('/api/downloads')
+@FILE_LISTING_SECONDS.time()
 def list_downloads():
-    """列出所有已下载的文件"""
+    """
+    列出已下载的文件
+    参数: dir 目录, q 文件名关键字, ext 扩展名, sort mtime/size/name, order desc/asc,
+          offset/limit 分页, refresh=1 强制重新扫描目录
+    """
     # 获取查询参数中的目录（可选）
     download_dir = request.args.get('dir', '').strip()
+    sort = request.args.get('sort', 'mtime')
+    if sort not in SORT_KEYS:
+        return jsonify({'success': False, 'error': f'不支持的排序字段: {sort}'}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = request.args.get('limit')
+        limit = max(0, int(limit)) if limit else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'offset/limit必须是整数'}), 400
     
-    # 确定要扫描的目录列表
-    dirs_to_scan = []
+    directories = None
     if download_dir:
-        try:
-            dirs_to_scan.append(Path(download_dir))
-        except:
-            pass
+        # 只是浏览的目录作为临时目录登记（用于按id下载、删除），不会一直保留在索引中
+        key = file_catalog.add_directory(download_dir, temporary=True)
+        directories = [key] if key else []
+        file_catalog.refresh(directories, force=request.args.get('refresh') == '1')
     else:
-        # 默认目录 + 所有任务中使用的目录
-        dirs_to_scan.append(DOWNLOAD_DIR)
-        for task in download_tasks.values():
-            if task.get('download_dir'):
-                try:
-                    task_dir = Path(task['download_dir'])
-                    if task_dir.exists() and task_dir not in dirs_to_scan:
-                        dirs_to_scan.append(task_dir)
-                except:
-                    pass
-    
-    files = []
-    scanned_dirs = set()
-    
-    for scan_dir in dirs_to_scan:
-        if not scan_dir.exists():
-            continue
-        
-        # 避免重复扫描
-        scan_dir_str = str(scan_dir.resolve())
-        if scan_dir_str in scanned_dirs:
-            continue
-        scanned_dirs.add(scan_dir_str)
-        
-        for file_path in scan_dir.glob('*'):
-            if file_path.is_file() and file_path.suffix in ['.mp4', '.webm', '.mkv']:
-                stat = file_path.stat()
-                files.append({
-                    'name': file_path.name,
-                    'path': str(file_path),
-                    'dir': str(scan_dir),
-                    'size': stat.st_size,
-                    'size_mb': round(stat.st_size / (1024 * 1024), 2),
-                    'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-    
-    # 按修改时间排序（最新的在前）
-    files.sort(key=lambda x: x['modified'], reverse=True)
+        file_catalog.refresh(force=request.args.get('refresh') == '1')
     
-    return jsonify({
+    # 目录内容没有变化时直接返回304
+    etag = file_catalog.etag(request.query_string)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    files, total = file_catalog.query(
+        directories,
+        search=request.args.get('q', '').strip() or None,
+        ext=request.args.get('ext', '').strip() or None,
+        sort=sort,
+        reverse=request.args.get('order', 'desc') != 'asc',
+        offset=offset,
+        limit=limit
+    )
+    
+    response = jsonify({
         'success': True,
-        'files': files
+        'files': files,
+        'total': total,
+        'offset': offset,
+        'limit': limit
     })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
-@app.route('/api/download/<filename>')
-def download_file(filename):
-    """下载文件"""
-    # 获取查询参数中的目录（可选）
+def resolve_file(filename):
+    """
+    根据请求参数确定文件路径（/api/download 和 /api/delete 共用）
+    优先使用 id（文件ID），其次 dir（目录），否则按文件名在索引中查找
+
+    Returns:
+        (文件路径, None) 或 (None, 错误响应)
+    """
+    file_id = request.args.get('id', '').strip()
     download_dir = request.args.get('dir', '').strip()
     
-    # 确定文件路径
-    if download_dir:
-        try:
-            file_path = Path(download_dir) / filename
-        except:
-            file_path = DOWNLOAD_DIR / filename
+    if file_id:
+        entry = file_catalog.get(file_id)
+        if entry is None or entry['name'] != filename:
+            return None, (jsonify({'success': False, 'error': '文件不存在'}), 404)
+        file_path = Path(entry['path'])
+    elif download_dir:
+        file_path = Path(download_dir) / filename
     else:
-        # 尝试在默认目录和所有任务目录中查找
-        file_path = None
-        search_dirs = [DOWNLOAD_DIR]
-        
-        # 添加所有任务中使用的目录
-        for task in download_tasks.values():
-            if task.get('download_dir'):
-                try:
-                    task_dir = Path(task['download_dir'])
-                    if task_dir.exists() and task_dir not in search_dirs:
-                        search_dirs.append(task_dir)
-                except:
-                    pass
-        
-        # 在所有目录中搜索文件
-        for search_dir in search_dirs:
-            test_path = search_dir / filename
-            if test_path.exists():
-                file_path = test_path
-                break
-        
-        if not file_path:
-            file_path = DOWNLOAD_DIR / filename
+        # 按文件名查找；不同目录中有同名文件时优先默认目录，否则要求指定id或dir
+        file_catalog.refresh()
+        entries = file_catalog.find_by_name(filename)
+        if len(entries) > 1:
+            default_entry = file_catalog.lookup(DOWNLOAD_DIR, filename)
+            if default_entry is not None:
+                entries = [default_entry]
+        if len(entries) > 1:
+            return None, (jsonify({
+                'success': False,
+                'error': '多个目录中存在同名文件，请指定id或dir参数',
+                'candidates': [{'id': e['id'], 'dir': e['dir']} for e in entries]
+            }), 409)
+        file_path = Path(entries[0]['path']) if entries else DOWNLOAD_DIR / filename
     
-    if not file_path.exists():
-        return jsonify({'success': False, 'error': '文件不存在'}), 404
+    if not file_path.is_file():
+        file_catalog.remove_file(file_path)
+        return None, (jsonify({'success': False, 'error': '文件不存在'}), 404)
+    return file_path, None
+
+
+@app.route('/api/download/<filename>')
+def download_file(filename):
+    """下载文件"""
+    file_path, error = resolve_file(filename)
+    if error:
+        return error
     
-    return send_file(
-        file_path,
-        as_attachment=True,
-        download_name=filename
-    )
+    byte_range = request.range
+    if content_store is not None and not (byte_range and byte_range.ranges and byte_range.ranges[0][0]):
+        # 访问记录用于超出磁盘配额时的淘汰（同一次下载的后续Range请求不重复计数）
+        content_store.record_access(file_path)
+    # 支持Range（断点续传）和条件请求；按配置交给nginx/Apache发送
+    return file_delivery.send(file_path, download_name=filename, as_attachment=True)
 
 
 @app.route('/api/delete/<filename>', methods=['DELETE'])
 def delete_file(filename):
     """删除文件"""
-    # 获取查询参数中的目录（可选）
-    download_dir = request.args.get('dir', '').strip()
-    
-    # 确定文件路径
-    if download_dir:
-        try:
-            file_path = Path(download_dir) / filename
-        except:
-            file_path = DOWNLOAD_DIR / filename
-    else:
-        # 尝试在默认目录和所有任务目录中查找
-        file_path = None
-        search_dirs = [DOWNLOAD_DIR]
-        
-        # 添加所有任务中使用的目录
-        for task in download_tasks.values():
-            if task.get('download_dir'):
-                try:
-                    task_dir = Path(task['download_dir'])
-                    if task_dir.exists() and task_dir not in search_dirs:
-                        search_dirs.append(task_dir)
-                except:
-                    pass
-        
-        # 在所有目录中搜索文件
-        for search_dir in search_dirs:
-            test_path = search_dir / filename
-            if test_path.exists():
-                file_path = test_path
-                break
-        
-        if not file_path:
-            file_path = DOWNLOAD_DIR / filename
-    
-    if not file_path.exists():
-        return jsonify({'success': False, 'error': '文件不存在'}), 404
+    file_path, error = resolve_file(filename)
+    if error:
+        return error
     
     try:
         file_path.unlink()
+        thumbnail_path(file_path).unlink(missing_ok=True)
+        file_catalog.remove_file(file_path)
+        if content_store is not None:
+            content_store.forget(file_path)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def run_production(args):
+    """生产模式（--serve）：waitress单进程，或gunicorn多个网页进程 + 独立的下载进程"""
+    try:
+        server = pick_server(args.server, args.workers)
+    except RuntimeError as e:
+        raise SystemExit(f"[错误] {e}")
+    print(f"服务器: {server}，网页进程: {args.workers}，每个进程 {args.threads} 个线程")
+    
+    if server == 'gunicorn':
+        if not TASK_DB:
+            raise SystemExit("[错误] gunicorn模式下网页进程和下载进程通过任务存储交换任务，请设置 YTD_TASK_DB")
+        # 网页进程导入app时读取 YTD_ROLE；下载在独立的进程中执行
+        os.environ['YTD_ROLE'] = 'web'
+        batch_manager.recover()
+        worker = spawn_download_worker(os.path.abspath(__file__), dict(os.environ, YTD_ROLE='worker'))
+        try:
+            run_gunicorn('app', args.host, args.port, args.workers, args.threads, DRAIN_TIMEOUT)
+        finally:
+            print("正在等待下载进程完成进行中的下载...")
+            stop_process(worker, DRAIN_TIMEOUT + 10)
+        return
+    
+    recovered = start_background_tasks()
+    if recovered:
+        print(f"已恢复 {recovered} 个未完成的下载任务")
+    run_waitress(app, args.host, args.port, args.threads)
+    finish_downloads()
+
+
+def run_worker():
+    """
+    只执行下载（--worker）：从共享的任务存储中领取任务，收到 SIGTERM/SIGINT 后完成进行中的下载再退出
+    同一主机上使用 YTD_TASK_DB，其他主机上使用 YTD_QUEUE_URL（网页节点地址）
+    """
+    global ROLE
+    if not TASK_DB and not QUEUE_URL:
+        raise SystemExit("[错误] 下载进程需要设置 YTD_TASK_DB（与网页进程共用的SQLite任务存储）"
+                         "或 YTD_QUEUE_URL（其他主机上的网页节点）")
+    ROLE = 'worker'
+    deduplicator.shared = True
+    recovered = start_background_tasks()
+    print(f"下载节点 {NODE_ID} 已启动（{MAX_WORKERS} 个下载线程，任务来源 {QUEUE_URL or TASK_DB}），"
+          f"恢复 {recovered} 个未完成的任务")
+    metrics_port = int(os.environ.get('YTD_WORKER_METRICS_PORT', '0'))
+    if metrics_port:
+        # 下载相关的计数只在下载进程中，单独提供 /metrics
+        start_metrics_server(metrics, os.environ.get('YTD_HOST', '127.0.0.1'), metrics_port)
+        print(f"下载进程的运行指标: http://{os.environ.get('YTD_HOST', '127.0.0.1')}:{metrics_port}/metrics")
+    wait_for_signal()
+    finish_downloads()
+
+
+def finish_downloads():
+    """停止服务前等待下载完成"""
+    print(f"正在停止，等待进行中的下载完成（最多 {DRAIN_TIMEOUT:g} 秒）...")
+    remaining = drain_downloads()
+    if remaining and TASK_DB:
+        print(f"还有 {remaining} 个任务未完成，下次启动时继续")
+    elif remaining:
+        print(f"[警告] 还有 {remaining} 个任务未完成（未设置 YTD_TASK_DB，重启后不会恢复）")
+
+
 if __name__ == '__main__':
+    args = _main_args
+    
+    if args.worker:
+        run_worker()
+        sys.exit(0)
+    
     print("=" * 60)
-    print("YouTube视频下载Web应用 - 本地版本")
+    print("YouTube视频下载Web应用 - " + ("生产模式" if args.serve else "本地版本"))
     print("=" * 60)
-    print(f"访问地址: http://localhost:5000")
+    print(f"访问地址: http://{'localhost' if args.host in ('127.0.0.1', '0.0.0.0') else args.host}:{args.port}")
     print(f"下载目录: {DOWNLOAD_DIR.absolute()}")
     print("=" * 60)
     print("提示: 按 Ctrl+C 停止服务器")
     print("=" * 60)
-    app.run(debug=True, host='127.0.0.1', port=5000)
-
+    if args.serve:
+        run_production(args)
+        sys.exit(0)
+    # 调试模式下重载器的父进程不处理请求，只在实际服务的子进程中恢复任务
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        recovered = start_background_tasks()
+        if recovered:
+            print(f"已恢复 {recovered} 个未完成的下载任务")
+    app.run(debug=True, host=args.host, port=args.port)
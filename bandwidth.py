@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载带宽分配
+全局带宽按权重（优先级）公平分配给正在下载的任务，任务自身的限速低于分到的份额时，
+多余的部分分给其他任务（water-filling）。任务开始或结束时重新分配。
+限速在进度回调中执行（令牌桶）：yt-dlp每下载一块数据调用一次进度回调，
+超出分配速率时在下载线程中等待，分片并发下载的各线程共用同一个令牌桶。
+"""
+
+import threading
+import time
+
+# 令牌桶容量：最多允许积攒多少秒的流量（突发）
+BURST_SECONDS = 1.0
+
+
+def parse_rate(value):
+    """
+    解析速率，支持数字（字节/秒）或 '500K'、'2M'、'1.5MiB' 这样的写法
+
+    Returns:
+        字节/秒（int），None或空字符串返回None；无法解析时抛出 ValueError
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        rate = float(value)
+    else:
+        text = str(value).strip().upper().rstrip('/S').rstrip('B').rstrip('I')
+        units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+        multiplier = units.get(text[-1:], 1)
+        if text[-1:] in units:
+            text = text[:-1]
+        try:
+            rate = float(text) * multiplier
+        except ValueError:
+            raise ValueError(f'无法解析的速率: {value}')
+    if rate <= 0:
+        raise ValueError(f'速率必须大于0: {value}')
+    return int(rate)
+
+
+def fair_share(total, tasks):
+    """
+    按权重分配带宽（water-filling）
+
+    Args:
+        total: 总带宽（字节/秒），None表示不限制
+        tasks: {task_id: (权重, 任务限速或None)}
+
+    Returns:
+        {task_id: 分配的速率}，None表示不限速
+    """
+    if total is None:
+        return {task_id: limit for task_id, (_, limit) in tasks.items()}
+
+    allocation = {}
+    remaining = float(total)
+    pending = dict(tasks)
+    while pending:
+        weight_sum = sum(weight for weight, _ in pending.values())
+        per_weight = remaining / weight_sum
+        capped = [task_id for task_id, (weight, limit) in pending.items()
+                  if limit is not None and limit <= per_weight * weight]
+        if not capped:
+            for task_id, (weight, _) in pending.items():
+                allocation[task_id] = per_weight * weight
+            break
+        # 限速低于份额的任务只分配限速，剩余的带宽给其他任务
+        for task_id in capped:
+            limit = pending.pop(task_id)[1]
+            allocation[task_id] = limit
+            remaining -= limit
+    return allocation
+
+
+class _Bucket:
+    __slots__ = ('weight', 'limit', 'rate', 'tokens', 'updated', 'file', 'downloaded')
+
+    def __init__(self, weight, limit):
+        self.weight = weight
+        self.limit = limit
+        self.rate = None
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.file = None
+        self.downloaded = 0
+
+
+class BandwidthManager:
+    """
+    带宽管理
+
+    Args:
+        total_rate: 全局带宽上限（字节/秒），None表示不限制
+    """
+
+    def __init__(self, total_rate=None):
+        self.total_rate = total_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def register(self, task_id, limit=None, priority=0):
+        """任务开始下载；priority越高分到的带宽越多（权重 = max(1, priority + 1)）"""
+        with self._lock:
+            self._buckets[task_id] = _Bucket(max(1, priority + 1), limit)
+            self._rebalance()
+
+    def unregister(self, task_id):
+        """任务结束，带宽重新分配给其他任务"""
+        with self._lock:
+            if self._buckets.pop(task_id, None) is not None:
+                self._rebalance()
+
+    def set_total_rate(self, total_rate):
+        """修改全局带宽上限"""
+        with self._lock:
+            self.total_rate = total_rate
+            self._rebalance()
+
+    def allocation(self, task_id):
+        """任务当前分配到的速率（字节/秒），不限速或没有在下载时返回None"""
+        with self._lock:
+            bucket = self._buckets.get(task_id)
+            return int(bucket.rate) if bucket is not None and bucket.rate is not None else None
+
+    def throttle(self, task_id, progress):
+        """
+        在进度回调中调用：根据新下载的字节数，超出分配速率时等待
+
+        Args:
+            progress: yt-dlp进度回调的参数（使用 downloaded_bytes 和 tmpfilename）
+
+        Returns:
+            距上次调用新下载的字节数（用于统计）
+        """
+        downloaded = progress.get('downloaded_bytes')
+        if downloaded is None:
+            return 0
+        filename = progress.get('tmpfilename') or progress.get('filename')
+        with self._lock:
+            bucket = self._buckets.get(task_id)
+            if bucket is None:
+                return 0
+            if bucket.file != filename or downloaded < bucket.downloaded:
+                # 新文件（例如先视频后音频）或续传：从当前位置开始计数，不计入已有的部分
+                bucket.file = filename
+                bucket.downloaded = downloaded
+                return 0
+            delta = downloaded - bucket.downloaded
+            bucket.downloaded = downloaded
+            rate = bucket.rate
+            if rate is None or delta <= 0:
+                return delta
+            now = time.monotonic()
+            bucket.tokens = min(rate * BURST_SECONDS, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            bucket.tokens -= delta
+            wait = -bucket.tokens / rate if bucket.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return delta
+
+    def stats(self):
+        """全局上限和各任务分配到的速率"""
+        with self._lock:
+            return {
+                'total_rate': self.total_rate,
+                'active': len(self._buckets),
+                'allocations': {
+                    task_id: int(bucket.rate) if bucket.rate is not None else None
+                    for task_id, bucket in self._buckets.items()
+                },
+            }
+
+    def _rebalance(self):
+        allocation = fair_share(
+            self.total_rate,
+            {task_id: (bucket.weight, bucket.limit) for task_id, bucket in self._buckets.items()}
+        )
+        for task_id, bucket in self._buckets.items():
+            bucket.rate = allocation.get(task_id)
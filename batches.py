@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量/播放列表下载
+后台线程逐条展开链接（播放列表按需分页获取），每个视频作为普通下载任务提交到下载队列，
+批次记录保存在任务存储中（kind='batch'，不计入下载任务的统计），查询时汇总各子任务的进度。
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from scheduler import QueueFullError, SchedulerStoppedError
+from playlist import iter_playlist_entries
+from task_store import FINISHED_STATUSES
+
+# 子任务列表累积多少条后写回任务存储
+FLUSH_EVERY = 25
+
+
+class BatchManager:
+    """
+    批量下载管理
+
+    Args:
+        store: 任务存储（批次记录和子任务共用）
+        submit_item: 提交单个视频的函数 submit_item(url, batch_id, **params) -> task_id，
+                     队列已满时抛出 QueueFullError
+        expand: 展开链接的函数，默认 iter_playlist_entries
+        retry_interval: 队列已满时等待多久后重试提交（秒）
+    """
+
+    def __init__(self, store, submit_item, expand=iter_playlist_entries, retry_interval=1.0):
+        self.store = store
+        self.submit_item = submit_item
+        self.expand = expand
+        self.retry_interval = retry_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def create(self, urls, max_items=None, **params):
+        """
+        创建批次并在后台开始展开
+
+        Args:
+            urls: 链接列表（视频、播放列表或频道）
+            max_items: 整个批次最多下载的视频数
+            **params: 传给 submit_item 的下载参数（quality、download_dir 等）
+
+        Returns:
+            批次ID
+        """
+        batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        self.store.create({
+            'task_id': batch_id,
+            'kind': 'batch',
+            'url': None,
+            'urls': list(urls),
+            'status': 'expanding',
+            'max_items': max_items,
+            'children': [],
+            'expand_errors': [],
+            'params': params,
+        })
+        with self._lock:
+            self._pending[batch_id] = []
+        thread = threading.Thread(target=self._expand, args=(batch_id, list(urls), max_items, params),
+                                  name=f"batch-expand-{batch_id}")
+        thread.daemon = True
+        thread.start()
+        return batch_id
+
+    def recover(self):
+        """
+        处理上次运行时展开到一半的批次（启动时调用）：展开线程已随进程退出，
+        已提交的视频照常下载，批次不再停留在 expanding；一个视频都没有提交的批次标记为失败
+
+        Returns:
+            处理的批次数
+        """
+        batches = self.store.find_by_status('expanding', kind='batch')
+        for batch in batches:
+            errors = batch.get('expand_errors', []) + [{'url': None, 'error': '服务重启，链接没有展开完'}]
+            if batch.get('children'):
+                self.store.update(batch['task_id'], status='running', expand_errors=errors)
+            else:
+                self.store.update(batch['task_id'], status='error', expand_errors=errors,
+                                  error='服务重启，链接没有展开完')
+        return len(batches)
+
+    def summary(self, batch_id):
+        """汇总批次进度，批次不存在返回None"""
+        batch = self.store.get(batch_id)
+        if batch is None or batch.get('kind') != 'batch':
+            return None
+        with self._lock:
+            known = set(batch['children'])
+            children = batch['children'] + [c for c in self._pending.get(batch_id, []) if c not in known]
+
+        counts = {}
+        progress_sum = 0
+        for task_id in children:
+            task = self.store.get(task_id)
+            status = task['status'] if task else 'missing'
+            counts[status] = counts.get(status, 0) + 1
+            if status == 'completed':
+                progress_sum += 100
+            elif task:
+                progress_sum += task.get('progress', 0)
+
+        expanding = batch['status'] == 'expanding'
+        finished = sum(counts.get(s, 0) for s in FINISHED_STATUSES) + counts.get('missing', 0)
+        status = batch['status']
+        if not expanding and children and finished == len(children):
+            status = 'completed' if not counts.get('error') else 'partial'
+            if batch['status'] != status:
+                self.store.update(batch_id, status=status)
+
+        return {
+            'batch_id': batch_id,
+            'status': status,
+            'expanding': expanding,
+            'total': len(children),
+            'counts': counts,
+            'progress': round(progress_sum / len(children), 1) if children else 0,
+            'children': children,
+            'expand_errors': batch.get('expand_errors', []),
+        }
+
+    def _expand(self, batch_id, urls, max_items, params):
+        errors = []
+        count = 0
+        for url in urls:
+            remaining = None if max_items is None else max_items - count
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                for entry in self.expand(url, max_items=remaining):
+                    task_id = self._submit(entry['url'], batch_id, params)
+                    if task_id is None:
+                        break
+                    count += 1
+                    with self._lock:
+                        pending = self._pending[batch_id]
+                        pending.append(task_id)
+                        flush = len(pending) % FLUSH_EVERY == 0
+                    if flush:
+                        self._flush(batch_id)
+            except Exception as e:
+                errors.append({'url': url, 'error': str(e)})
+
+        self._flush(batch_id)
+        status = 'running' if count else 'error'
+        self.store.update(batch_id, status=status, expand_errors=errors,
+                          error=None if count else '没有可下载的视频')
+        with self._lock:
+            self._pending.pop(batch_id, None)
+
+    def _submit(self, url, batch_id, params):
+        """提交子任务；队列已满时等待，形成背压，避免一次性展开整个播放列表"""
+        while True:
+            try:
+                return self.submit_item(url, batch_id, **params)
+            except SchedulerStoppedError:
+                return None
+            except QueueFullError:
+                time.sleep(self.retry_interval)
+
+    def _flush(self, batch_id):
+        with self._lock:
+            children = list(self._pending.get(batch_id, []))
+        self.store.update(batch_id, children=children)
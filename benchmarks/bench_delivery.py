@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件传输性能测试
+比较 /api/download 在各传输模式下的吞吐量：完整下载、随机Range请求、条件请求（304）。
+默认在本进程中启动应用（werkzeug多线程服务器）；x-sendfile/x-accel 模式下应用只返回响应头，
+测得的是应用本身的开销，实际传输由前端服务器完成——用 --url 指向nginx等前端服务器可以测量完整链路。
+
+用法:
+    python benchmarks/bench_delivery.py
+    python benchmarks/bench_delivery.py --size 256 --clients 8 --requests 64
+    python benchmarks/bench_delivery.py --url http://127.0.0.1:8080 --file 视频.mp4
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+READ_SIZE = 1024 * 1024
+
+
+def fetch(url, headers=None):
+    """发送GET请求并读完响应体，返回 (状态码, 字节数, 耗时)"""
+    request = urllib.request.Request(url, headers=headers or {})
+    started = time.perf_counter()
+    received = 0
+    try:
+        with urllib.request.urlopen(request) as response:
+            status = response.status
+            while True:
+                data = response.read(READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, received, time.perf_counter() - started
+
+
+def run_scenario(name, make_request, clients, requests):
+    """并发执行请求并统计结果"""
+    def one(_):
+        return fetch(*make_request())
+
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    latencies = sorted(r[2] for r in results)
+    total_bytes = sum(r[1] for r in results)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        'name': name,
+        'req_s': requests / elapsed,
+        'mb_s': total_bytes / elapsed / (1024 * 1024),
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'cpu_per_gb': cpu / (total_bytes / 1024 ** 3) if total_bytes else None,
+        'statuses': statuses,
+    }
+
+
+def scenarios(base_url, filename, query, size, range_size):
+    """(名称, 请求生成函数) 列表"""
+    url = f"{base_url}/api/download/{quote(filename)}{query}"
+    with urllib.request.urlopen(url) as response:
+        etag = response.headers.get('ETag')
+
+    def random_range():
+        start = random.randrange(0, max(1, size - range_size))
+        return url, {'Range': f'bytes={start}-{start + range_size - 1}'}
+
+    return [
+        ('完整下载', lambda: (url, None)),
+        (f'随机Range({range_size // 1024}KB)', random_range),
+        ('条件请求(304)', lambda: (url, {'If-None-Match': etag} if etag else None)),
+    ]
+
+
+def start_local_server():
+    """在本进程中启动应用，返回 (服务器, app模块, 基础URL)"""
+    from werkzeug.serving import make_server
+    import app as web_app
+
+    # 不输出每个请求的访问日志
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='bench-server')
+    thread.daemon = True
+    thread.start()
+    return server, web_app, f'http://127.0.0.1:{server.server_port}'
+
+
+def print_results(mode, results):
+    print(f"\n[{mode}]")
+    print(f"  {'场景':<20}{'req/s':>10}{'MB/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'CPU s/GB':>10}  状态码")
+    for r in results:
+        cpu = f"{r['cpu_per_gb']:.2f}" if r['cpu_per_gb'] is not None else '-'
+        statuses = ', '.join(f'{k}×{v}' for k, v in sorted(r['statuses'].items()))
+        print(f"  {r['name']:<20}{r['req_s']:>10.1f}{r['mb_s']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}{cpu:>10}  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件传输性能测试')
+    parser.add_argument('--size', type=int, default=64, help='测试文件大小（MB），默认64')
+    parser.add_argument('--clients', type=int, default=4, help='并发客户端数，默认4')
+    parser.add_argument('--requests', type=int, default=32, help='每个场景的请求数，默认32')
+    parser.add_argument('--range-size', type=int, default=1024, help='Range请求的大小（KB），默认1024')
+    parser.add_argument('--modes', default='direct,x-sendfile,x-accel',
+                        help='本地测试的传输模式，逗号分隔')
+    parser.add_argument('--url', help='测试已经运行的服务器（如nginx前端），不启动本地应用')
+    parser.add_argument('--file', help='配合 --url 使用：下载目录中的文件名')
+    args = parser.parse_args()
+    range_size = args.range_size * 1024
+
+    if args.url:
+        if not args.file:
+            parser.error('--url 需要同时指定 --file')
+        base_url = args.url.rstrip('/')
+        url = f"{base_url}/api/download/{quote(args.file)}"
+        with urllib.request.urlopen(url, timeout=30) as response:
+            size = int(response.headers.get('Content-Length') or 0)
+        results = [run_scenario(name, make, args.clients, args.requests)
+                   for name, make in scenarios(base_url, args.file, '', size, range_size)]
+        print_results(base_url, results)
+        return
+
+    from delivery import FileDelivery
+
+    with tempfile.TemporaryDirectory(prefix='bench_delivery_') as temp_dir:
+        size = args.size * 1024 * 1024
+        filename = 'bench.mp4'
+        path = Path(temp_dir) / filename
+        with open(path, 'wb') as f:
+            block = os.urandom(READ_SIZE)
+            for _ in range(args.size):
+                f.write(block)
+        print(f"测试文件: {size // (1024 * 1024)} MB，并发 {args.clients}，每个场景 {args.requests} 个请求")
+
+        server, web_app, base_url = start_local_server()
+        query = f"?dir={quote(temp_dir)}"
+        original = web_app.file_delivery
+        try:
+            for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+                web_app.file_delivery = FileDelivery(mode, accel_root=temp_dir)
+                results = [run_scenario(name, make, args.clients, args.requests)
+                           for name, make in scenarios(base_url, filename, query, size, range_size)]
+                print_results(mode, results)
+        finally:
+            web_app.file_delivery = original
+            server.shutdown()
+        print("\n注: 本地测试中客户端和服务器在同一进程，CPU时间包含两者；"
+              "x-sendfile/x-accel 只返回响应头，MB/s 不代表实际传输速度。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+负载测试
+用本地的"YouTube"（fake_youtube.py + yt_dlp_plugins 中的解析器插件）代替真实网站，不需要联网：
+- 提交下载：POST /api/download 的吞吐量和延迟
+- 下载任务：从提交到完成的耗时、每秒完成的任务数和下载速度（调度器和下载路径），
+  以及下载期间轮询 GET /api/status 的延迟
+- 查询：GET /api/status、GET /api/downloads（文件列表、搜索、304）的吞吐量和延迟
+- 命令行：download_youtube.py --batch-file 批量下载的耗时、速度和内存
+每个阶段同时记录进程内存（RSS）的峰值。应用在本进程中运行（werkzeug多线程服务器），
+内存包含测试客户端本身。
+
+结果可以保存为JSON（--json），之后用 --compare 与之比较：吞吐量下降或p99延迟上升超过
+--tolerance 时退出码为1，可以在改动调度、文件列表或传输代码后检查性能是否变差。
+
+用法:
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --tasks 100 --clients 16 --workers 4 --size 16
+    python benchmarks/bench_load.py --merge --duration 20      # 分离的视频/音频，下载后合并（需要ffmpeg）
+    python benchmarks/bench_load.py --store sqlite --json base.json
+    python benchmarks/bench_load.py --store sqlite --compare base.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_youtube import FakeYouTube, ffmpeg_formats, plugin_path, synthetic_formats
+
+# 解析器插件从 sys.path 中加载，导入应用（yt-dlp）之前加入
+sys.path.insert(0, plugin_path())
+
+from bench_delivery import fetch, start_local_server
+
+# p99延迟低于这个值（毫秒）时不比较，避免很快的请求因为抖动被判为变慢
+MIN_COMPARE_MS = 5.0
+
+# 影响结果的测试参数，与基准不同时提示
+COMPARED_CONFIG = ('tasks', 'clients', 'workers', 'store', 'size', 'merge', 'duration', 'extract_delay',
+                   'media_rate', 'library', 'cli_tasks', 'cli_jobs')
+
+
+def rss_bytes(pid='self'):
+    """进程当前的内存（RSS），没有 /proc 的系统上返回None"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_fallback(children=False):
+    """没有 /proc 时用 getrusage 的历史峰值（Windows上不可用，返回None）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss 在macOS上单位为字节，在Linux上为KB
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+class MemorySampler:
+    """后台定时采样进程内存，peak() 返回上次调用以来的峰值"""
+
+    def __init__(self, pid='self', interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self._peak = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-sampler')
+        self._thread.daemon = True
+
+    def start(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def peak(self):
+        self._sample()
+        with self._lock:
+            peak, self._peak = self._peak, None
+        if peak is None and self.pid == 'self':
+            peak = peak_rss_fallback()
+        return peak
+
+    def _sample(self):
+        rss = rss_bytes(self.pid)
+        if rss is None:
+            return
+        with self._lock:
+            self._peak = rss if self._peak is None else max(self._peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+def post_json(url, data):
+    """发送JSON POST请求，返回 (状态码, 响应JSON, 耗时)"""
+    request = urllib.request.Request(
+        url, data=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'}
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status, payload = response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        status = e.code
+        try:
+            payload = json.load(e)
+        except ValueError:
+            payload = {}
+    return status, payload, time.perf_counter() - started
+
+
+def get_json(url):
+    """GET请求，返回 (状态码, 响应JSON, 耗时)"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            status, payload = response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, {}
+    return status, payload, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(name, count, elapsed, latencies, total_bytes, statuses, memory):
+    """一行结果：count/elapsed 为每秒请求数（或任务数），latencies 为秒"""
+    return {
+        'name': name,
+        'count': count,
+        'req_s': count / elapsed if elapsed else None,
+        'mb_s': total_bytes / elapsed / (1024 * 1024) if elapsed else None,
+        'p50': statistics.median(latencies) * 1000 if latencies else None,
+        'p99': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'rss_mb': memory / (1024 * 1024) if memory else None,
+        'statuses': statuses,
+    }
+
+
+def count_statuses(values):
+    statuses = {}
+    for value in values:
+        statuses[str(value)] = statuses.get(str(value), 0) + 1
+    return statuses
+
+
+def run_requests(name, make_request, clients, count, sampler):
+    """并发执行 count 个GET请求（make_request() 返回 (url, headers)）"""
+    sampler.peak()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: fetch(*make_request()), range(count)))
+    elapsed = time.perf_counter() - started
+    return summarize(name, count, elapsed, [r[2] for r in results], sum(r[1] for r in results),
+                     count_statuses(r[0] for r in results), sampler.peak())
+
+
+def submit_downloads(base_url, urls, download_dir, clients, sampler):
+    """
+    并发提交下载
+
+    Returns:
+        (结果行, {task_id: 提交时间})
+    """
+    sampler.peak()
+
+    def submit(url):
+        submitted = time.perf_counter()
+        status, payload, latency = post_json(f'{base_url}/api/download', {'url': url, 'download_dir': download_dir})
+        return status, payload.get('task_id'), submitted, latency
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(submit, urls))
+    elapsed = time.perf_counter() - started
+    submitted = {task_id: at for status, task_id, at, _ in results if task_id}
+    row = summarize('提交下载', len(urls), elapsed, [r[3] for r in results], 0,
+                    count_statuses(r[0] for r in results), sampler.peak())
+    return row, submitted
+
+
+def wait_for_downloads(base_url, submitted, download_dir, clients, poll_interval, timeout, sampler):
+    """
+    轮询 /api/status 直到所有任务结束
+
+    Returns:
+        (下载任务结果行, 轮询状态的结果行)
+    """
+    from task_store import FINISHED_STATUSES
+
+    pending = list(submitted)
+    finished = {}
+    poll_latencies = []
+    poll_statuses = []
+    lock = threading.Lock()
+    first_submit = min(submitted.values()) if submitted else time.perf_counter()
+    deadline = time.monotonic() + timeout
+
+    def poll(task_id):
+        status, payload, latency = get_json(f'{base_url}/api/status/{task_id}')
+        with lock:
+            poll_latencies.append(latency)
+            poll_statuses.append(status)
+        task = payload.get('task') or {}
+        if task.get('status') in FINISHED_STATUSES:
+            finished[task_id] = (time.perf_counter(), task)
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        while pending and time.monotonic() < deadline:
+            round_started = time.monotonic()
+            done = list(pool.map(poll, pending))
+            pending = [task_id for task_id, is_done in zip(pending, done) if not is_done]
+            if pending:
+                time.sleep(max(0.0, poll_interval - (time.monotonic() - round_started)))
+
+    elapsed = max([at for at, _ in finished.values()], default=time.perf_counter()) - first_submit
+    total_bytes = 0
+    for _, task in finished.values():
+        if task['status'] == 'completed' and task.get('filename'):
+            path = Path(download_dir) / task['filename']
+            total_bytes += path.stat().st_size if path.is_file() else 0
+    statuses = count_statuses(task['status'] for _, task in finished.values())
+    if pending:
+        statuses['timeout'] = len(pending)
+    memory = sampler.peak()
+    tasks_row = summarize('下载任务(任务/s)', len(finished), elapsed,
+                          [at - submitted[task_id] for task_id, (at, _) in finished.items()],
+                          total_bytes, statuses, memory)
+    poll_row = summarize('查询状态(下载中)', len(poll_latencies), elapsed, poll_latencies, 0,
+                         count_statuses(poll_statuses), memory)
+    # 轮询次数由轮询间隔决定，不是吞吐量
+    poll_row['req_s'] = None
+    return tasks_row, poll_row
+
+
+def add_library_files(directory, count):
+    """在下载目录中生成 count 个小文件，模拟已有很多视频的文件列表"""
+    directory = Path(directory)
+    for i in range(count):
+        (directory / f'library {i:05d}.mp4').write_bytes(b'\0' * 1024)
+
+
+def run_cli(urls, output_dir, jobs, timeout):
+    """运行 download_youtube.py --batch-file，返回结果行"""
+    batch_file = Path(output_dir) / 'batch.txt'
+    batch_file.write_text('\n'.join(urls) + '\n', encoding='utf-8')
+    videos_dir = Path(output_dir) / 'videos'
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [plugin_path(), str(ROOT), env.get('PYTHONPATH')]))
+    env.pop('YTD_METADATA_CACHE_DB', None)
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / 'download_youtube.py'), '--batch-file', str(batch_file),
+         '-o', str(videos_dir), '-j', str(jobs)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    sampler = MemorySampler(process.pid).start()
+    try:
+        returncode = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        returncode = 'timeout'
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+    memory = sampler.peak() or peak_rss_fallback(children=True)
+
+    files = [p for p in videos_dir.glob('*') if p.is_file() and not p.name.endswith('.part')]
+    return summarize(f'命令行(-j {jobs}, 视频/s)', len(files), elapsed, [elapsed], sum(p.stat().st_size for p in files),
+                     {f'exit {returncode}': 1}, memory)
+
+
+def pad(text, width):
+    """左对齐（中文字符按两个字符宽度计算）"""
+    display = sum(2 if unicodedata.east_asian_width(ch) in 'WF' else 1 for ch in text)
+    return text + ' ' * max(0, width - display)
+
+
+def print_results(results):
+    print(f"\n  {pad('场景', 24)}{'req/s':>10}{'MB/s':>10}{'p50(ms)':>11}{'p99(ms)':>11}{'RSS(MB)':>10}  状态")
+
+    def number(value, width):
+        return f'{value:>{width}.1f}' if value is not None else f"{'-':>{width}}"
+
+    for r in results:
+        statuses = ', '.join(f'{k}×{v}' for k, v in sorted(r['statuses'].items()))
+        print(f"  {pad(r['name'], 24)}{number(r['req_s'], 10)}{number(r['mb_s'], 10)}"
+              f"{number(r['p50'], 11)}{number(r['p99'], 11)}{number(r['rss_mb'], 10)}  {statuses}")
+
+
+def compare(results, config, baseline, tolerance):
+    """
+    与基准结果比较
+
+    Returns:
+        变差的项目列表
+    """
+    previous = {r['name']: r for r in baseline['results']}
+    regressions = []
+    print(f"\n与基准比较（允许 {tolerance:.0%} 的波动）:")
+    different = [key for key in COMPARED_CONFIG if baseline['config'].get(key) != config.get(key)]
+    if different:
+        print(f"  [注意] 测试参数与基准不同: {', '.join(different)}，结果不能直接比较")
+    for r in results:
+        base = previous.get(r['name'])
+        if base is None:
+            continue
+        changes = []
+        if r['req_s'] and base.get('req_s'):
+            change = r['req_s'] / base['req_s'] - 1
+            changes.append(f'req/s {change:+.0%}')
+            if change < -tolerance:
+                regressions.append(f"{r['name']} 吞吐量 {base['req_s']:.1f} → {r['req_s']:.1f}")
+        if r['p99'] and base.get('p99') and max(r['p99'], base['p99']) >= MIN_COMPARE_MS:
+            change = r['p99'] / base['p99'] - 1
+            changes.append(f'p99 {change:+.0%}')
+            if change > tolerance:
+                regressions.append(f"{r['name']} p99 {base['p99']:.1f}ms → {r['p99']:.1f}ms")
+        print(f"  {pad(r['name'], 24)}{', '.join(changes) or '-'}")
+    for item in regressions:
+        print(f"  [变慢] {item}")
+    return regressions
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """下载期间屏蔽yt-dlp输出到控制台的进度"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser(description='负载测试（本地模拟的视频网站，不需要联网）')
+    parser.add_argument('--tasks', type=int, default=40, help='下载任务数，默认40')
+    parser.add_argument('--clients', type=int, default=8, help='并发客户端数，默认8')
+    parser.add_argument('--workers', type=int, default=4, help='应用的下载线程数（YTD_MAX_WORKERS），默认4')
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='memory',
+                        help='任务存储：memory 或 sqlite（临时的 YTD_TASK_DB），默认memory')
+    parser.add_argument('--size', type=int, default=4, help='合成视频的大小（MB），默认4')
+    parser.add_argument('--merge', action='store_true',
+                        help='用ffmpeg生成真实的视频和音频，下载分离的格式后合并（需要ffmpeg）')
+    parser.add_argument('--duration', type=int, default=10, help='--merge 时测试视频的长度（秒），默认10')
+    parser.add_argument('--extract-delay', type=float, default=50, help='模拟解析视频信息的耗时（毫秒），默认50')
+    parser.add_argument('--media-rate', type=float, default=0,
+                        help='每个连接的媒体传输速度上限（MB/s），默认不限速')
+    parser.add_argument('--requests', type=int, default=400, help='查询场景的请求数，默认400')
+    parser.add_argument('--library', type=int, default=2000,
+                        help='文件列表测试前在下载目录中生成的文件数，默认2000')
+    parser.add_argument('--cli-tasks', type=int, default=8, help='命令行批量下载的视频数，0表示不测试，默认8')
+    parser.add_argument('--cli-jobs', type=int, default=4, help='命令行批量下载的并发数，默认4')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='轮询任务状态的间隔（秒），默认0.2')
+    parser.add_argument('--timeout', type=float, default=600, help='等待下载完成的最长时间（秒），默认600')
+    parser.add_argument('--json', help='把结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='--compare 允许的波动比例，默认0.2')
+    parser.add_argument('--verbose', action='store_true', help='显示yt-dlp的下载输出')
+    args = parser.parse_args()
+
+    formats = ffmpeg_formats(args.duration) if args.merge else synthetic_formats(args.size * 1024 * 1024)
+    fake = FakeYouTube(formats, extract_delay=args.extract_delay / 1000,
+                       rate=args.media_rate * 1024 * 1024 or None).start()
+    run_id = uuid.uuid4().hex[:8]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='bench_load_') as temp_dir:
+        # 应用在导入时读取配置
+        os.environ['YTD_MAX_WORKERS'] = str(args.workers)
+        os.environ['YTD_MAX_QUEUE'] = str(args.tasks + 10)
+        os.environ['YTD_ROLE'] = 'all'
+        os.environ.pop('YTD_METADATA_CACHE_DB', None)
+        if args.store == 'sqlite':
+            os.environ['YTD_TASK_DB'] = str(Path(temp_dir) / 'tasks.db')
+        else:
+            os.environ.pop('YTD_TASK_DB', None)
+        download_dir = Path(temp_dir) / 'downloads'
+        download_dir.mkdir()
+
+        sampler = MemorySampler().start()
+        server, web_app, base_url = start_local_server()
+        web_app.start_background_tasks()
+        sizes = ', '.join(f"{format_id} {len(fmt['data']) / (1024 * 1024):.1f}MB" for format_id, fmt in formats.items())
+        print(f"模拟视频格式: {sizes}；任务 {args.tasks}，并发客户端 {args.clients}，"
+              f"下载线程 {args.workers}，任务存储 {args.store}")
+        try:
+            # 预热：第一个请求包含Flask的初始化开销
+            fetch(f'{base_url}/api/queue')
+            print("提交下载并等待完成...")
+            urls = [fake.video_url(f'{run_id}-{i}') for i in range(args.tasks)]
+            with quiet(not args.verbose):
+                row, submitted = submit_downloads(base_url, urls, str(download_dir), args.clients, sampler)
+                results.append(row)
+                results.extend(wait_for_downloads(base_url, submitted, download_dir, args.clients,
+                                                  args.poll_interval, args.timeout, sampler))
+
+            print("查询任务状态和文件列表...")
+            task_ids = list(submitted)
+            if task_ids:
+                results.append(run_requests(
+                    '查询状态', lambda: (f'{base_url}/api/status/{random.choice(task_ids)}', None),
+                    args.clients, args.requests, sampler))
+            add_library_files(download_dir, args.library)
+            listing = f"{base_url}/api/downloads?dir={quote(str(download_dir))}"
+            with urllib.request.urlopen(f'{listing}&limit=50') as response:
+                etag = response.headers.get('ETag')
+            results.append(run_requests('文件列表(50条)', lambda: (f'{listing}&limit=50', None),
+                                        args.clients, args.requests, sampler))
+            results.append(run_requests('文件列表(搜索+排序)', lambda: (f'{listing}&q=bench&sort=size&limit=50', None),
+                                        args.clients, args.requests, sampler))
+            results.append(run_requests('文件列表(304)', lambda: (f'{listing}&limit=50', {'If-None-Match': etag}),
+                                        args.clients, args.requests, sampler))
+        finally:
+            web_app.drain_downloads(timeout=10)
+            server.shutdown()
+            sampler.stop()
+
+        if args.cli_tasks:
+            print("命令行批量下载...")
+            cli_dir = Path(temp_dir) / 'cli'
+            cli_dir.mkdir()
+            urls = [fake.video_url(f'{run_id}-cli-{i}') for i in range(args.cli_tasks)]
+            results.append(run_cli(urls, cli_dir, args.cli_jobs, args.timeout))
+    fake.stop()
+
+    print_results(results)
+    print("\n注: 下载任务的 p50/p99 为从提交到完成的耗时；命令行为总耗时和下载进程的内存峰值；"
+          "其余RSS为本进程（应用+测试客户端）的峰值。")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.json}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, vars(args), baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
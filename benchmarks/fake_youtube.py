@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地的"YouTube"：性能测试用的视频信息和媒体文件服务器
+- /bench/watch?v=ID：视频页面链接，由 yt_dlp_plugins/extractor/ytd_bench.py 中的解析器处理
+- /bench/info/ID：解析器读取的视频信息（JSON，可以设置延迟模拟解析耗时）
+- /bench/media/ID/FORMAT：媒体文件（支持Range，可以限速）
+合成模式只提供一个随机内容的音视频格式（不需要ffmpeg）；merge模式用ffmpeg生成真实的视频和音频，
+提供分离的视频/音频格式，下载后需要合并。
+
+yt-dlp从 sys.path（或 PYTHONPATH）中的 yt_dlp_plugins 目录加载解析器插件，
+使用前把 benchmarks 目录加入 sys.path / PYTHONPATH（见 plugin_path()）。
+"""
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def plugin_path():
+    """包含解析器插件的目录（加入 sys.path / PYTHONPATH 后yt-dlp才能识别测试链接）"""
+    return str(Path(__file__).resolve().parent)
+
+
+def synthetic_formats(size):
+    """合成模式：一个同时包含音视频的mp4格式，内容为随机数据"""
+    return {
+        'av': {
+            'ext': 'mp4', 'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2',
+            'width': 640, 'height': 360, 'data': os.urandom(size),
+        },
+    }
+
+
+def ffmpeg_formats(duration, ffmpeg='ffmpeg'):
+    """
+    merge模式：用ffmpeg生成测试视频，提供单一格式和分离的视频/音频格式
+
+    Args:
+        duration: 视频长度（秒），文件大小随之变化
+    """
+    if shutil.which(ffmpeg) is None:
+        raise RuntimeError('merge模式需要ffmpeg')
+    video = ['-f', 'lavfi', '-i', f'testsrc=size=1280x720:rate=30:duration={duration}']
+    audio = ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}']
+    outputs = {
+        'av': (video + audio + ['-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest'], 'mp4',
+               {'vcodec': 'avc1.64001f', 'acodec': 'mp4a.40.2', 'width': 640, 'height': 360}),
+        'v': (video + ['-c:v', 'libx264', '-preset', 'ultrafast'], 'mp4',
+              {'vcodec': 'avc1.64001f', 'acodec': 'none', 'width': 1280, 'height': 720}),
+        'a': (audio + ['-c:a', 'aac'], 'm4a',
+              {'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128}),
+    }
+    formats = {}
+    with tempfile.TemporaryDirectory(prefix='fake_youtube_') as temp_dir:
+        for format_id, (args, ext, fields) in outputs.items():
+            path = Path(temp_dir) / f'{format_id}.{ext}'
+            subprocess.run([ffmpeg, '-v', 'error', '-y'] + args + [str(path)], check=True)
+            formats[format_id] = dict(fields, ext=ext, data=path.read_bytes())
+    return formats
+
+
+class FakeYouTube:
+    """
+    测试用的视频信息/媒体服务器
+
+    Args:
+        formats: {format_id: {'ext', 'vcodec', 'acodec', 'data', ...}}，见 synthetic_formats / ffmpeg_formats
+        extract_delay: 返回视频信息前的延迟（秒），模拟解析耗时
+        rate: 每个连接的媒体传输速度上限（字节/秒），None表示不限速
+    """
+
+    def __init__(self, formats, extract_delay=0.0, rate=None, host='127.0.0.1', port=0):
+        self.formats = formats
+        self.extract_delay = extract_delay
+        self.rate = rate
+        self.requests = {'info': 0, 'media': 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self.base_url = f'http://{host}:{self._server.server_port}'
+
+    def start(self):
+        thread = threading.Thread(target=self._server.serve_forever, name='fake-youtube')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def video_url(self, video_id):
+        return f'{self.base_url}/bench/watch?v={video_id}'
+
+    def info(self, video_id):
+        """视频信息（yt-dlp的info字典）"""
+        formats = []
+        for format_id, fmt in self.formats.items():
+            fields = {key: value for key, value in fmt.items() if key != 'data'}
+            formats.append(dict(
+                fields,
+                format_id=format_id,
+                url=f'{self.base_url}/bench/media/{video_id}/{format_id}',
+                protocol='https' if self.base_url.startswith('https') else 'http',
+                filesize=len(fmt['data']),
+            ))
+        return {
+            'id': video_id,
+            'title': f'bench {video_id}',
+            'uploader': 'ytd-bench',
+            'duration': 10,
+            'view_count': 0,
+            'formats': formats,
+        }
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlparse(self.path)
+                segments = parts.path.strip('/').split('/')
+                if segments[:2] == ['bench', 'info'] and len(segments) == 3:
+                    fake._count('info')
+                    if fake.extract_delay:
+                        time.sleep(fake.extract_delay)
+                    self._send_json(fake.info(segments[2]))
+                elif segments[:2] == ['bench', 'media'] and len(segments) == 4 and segments[3] in fake.formats:
+                    fake._count('media')
+                    self._send_media(fake.formats[segments[3]])
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_media(self, fmt):
+                data = fmt['data']
+                start, end = 0, len(data) - 1
+                match = RANGE_RE.match(self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), end) if match.group(2) else end
+                    else:
+                        start = max(0, len(data) - int(match.group(2)))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(data)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'audio/mp4' if fmt['vcodec'] == 'none' else 'video/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                view = memoryview(data)
+                started = time.monotonic()
+                sent = 0
+                try:
+                    for offset in range(start, end + 1, CHUNK_SIZE):
+                        chunk = view[offset:min(offset + CHUNK_SIZE, end + 1)]
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        if fake.rate:
+                            wait = sent / fake.rate - (time.monotonic() - started)
+                            if wait > 0:
+                                time.sleep(wait)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
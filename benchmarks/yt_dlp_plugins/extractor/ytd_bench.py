@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+性能测试用的yt-dlp解析器插件：处理 benchmarks/fake_youtube.py 提供的本地测试链接
+（http://127.0.0.1:端口/bench/watch?v=ID），从同一服务器读取视频信息，不访问YouTube。
+"""
+
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class YtdBenchIE(InfoExtractor):
+    IE_NAME = 'ytd-bench'
+    _VALID_URL = r'(?P<base>https?://(?:127\.0\.0\.1|localhost|\[::1\]):\d+)/bench/watch\?v=(?P<id>[\w-]+)'
+
+    def _real_extract(self, url):
+        base, video_id = self._match_valid_url(url).group('base', 'id')
+        return self._download_json(f'{base}/bench/info/{video_id}', video_id, note='Downloading bench info')
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址存储
+下载完成的文件按 视频ID + 格式 + 内容哈希 保存在存储目录中（objects/<视频ID>/<格式>-<哈希前16位>.<扩展名>），
+下载目录中可读的文件名（%(title)s.%(ext)s）是指向它的硬链接：
+- 内容相同的文件（重新下载、不同目录中的同一视频、redownload_fixed.py 的 _fixed 副本等）只占一份空间
+- 设置磁盘配额后，超出时按访问记录（/api/download 的下载次数和最后访问时间）淘汰：
+  lru 淘汰最久没有访问的，lfu 淘汰访问次数最少的（次数相同时淘汰较久没有访问的），
+  淘汰时删除存储中的文件和它的所有硬链接——也就是下载目录中的文件，所以需要 delete_files=True 才会淘汰，
+  否则超出配额时只打印警告
+- fix_videos.py 和 redownload_fixed.py 指定 --store 时，修复和重新下载的文件也纳入存储
+硬链接要求存储目录和下载目录在同一个文件系统上，无法创建硬链接时文件保持原样，不纳入存储。
+索引保存在存储目录的 index.db（SQLite）中，多个进程可以共用。
+
+已有的下载目录可以用命令行导入（相同内容的文件合并为硬链接）：
+    python content_store.py --store downloads/.store downloads 其他目录...
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from resume import is_partial_file
+
+POLICIES = ('lru', 'lfu')
+
+# 对象文件名中允许的字符，其余替换为 _
+_UNSAFE_CHARS_RE = re.compile(r'[^\w.+-]')
+
+# 导入目录时处理的文件
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mkv', '.m4a', '.flv', '.avi')
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+def file_checksum(path):
+    """文件的SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_size(value):
+    """
+    解析容量，支持数字（字节）或 '500M'、'50G'、'1.5T' 这样的写法
+
+    Returns:
+        字节数（int），None或空字符串返回None；无法解析时抛出 ValueError
+    """
+    if value is None or value == '':
+        return None
+    text = str(value).strip().upper().rstrip('B').rstrip('I')
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    multiplier = units.get(text[-1:], 1)
+    if text[-1:] in units:
+        text = text[:-1]
+    try:
+        size = float(text) * multiplier
+    except ValueError:
+        raise ValueError(f'无法解析的容量: {value}')
+    if size <= 0:
+        raise ValueError(f'容量必须大于0: {value}')
+    return int(size)
+
+
+class ContentStore:
+    """
+    内容寻址存储 + 磁盘配额
+
+    Args:
+        root: 存储目录（需要和下载目录在同一个文件系统上）
+        quota: 存储的容量上限（字节），None表示不限制
+        policy: 超出配额时的淘汰策略 lru / lfu
+        delete_files: 超出配额时是否淘汰（删除下载目录中的文件）；为False时只打印警告
+    """
+
+    def __init__(self, root, quota=None, policy='lru', delete_files=False):
+        if policy not in POLICIES:
+            raise ValueError(f"不支持的淘汰策略: {policy}，可选: {', '.join(POLICIES)}")
+        self.root = Path(root).resolve()
+        self.quota = quota
+        self.policy = policy
+        self.delete_files = delete_files
+        self._over_quota_warned = False
+        (self.root / 'objects').mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / 'index.db'), check_same_thread=False, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS objects ('
+            'sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, video_id TEXT, format_id TEXT, '
+            'size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)'
+        )
+        self._db.execute('CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, sha256 TEXT NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_links_sha256 ON links(sha256)')
+        self._db.commit()
+
+    def ingest(self, path, video_id=None, format_id=None, sha256=None):
+        """
+        把下载完成的文件纳入存储：内容已存在时把文件替换为指向已有对象的硬链接，否则为它创建对象
+
+        Args:
+            path: 下载目录中的文件
+            video_id: 视频ID
+            format_id: 格式（视频+音频时如 '137+140'）
+            sha256: 文件的SHA-256，为None时计算
+
+        Returns:
+            {'sha256', 'object', 'deduplicated'}；无法创建硬链接（不同文件系统等）时返回None
+        """
+        path = os.path.abspath(str(path))
+        sha256 = sha256 or file_checksum(path)
+        with self._lock:
+            row = self._db.execute('SELECT path FROM objects WHERE sha256 = ?', (sha256,)).fetchone()
+            deduplicated = False
+            try:
+                if row is not None and os.path.isfile(row[0]):
+                    target = row[0]
+                    if not os.path.samefile(target, path):
+                        # 相同内容已经保存过：文件替换为硬链接，释放这一份的空间
+                        temp = f'{path}.link'
+                        os.link(target, temp)
+                        os.replace(temp, path)
+                        deduplicated = True
+                else:
+                    target = str(self._object_path(sha256, video_id, format_id, Path(path).suffix))
+                    Path(target).parent.mkdir(parents=True, exist_ok=True)
+                    if os.path.exists(target):
+                        os.remove(target)
+                    os.link(path, target)
+                    now = time.time()
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO objects (sha256, path, video_id, format_id, size, created, '
+                        'last_access, hits) VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                        (sha256, target, video_id, format_id, os.path.getsize(target), now, now)
+                    )
+            except OSError as e:
+                print(f"[警告] 无法把 {path} 加入内容存储（存储目录需要和下载目录在同一个文件系统上）: {e}")
+                return None
+            previous = self._db.execute('SELECT sha256 FROM links WHERE path = ?', (path,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO links (path, sha256) VALUES (?, ?)', (path, sha256))
+            if previous is not None and previous[0] != sha256:
+                # 同名文件被重新下载（内容不同），原来的对象没有其他硬链接时删除
+                self._drop_if_unlinked(previous[0])
+            self._db.commit()
+        return {'sha256': sha256, 'object': target, 'deduplicated': deduplicated}
+
+    def lookup(self, path):
+        """
+        下载目录中的文件对应的对象
+
+        Returns:
+            {'sha256', 'video_id', 'format_id'}，文件不在存储中时返回None
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT o.sha256, o.video_id, o.format_id FROM links l JOIN objects o ON o.sha256 = l.sha256 '
+                'WHERE l.path = ?', (os.path.abspath(str(path)),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'sha256': row[0], 'video_id': row[1], 'format_id': row[2]}
+
+    def record_access(self, path):
+        """文件被下载一次（/api/download），更新访问次数和时间"""
+        with self._lock:
+            self._db.execute(
+                'UPDATE objects SET hits = hits + 1, last_access = ? '
+                'WHERE sha256 = (SELECT sha256 FROM links WHERE path = ?)',
+                (time.time(), os.path.abspath(str(path)))
+            )
+            self._db.commit()
+
+    def forget(self, path):
+        """文件已被删除：移除硬链接记录，对象没有其他硬链接时一并删除"""
+        path = os.path.abspath(str(path))
+        with self._lock:
+            row = self._db.execute('SELECT sha256 FROM links WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return
+            self._db.execute('DELETE FROM links WHERE path = ?', (path,))
+            self._drop_if_unlinked(row[0])
+            self._db.commit()
+
+    def prune(self):
+        """
+        清理失效的记录：硬链接文件已被删除或替换（fix_videos.py --replace 等）、对象文件已不存在；
+        没有硬链接的对象一并删除
+
+        Returns:
+            删除的对象数
+        """
+        with self._lock:
+            objects = dict(self._db.execute('SELECT sha256, path FROM objects').fetchall())
+            for path, sha256 in self._db.execute('SELECT path, sha256 FROM links').fetchall():
+                target = objects.get(sha256)
+                if target is None or not _same_file(target, path):
+                    self._db.execute('DELETE FROM links WHERE path = ?', (path,))
+            linked = {row[0] for row in self._db.execute('SELECT DISTINCT sha256 FROM links')}
+            removed = 0
+            for sha256, target in objects.items():
+                if sha256 not in linked or not os.path.isfile(target):
+                    self._remove_object(sha256)
+                    removed += 1
+            self._db.commit()
+        return removed
+
+    def evict(self, protect=()):
+        """
+        超出配额时按淘汰策略删除对象和它的硬链接，直到不超过配额
+
+        Args:
+            protect: 不淘汰的对象（sha256），例如刚下载完成的文件
+
+        Returns:
+            被删除的硬链接路径（下载目录中的文件）；delete_files 为False时不删除，返回空列表
+        """
+        if not self.quota:
+            return []
+        order = 'hits ASC, last_access ASC' if self.policy == 'lfu' else 'last_access ASC'
+        removed = []
+        with self._lock:
+            usage = self._usage()
+            if usage <= self.quota:
+                self._over_quota_warned = False
+                return []
+            if not self.delete_files:
+                if not self._over_quota_warned:
+                    self._over_quota_warned = True
+                    print(f"[警告] 内容存储超出磁盘配额（{usage / 1024 ** 2:.1f} MB / {self.quota / 1024 ** 2:.1f} MB），"
+                          "未启用淘汰，不删除文件")
+                return []
+            candidates = self._db.execute(f'SELECT sha256, size FROM objects ORDER BY {order}').fetchall()
+            for sha256, size in candidates:
+                if usage <= self.quota:
+                    break
+                if sha256 in protect:
+                    continue
+                links = [row[0] for row in self._db.execute('SELECT path FROM links WHERE sha256 = ?', (sha256,))]
+                for path in links:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        print(f"[警告] 淘汰文件失败: {path}: {e}")
+                        continue
+                    removed.append(path)
+                self._db.execute('DELETE FROM links WHERE sha256 = ?', (sha256,))
+                self._remove_object(sha256)
+                usage -= size
+            self._db.commit()
+        if removed:
+            print(f"[信息] 超出磁盘配额，按{self.policy.upper()}淘汰了 {len(removed)} 个文件")
+        return removed
+
+    def stats(self):
+        """存储统计：对象数、硬链接数、占用空间、硬链接节省的空间、配额"""
+        with self._lock:
+            objects, used = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects').fetchone()
+            links, linked = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(o.size), 0) FROM links l JOIN objects o ON o.sha256 = l.sha256'
+            ).fetchone()
+        return {
+            'objects': objects,
+            'links': links,
+            'bytes': used,
+            'saved_bytes': linked - used if linked > used else 0,
+            'quota': self.quota,
+            'policy': self.policy,
+        }
+
+    def import_directory(self, directory, extensions=VIDEO_EXTENSIONS):
+        """
+        导入目录中已有的视频文件（不含子目录和下载中的临时文件），相同内容的文件合并为硬链接
+
+        Returns:
+            (导入的文件数, 合并的文件数)
+        """
+        imported = merged = 0
+        for entry in sorted(Path(directory).iterdir()):
+            if not entry.is_file() or entry.suffix.lower() not in extensions or is_partial_file(entry.name):
+                continue
+            result = self.ingest(entry, video_id='local')
+            if result is not None:
+                imported += 1
+                merged += result['deduplicated']
+        return imported, merged
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _usage(self):
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def _object_path(self, sha256, video_id, format_id, suffix):
+        video_dir = _UNSAFE_CHARS_RE.sub('_', video_id or 'unknown')
+        name = f"{_UNSAFE_CHARS_RE.sub('_', format_id or 'unknown')}-{sha256[:16]}{suffix}"
+        return self.root / 'objects' / video_dir / name
+
+    def _drop_if_unlinked(self, sha256):
+        if self._db.execute('SELECT 1 FROM links WHERE sha256 = ?', (sha256,)).fetchone() is None:
+            self._remove_object(sha256)
+
+    def _remove_object(self, sha256):
+        row = self._db.execute('SELECT path FROM objects WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is not None:
+            try:
+                os.remove(row[0])
+            except OSError:
+                pass
+        self._db.execute('DELETE FROM objects WHERE sha256 = ?', (sha256,))
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='把已有的下载目录导入内容存储，相同内容的文件合并为硬链接')
+    parser.add_argument('directories', nargs='+', help='下载目录')
+    parser.add_argument('--store', default=os.path.join('downloads', '.store'),
+                        help='存储目录，需要和下载目录在同一个文件系统上（默认: downloads/.store）')
+    args = parser.parse_args()
+
+    store = ContentStore(args.store)
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            print(f"[错误] 目录不存在: {directory}")
+            sys.exit(1)
+        imported, merged = store.import_directory(directory)
+        print(f"{directory}: 导入 {imported} 个文件，其中 {merged} 个与已有文件内容相同，已合并为硬链接")
+    stats = store.stats()
+    print(f"存储中共 {stats['objects']} 个文件，占用 {stats['bytes'] / 1024 ** 2:.1f} MB，"
+          f"硬链接节省 {stats['saved_bytes'] / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载去重
+相同视频 + 相同格式 + 相同目录的下载请求合并为一个下载：
+正在下载时，后来的任务作为观察者跟随第一个任务（主任务）的进度；
+已经下载完成且文件还在时，直接返回已有文件，不再解析和下载。
+多个进程共用同一个任务存储时（shared），进行中的下载只记录在任务存储中（主任务由下载进程结束，
+其他进程收不到 finish()）：新建任务和查找相同的下载在任务存储中一次完成（create_or_join），
+观察者按 primary_task_id 从任务存储中查找。
+"""
+
+import os
+import threading
+
+from metadata_cache import cache_key
+from task_store import FINISHED_STATUSES, INTERRUPTED_STATUSES
+
+# 主任务结束时同步给观察者任务的字段
+RESULT_FIELDS = ('status', 'progress', 'filename', 'filepath', 'download_dir', 'error')
+
+
+def download_key(url, quality, download_dir):
+    """去重键：视频ID（或规范化后的URL） + 格式 + 下载目录"""
+    return f"{cache_key(url)}|{quality}|{os.path.normcase(os.path.abspath(str(download_dir)))}"
+
+
+class DownloadDeduplicator:
+    """
+    进行中下载的合并 + 已完成下载的内容索引
+
+    Args:
+        store: 任务存储，主任务结束时把结果同步到观察者任务
+        shared: 任务存储由多个进程共用（不在本进程中记录进行中的下载，都到任务存储中查找）
+    """
+
+    def __init__(self, store, shared=False):
+        self.store = store
+        self.shared = shared
+        self._inflight = {}
+        self._keys = {}
+        self._observers = {}
+        self._completed = {}
+        self._lock = threading.Lock()
+
+    def load(self, tasks):
+        """从已完成的任务重建内容索引（启动时调用）"""
+        tasks = sorted(tasks, key=lambda t: t.get('finished_at') or t.get('updated_at') or 0)
+        with self._lock:
+            for task in tasks:
+                key = task.get('dedup_key')
+                if key and task.get('status') == 'completed' and task.get('filepath'):
+                    self._completed[key] = task
+
+    def find_completed(self, key):
+        """已完成且文件仍然存在的任务记录，没有返回None"""
+        with self._lock:
+            task = self._completed.get(key)
+        if task is not None and not os.path.isfile(task['filepath']):
+            with self._lock:
+                if self._completed.get(key) is task:
+                    del self._completed[key]
+            task = None
+        if task is None and self.shared:
+            # 其他进程完成的下载（最新的、文件仍然存在的）
+            for candidate in reversed(self.store.find_by_dedup_key(key, 'completed')):
+                if candidate.get('filepath') and os.path.isfile(candidate['filepath']):
+                    return candidate
+        return task
+
+    def submit(self, task, start):
+        """
+        新建任务记录：有相同的下载正在进行时作为观察者加入，否则调用 start() 开始下载
+
+        Args:
+            task: 任务记录（dedup_key 为去重键，为None时不去重）
+            start: 开始下载的函数；抛出异常时已经加入的观察者任务同步为失败，异常继续抛出（任务记录由调用方删除）
+
+        Returns:
+            实际执行下载的任务ID（主任务ID）
+        """
+        task_id = task['task_id']
+        if self.shared:
+            task, primary = self.store.create_or_join(task)
+            if primary != task_id:
+                self._sync_if_finished(task_id, primary)
+                return primary
+            self._start(task_id, start)
+            return task_id
+        key = task.get('dedup_key')
+        with self._lock:
+            primary = self._inflight.get(key) if key else None
+            if primary is not None:
+                self.store.create(dict(task, primary_task_id=primary))
+                self._observers[primary].append(task_id)
+                return primary
+            self.store.create(task)
+            start()
+            if key:
+                self._register(task_id, key)
+            return task_id
+
+    def start_or_join(self, task_id, key, start):
+        """
+        已有的任务记录（如启动时恢复的任务）：有相同的下载正在进行时把任务作为观察者加入，否则调用 start() 开始下载
+
+        Args:
+            task_id: 任务ID（任务记录需要已经创建）
+            key: 去重键，为None时不去重
+            start: 开始下载的函数，抛出异常时任务不会登记
+
+        Returns:
+            实际执行下载的任务ID（主任务ID）
+        """
+        if key is None:
+            start()
+            return task_id
+        if self.shared:
+            active = [t for t in self.store.find_by_dedup_key(key, *INTERRUPTED_STATUSES) if t['task_id'] != task_id]
+            if active:
+                self.store.update(task_id, primary_task_id=active[0]['task_id'])
+                self._sync_if_finished(task_id, active[0]['task_id'])
+                return active[0]['task_id']
+            start()
+            return task_id
+        with self._lock:
+            primary = self._inflight.get(key)
+            if primary is not None and primary != task_id:
+                self._observers[primary].append(task_id)
+                self.store.update(task_id, primary_task_id=primary)
+                return primary
+            start()
+            self._register(task_id, key)
+            return task_id
+
+    def finish(self, task_id, **fields):
+        """主任务结束：登记内容索引，把结果（status、filename等）同步给观察者任务"""
+        # shared 时主任务没有在本进程中登记（下载进程从任务存储中领取），去重键从任务记录中读取
+        stored_key = (self.store.get(task_id) or {}).get('dedup_key') if self.shared else None
+        with self._lock:
+            key = self._keys.pop(task_id, None)
+            if key is not None and self._inflight.get(key) == task_id:
+                del self._inflight[key]
+            observers = self._observers.pop(task_id, [])
+            key = key or stored_key
+            if key is not None and fields.get('status') == 'completed' and fields.get('filepath'):
+                self._completed[key] = dict(fields, task_id=task_id, dedup_key=key)
+        if self.shared:
+            # 其他进程中加入的观察者只记录在任务存储中
+            observers += [
+                task['task_id'] for task in self.store.find_observers(task_id)
+                if task['status'] not in FINISHED_STATUSES and task['task_id'] not in observers
+            ]
+        for observer in observers:
+            self.store.update(observer, **fields)
+        return observers
+
+    def stats(self):
+        """正在合并的下载数和内容索引大小（shared 时进行中的下载只在任务存储中，不统计）"""
+        with self._lock:
+            if self.shared:
+                return {'shared': True, 'completed': len(self._completed)}
+            return {
+                'inflight': len(self._inflight),
+                'observers': sum(len(ids) for ids in self._observers.values()),
+                'completed': len(self._completed),
+            }
+
+    def _register(self, task_id, key):
+        """在本进程中登记主任务（在锁内调用）"""
+        self._inflight[key] = task_id
+        self._keys[task_id] = key
+        self._observers.setdefault(task_id, [])
+
+    def _start(self, task_id, start):
+        try:
+            start()
+        except Exception as e:
+            # 开始前已经有其他进程中的请求加入
+            self.finish(task_id, status='error', error=f'合并的下载任务未能开始: {e}')
+            raise
+
+    def _sync_if_finished(self, task_id, primary_id):
+        """加入时主任务可能刚好结束（结束时还没有看到这个观察者），这时直接同步结果"""
+        current = self.store.get(primary_id)
+        if current is None or current['status'] in FINISHED_STATUSES:
+            current = current or {'status': 'error', 'error': '合并的下载任务已不存在'}
+            self.store.update(task_id, **{k: current.get(k) for k in RESULT_FIELDS if k in current})
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已下载文件的传输
+- direct: 由应用发送文件，支持Range（断点续传/拖动播放）和条件请求（ETag由修改时间+大小生成）；
+  在gunicorn等提供 wsgi.file_wrapper 的服务器上，完整文件使用 sendfile() 零拷贝发送
+- x-sendfile: 只返回 X-Sendfile 头，由Apache(mod_xsendfile)/lighttpd发送文件
+- x-accel: 只返回 X-Accel-Redirect 头，由nginx发送文件（需要配置internal location）
+"""
+
+import mimetypes
+import unicodedata
+from pathlib import Path
+from urllib.parse import quote
+
+from flask import Response, current_app, request
+from werkzeug.utils import send_file
+
+DELIVERY_MODES = ('direct', 'x-sendfile', 'x-accel')
+
+
+def file_etag(stat):
+    """由修改时间和大小生成ETag（与nginx静态文件的ETag格式相同，切换模式后客户端缓存仍然有效）"""
+    return f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+
+
+def content_disposition(headers, download_name, as_attachment):
+    """设置 Content-Disposition（非ASCII文件名使用RFC 5987的 filename*）"""
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+-.^_`|~')}"}
+    headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', **names)
+
+
+class FileDelivery:
+    """
+    文件传输
+
+    Args:
+        mode: direct / x-sendfile / x-accel
+        accel_prefix: x-accel模式下nginx internal location的URL前缀
+        accel_root: x-accel模式下该前缀对应的本地目录，不在此目录中的文件改为direct发送
+        max_age: Cache-Control 的 max-age（秒），0表示每次都要验证（配合ETag返回304）
+    """
+
+    def __init__(self, mode='direct', accel_prefix='/protected-downloads/', accel_root=None, max_age=0):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f'不支持的文件传输模式: {mode}，可选: {", ".join(DELIVERY_MODES)}')
+        self.mode = mode
+        self.accel_prefix = '/' + accel_prefix.strip('/') + '/'
+        self.accel_root = Path(accel_root).resolve() if accel_root else None
+        self.max_age = max_age
+
+    def send(self, path, download_name=None, as_attachment=False):
+        """发送文件，返回Flask响应"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        download_name = download_name or path.name
+
+        if self.mode == 'x-sendfile':
+            # WSGI的响应头只能是latin-1，非ASCII路径按UTF-8字节原样传给前端服务器
+            sendfile_path = str(path).encode('utf-8').decode('latin-1')
+            return self._offload_response(stat, 'X-Sendfile', sendfile_path, download_name, as_attachment)
+        if self.mode == 'x-accel':
+            accel_path = self._accel_path(path)
+            if accel_path is not None:
+                return self._offload_response(stat, 'X-Accel-Redirect', accel_path, download_name, as_attachment)
+
+        response = send_file(
+            str(path),
+            environ=request.environ,
+            as_attachment=as_attachment,
+            download_name=download_name,
+            etag=file_etag(stat),
+            conditional=True,
+            max_age=self.max_age,
+            response_class=current_app.response_class,
+        )
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    def _accel_path(self, path):
+        if self.accel_root is None:
+            return None
+        try:
+            relative = path.relative_to(self.accel_root)
+        except ValueError:
+            return None
+        return self.accel_prefix + quote(relative.as_posix())
+
+    def _offload_response(self, stat, header, value, download_name, as_attachment):
+        # Range和sendfile由前端服务器处理，这里只处理条件请求（304不需要前端服务器读取文件）
+        response = Response(mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream')
+        response.headers[header] = value
+        content_disposition(response.headers, download_name, as_attachment)
+        response.set_etag(file_etag(stat))
+        response.last_modified = stat.st_mtime
+        if self.max_age:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.max_age
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
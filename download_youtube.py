@@ -8,8 +8,12 @@ YouTube视频下载脚本
 import os
 import sys
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import yt_dlp
+from metadata_cache import MetadataCache
+from playlist import iter_playlist_entries
+from format_policy import CODECS, format_options, quality_arg
 
 # 设置Windows控制台编码为UTF-8
 if sys.platform == 'win32':
@@ -20,78 +24,69 @@ if sys.platform == 'win32':
         pass
 
 
-def download_video(url, output_dir="downloads", quality="best"):
+def download_video(url, output_dir="downloads", quality="best", cache=None,
+                   concurrent_fragments=None, exit_on_error=True, codec=None):
     """
     下载YouTube视频
     
     Args:
         url: YouTube视频链接
         output_dir: 输出目录，默认为"downloads"
-        quality: 视频质量，可选值: "best", "worst", "720p", "1080p"等
+        quality: 视频质量，可选值: "best", "worst", "economy", "720p", "1080p"等（任意高度上限）
+        cache: 元数据缓存（MetadataCache），为None时不使用缓存
+        concurrent_fragments: 分片（DASH/HLS）并发下载数
+        exit_on_error: 失败时是否退出程序；为False时返回False（批量下载时使用）
+        codec: 优先的视频编码 h264/hevc/vp9/av1
+    
+    Returns:
+        下载成功返回True
     """
+    # 导入yt-dlp需要约0.2秒，只在真正下载时导入（--help、参数错误时不需要）
+    import yt_dlp
+    
     # 创建输出目录
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
-    # 检查是否有ffmpeg用于合并
-    import shutil
-    has_ffmpeg = shutil.which('ffmpeg')
-    
     # 配置yt-dlp选项
-    # Plan B: 使用更严格的格式选择策略，完全避免MPEG-TS格式
-    # 明确排除HLS流（m3u8）和MPEG-TS格式，只选择兼容的格式
+    # 格式选择见 format_policy：排除HLS流（m3u8），避免MPEG-TS格式；有ffmpeg时合并音视频为mp4
     ydl_opts = {
         'outtmpl': str(output_path / '%(title)s.%(ext)s'),
         'noplaylist': True,  # 只下载单个视频，不下载播放列表
         'prefer_free_formats': False,  # 不优先选择免费格式
         'no_warnings': False,
-        # 关键：明确排除HLS流格式（通常会导致MPEG-TS问题）
-        'format_sort': ['ext:mp4', 'ext:webm', 'res', 'codec:h264', 'codec:vp9'],
     }
-    
-    # 根据是否有ffmpeg和quality参数调整格式选择
-    # 完全避免HLS流和MPEG-TS格式
-    if has_ffmpeg:
-        # 有ffmpeg时，可以使用分离的视频+音频格式，合并为mp4
-        ydl_opts['merge_output_format'] = 'mp4'
-        if quality == "best":
-            # 明确排除HLS格式（format_id 96等），只选择mp4/webm
-            ydl_opts['format'] = 'bestvideo[ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a][protocol!=m3u8]/bestvideo[ext=webm][protocol!=m3u8]+bestaudio[ext=webm][protocol!=m3u8]/best[ext=mp4][protocol!=m3u8]/best[ext=webm][protocol!=m3u8]/best[protocol!=m3u8]'
-        elif quality == "720p":
-            ydl_opts['format'] = 'bestvideo[height<=720][ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a][protocol!=m3u8]/bestvideo[height<=720][ext=webm][protocol!=m3u8]+bestaudio[ext=webm][protocol!=m3u8]/best[height<=720][ext=mp4][protocol!=m3u8]/best[height<=720][protocol!=m3u8]'
-        elif quality == "1080p":
-            ydl_opts['format'] = 'bestvideo[height<=1080][ext=mp4][protocol!=m3u8]+bestaudio[ext=m4a][protocol!=m3u8]/bestvideo[height<=1080][ext=webm][protocol!=m3u8]+bestaudio[ext=webm][protocol!=m3u8]/best[height<=1080][ext=mp4][protocol!=m3u8]/best[height<=1080][protocol!=m3u8]'
-        elif quality == "worst":
-            ydl_opts['format'] = 'worst[ext=mp4][protocol!=m3u8]/worst[ext=webm][protocol!=m3u8]/worst[protocol!=m3u8]'
-    else:
-        # 没有ffmpeg时，只选择单一格式（不需要合并的）
-        # 完全排除HLS流，只选择mp4/webm格式
-        if quality == "best":
-            # 关键：排除m3u8协议（HLS流），避免MPEG-TS问题
-            ydl_opts['format'] = 'best[ext=mp4][protocol!=m3u8]/best[ext=webm][protocol!=m3u8]/best[protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "720p":
-            ydl_opts['format'] = 'best[height<=720][ext=mp4][protocol!=m3u8]/best[height<=720][ext=webm][protocol!=m3u8]/best[height<=720][protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "1080p":
-            ydl_opts['format'] = 'best[height<=1080][ext=mp4][protocol!=m3u8]/best[height<=1080][ext=webm][protocol!=m3u8]/best[height<=1080][protocol!=m3u8][vcodec!=none][acodec!=none]'
-        elif quality == "worst":
-            ydl_opts['format'] = 'worst[ext=mp4][protocol!=m3u8]/worst[ext=webm][protocol!=m3u8]/worst[protocol!=m3u8][vcodec!=none][acodec!=none]'
+    ydl_opts.update(format_options(quality, codec=codec))
+    if concurrent_fragments:
+        ydl_opts['concurrent_fragment_downloads'] = concurrent_fragments
     
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             # 获取视频信息
             print(f"正在获取视频信息: {url}")
-            info = ydl.extract_info(url, download=False)
+            if cache is None:
+                cache = MetadataCache(max_entries=1)
+            info = cache.get_or_extract(
+                url,
+                lambda u: ydl.sanitize_info(ydl.extract_info(u, download=False), remove_private_keys=True)
+            )
             title = info.get('title', 'Unknown')
             duration = info.get('duration', 0)
             print(f"视频标题: {title}")
             print(f"时长: {duration // 60}分{duration % 60}秒")
             print(f"开始下载...")
             
-            # 下载视频
-            ydl.download([url])
+            # 下载视频（直接使用已解析的信息，不再重复解析）
+            try:
+                ydl.process_ie_result(info, download=True)
+            except yt_dlp.utils.DownloadError:
+                # 缓存中的下载地址可能已失效，重新解析后下载
+                cache.invalidate(url)
+                ydl.download([url])
             
             print(f"\n[成功] 下载完成！")
             print(f"保存位置: {output_path.absolute()}")
+            return True
             
     except yt_dlp.utils.DownloadError as e:
         error_msg = str(e)
@@ -100,14 +95,67 @@ def download_video(url, output_dir="downloads", quality="best"):
             print("\n提示: 如果需要下载最佳质量的视频，请安装ffmpeg:")
             print("  Windows: 下载 https://ffmpeg.org/download.html 并添加到PATH")
             print("  或使用: winget install ffmpeg")
-        sys.exit(1)
+        if exit_on_error:
+            sys.exit(1)
+        return False
     except Exception as e:
         print(f"[错误] 发生错误: {e}")
-        sys.exit(1)
+        if exit_on_error:
+            sys.exit(1)
+        return False
+
+
+def read_batch_file(batch_file):
+    """逐行读取批量下载文件中的链接（忽略空行和#开头的注释）"""
+    with open(batch_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def download_batch(urls, output_dir="downloads", quality="best", cache=None,
+                   jobs=2, expand_playlists=True, concurrent_fragments=None, codec=None):
+    """
+    批量下载
+    
+    Args:
+        urls: 链接（可迭代，逐条读取）
+        jobs: 同时下载的视频数
+        expand_playlists: 是否展开播放列表/频道（逐页获取，不会一次性解析整个列表）
+    
+    Returns:
+        (成功数, 总数)
+    """
+    def entries():
+        for url in urls:
+            if not expand_playlists:
+                yield url
+                continue
+            try:
+                for entry in iter_playlist_entries(url):
+                    yield entry['url']
+            except Exception as e:
+                print(f"[错误] 无法展开 {url}: {e}")
+    
+    results = []
+    # 最多只提前展开 jobs*2 个视频，其余的等有空闲线程时再获取
+    slots = threading.BoundedSemaphore(jobs * 2)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for url in entries():
+            slots.acquire()
+            future = pool.submit(download_video, url, output_dir, quality, cache,
+                                 concurrent_fragments, False, codec)
+            future.add_done_callback(lambda f: slots.release())
+            results.append(future)
+    
+    success = sum(1 for f in results if f.result())
+    return success, len(results)
 
 
-def main():
+def main(argv=None, prog=None):
     parser = argparse.ArgumentParser(
+        prog=prog,
         description='下载YouTube视频到本地',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
@@ -115,10 +163,34 @@ def main():
   python download_youtube.py https://www.youtube.com/watch?v=VIDEO_ID
   python download_youtube.py https://www.youtube.com/watch?v=VIDEO_ID --output my_videos
   python download_youtube.py https://www.youtube.com/watch?v=VIDEO_ID --quality 720p
+  python download_youtube.py https://www.youtube.com/watch?v=VIDEO_ID --quality economy-1080p --codec av1
+  python download_youtube.py https://www.youtube.com/playlist?list=LIST_ID --playlist --jobs 3
+  python download_youtube.py --batch-file urls.txt --jobs 4
         """
     )
     
-    parser.add_argument('url', help='YouTube视频链接')
+    parser.add_argument('url', nargs='?', help='YouTube视频链接')
+    parser.add_argument(
+        '--batch-file',
+        help='批量下载：从文件读取链接，每行一个（#开头为注释）'
+    )
+    parser.add_argument(
+        '--playlist',
+        action='store_true',
+        help='展开播放列表/频道，下载其中所有视频'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=2,
+        help='批量下载时同时下载的视频数 (默认: 2)'
+    )
+    parser.add_argument(
+        '-N', '--concurrent-fragments',
+        type=int,
+        default=None,
+        help='分片（DASH/HLS）并发下载数 (默认: 1)'
+    )
     parser.add_argument(
         '-o', '--output',
         default='downloads',
@@ -126,14 +198,58 @@ def main():
     )
     parser.add_argument(
         '-q', '--quality',
-        choices=['best', 'worst', '720p', '1080p'],
+        type=quality_arg,
         default='best',
-        help='视频质量 (默认: best)'
+        help='视频质量: best、worst、economy（同画质下最小的文件）或高度上限如 720p、1440p、economy-720p (默认: best)'
+    )
+    parser.add_argument(
+        '--codec',
+        choices=sorted(CODECS),
+        default=None,
+        help='优先的视频编码，vp9/av1 相同画质下文件更小 (默认: 不指定)'
+    )
+    parser.add_argument(
+        '--cache-db',
+        default=os.environ.get('YTD_METADATA_CACHE_DB'),
+        help='元数据缓存文件（SQLite），多次运行之间复用解析结果 (默认: 环境变量 YTD_METADATA_CACHE_DB)'
+    )
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=1800,
+        help='元数据缓存有效期，单位秒 (默认: 1800)'
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if not args.url and not args.batch_file:
+        parser.error('需要提供视频链接或 --batch-file')
+    if args.jobs < 1:
+        parser.error('--jobs 必须大于0')
+    
+    if args.batch_file or args.playlist:
+        urls = []
+        if args.url:
+            urls.append(args.url)
+        if args.batch_file:
+            urls = _chain(urls, read_batch_file(args.batch_file))
+        cache = MetadataCache(max_entries=256, ttl=args.cache_ttl, db_path=args.cache_db)
+        success, total = download_batch(
+            urls, args.output, args.quality, cache=cache, jobs=args.jobs,
+            expand_playlists=args.playlist, concurrent_fragments=args.concurrent_fragments, codec=args.codec
+        )
+        print(f"\n[完成] 成功下载 {success}/{total} 个视频")
+        if success < total:
+            sys.exit(1)
+        return
     
-    download_video(args.url, args.output, args.quality)
+    cache = MetadataCache(max_entries=1, ttl=args.cache_ttl, db_path=args.cache_db)
+    download_video(args.url, args.output, args.quality, cache=cache,
+                   concurrent_fragments=args.concurrent_fragments, codec=args.codec)
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
 
 
 if __name__ == "__main__":
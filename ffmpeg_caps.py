@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ffmpeg能力检测结果的缓存
+fix_videos.py 和处理流水线每次启动都要检测可以使用哪个H.264编码器
+（硬件编码器需要试编码一帧，没有显卡时可能要等几秒），检测结果保存在缓存文件中，
+按ffmpeg可执行文件（路径、大小、修改时间）判断是否有效：ffmpeg升级或替换后重新检测，
+超过 MAX_AGE 也重新检测（显卡、驱动可能有变化）。
+缓存目录为 YTD_CACHE_DIR，默认 ~/.cache/yt_downloader（Windows为 %LOCALAPPDATA%\\yt_downloader）；
+YTD_CACHE_DIR 设置为空字符串时不使用缓存文件。
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+CACHE_FILENAME = 'ffmpeg_caps.json'
+
+# 缓存的有效期（秒）
+MAX_AGE = 7 * 86400
+
+_lock = threading.Lock()
+
+
+def cache_dir():
+    """缓存目录，不使用缓存文件时返回None"""
+    configured = os.environ.get('YTD_CACHE_DIR')
+    if configured is not None:
+        return configured or None
+    if sys.platform == 'win32' and os.environ.get('LOCALAPPDATA'):
+        return os.path.join(os.environ['LOCALAPPDATA'], 'yt_downloader')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'yt_downloader')
+
+
+def ffmpeg_signature():
+    """PATH中的ffmpeg的 [路径, 大小, 修改时间]，没有ffmpeg时返回None"""
+    path = shutil.which('ffmpeg')
+    if not path:
+        return None
+    path = os.path.realpath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def cached_capability(name, probe):
+    """
+    返回ffmpeg的一项检测结果，缓存中没有或已失效时调用 probe() 检测并写入缓存
+
+    Args:
+        name: 检测项的名称，如 'h264_encoder'
+        probe: 检测函数，返回值需要能保存为JSON
+
+    Returns:
+        probe() 的结果；没有ffmpeg时不使用缓存，直接返回 probe() 的结果
+    """
+    signature = ffmpeg_signature()
+    directory = cache_dir()
+    if signature is None or directory is None:
+        return probe()
+    cache_file = os.path.join(directory, CACHE_FILENAME)
+    with _lock:
+        entries = _load(cache_file)
+        entry = entries.get(name)
+        if entry and entry.get('signature') == signature and time.time() - entry.get('checked', 0) < MAX_AGE:
+            return entry['value']
+        value = probe()
+        entries[name] = {'signature': signature, 'checked': time.time(), 'value': value}
+        _save(cache_file, entries)
+        return value
+
+
+def _load(cache_file):
+    try:
+        with open(cache_file, encoding='utf-8') as f:
+            entries = json.load(f)
+        return entries if isinstance(entries, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(cache_file, entries):
+    # 其他进程可能同时写入，先写临时文件再替换；目录不可写时只是不缓存
+    tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ffmpeg命令
+fix_videos.py 和下载后的处理流水线（postprocess.py）共用的重新封装/重新编码命令和H.264编码器检测
+"""
+
+import subprocess
+
+from ffmpeg_caps import cached_capability
+
+# 各H.264编码器的质量参数（按优先级排列，硬件编码器在前）
+H264_ENCODERS = {
+    'h264_nvenc': ['-preset', 'p5', '-cq', '23'],
+    'h264_qsv': ['-preset', 'medium', '-global_quality', '23'],
+    'h264_videotoolbox': ['-q:v', '65'],
+    'h264_amf': ['-quality', 'balanced', '-qp_i', '23', '-qp_p', '23'],
+    'libx264': ['-preset', 'medium', '-crf', '23'],
+}
+
+
+def detect_h264_encoder():
+    """
+    检测可用的H.264编码器，优先使用硬件编码器
+    ffmpeg -encoders 列出的硬件编码器不一定真的可用（比如没有显卡），所以用一帧测试编码验证；
+    检测结果缓存在 ffmpeg_caps 中，下次运行不再测试
+    """
+    return cached_capability('h264_encoder', _detect_h264_encoder)
+
+
+def _detect_h264_encoder():
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'libx264'
+    
+    for encoder in H264_ENCODERS:
+        if encoder == 'libx264' or f' {encoder} ' not in result.stdout:
+            continue
+        test = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+             '-f', 'lavfi', '-i', 'color=c=black:s=256x256:d=0.1',
+             '-c:v', encoder, '-f', 'null', '-'],
+            capture_output=True
+        )
+        if test.returncode == 0:
+            return encoder
+    return 'libx264'
+
+
+def build_command(input_file, output_file, mode, encoder='libx264', threads=None, probe=None):
+    """生成ffmpeg命令（mode: remux 重新封装 / reencode 重新编码）"""
+    cmd = ['ffmpeg', '-hide_banner', '-nostats', '-progress', 'pipe:1', '-i', input_file]
+    if mode == 'remux':
+        cmd += ['-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy']
+        if probe and probe.get('audio') == 'aac' and 'mpegts' in (probe.get('format') or ''):
+            # MPEG-TS中的AAC是ADTS封装，放进MP4需要转换
+            cmd += ['-bsf:a', 'aac_adtstoasc']
+    else:
+        cmd += ['-c:v', encoder] + H264_ENCODERS.get(encoder, [])
+        cmd += ['-c:a', 'aac']
+        if threads:
+            cmd += ['-threads', str(threads)]
+    cmd += ['-movflags', '+faststart', '-y', output_file]
+    return cmd
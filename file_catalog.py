@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已下载文件目录索引
+维护各下载目录中视频文件的索引，替代每次请求都扫描所有目录。
+下载完成时直接登记文件；目录的修改时间（mtime）变化时才重新扫描该目录。
+每个文件有一个由完整路径生成的稳定ID，按ID和文件名都可以直接查找。
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+# 列表中显示的视频格式
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mkv')
+
+# 支持的排序字段
+SORT_KEYS = {
+    'mtime': lambda entry: entry['mtime'],
+    'size': lambda entry: entry['size'],
+    'name': lambda entry: entry['name'].lower(),
+}
+
+
+class FileCatalog:
+    """
+    文件索引
+
+    Args:
+        extensions: 需要索引的文件扩展名
+        refresh_interval: 两次检查目录mtime之间的最小间隔（秒）
+        max_temporary: 最多保留的临时目录数（只是浏览过的目录），超出时移除最久没有浏览的
+    """
+
+    def __init__(self, extensions=VIDEO_EXTENSIONS, refresh_interval=2.0, max_temporary=8):
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._instance = uuid.uuid4().hex[:8]
+        self.max_temporary = max_temporary
+        self._dirs = {}
+        self._temporary = OrderedDict()
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.RLock()
+        self._last_check = 0
+        self._sorted_cache = {}
+
+    def add_directory(self, directory, temporary=False):
+        """
+        登记需要索引的目录，返回目录的规范化路径（不存在时返回None）
+
+        Args:
+            directory: 目录
+            temporary: 临时目录（如只是在文件列表中浏览），超出 max_temporary 时移出索引；
+                       之后作为普通目录登记时不再是临时目录
+        """
+        path = Path(directory)
+        try:
+            key = str(path.resolve())
+        except OSError:
+            return None
+        with self._lock:
+            if key not in self._dirs:
+                self._dirs[key] = {'display': str(path), 'mtime_ns': None, 'files': {}}
+                if temporary:
+                    self._temporary[key] = True
+            elif not temporary:
+                self._temporary.pop(key, None)
+            elif key in self._temporary:
+                self._temporary.move_to_end(key)
+            while len(self._temporary) > self.max_temporary:
+                self._remove_directory(self._temporary.popitem(last=False)[0])
+        return key
+
+    def add_file(self, file_path):
+        """下载完成时登记文件，不需要重新扫描目录"""
+        path = Path(file_path)
+        if path.suffix.lower() not in self.extensions:
+            return None
+        key = self.add_directory(path.parent)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            directory = self._dirs[key]
+            entry = self._make_entry(directory, key, path.name, stat)
+            self._unindex(directory['files'].get(path.name))
+            directory['files'][path.name] = entry
+            self._index(entry)
+            self._changed()
+            return entry
+
+    def remove_file(self, file_path):
+        """删除文件后移出索引"""
+        path = Path(file_path)
+        try:
+            key = str(path.parent.resolve())
+        except OSError:
+            return
+        with self._lock:
+            directory = self._dirs.get(key)
+            entry = directory['files'].pop(path.name, None) if directory else None
+            if entry is not None:
+                self._unindex(entry)
+                self._changed()
+
+    def refresh(self, directories=None, force=False):
+        """
+        检查目录是否有变化，有变化的目录重新扫描
+
+        Args:
+            directories: 要检查的目录（规范化路径），为None时检查所有目录
+            force: 忽略检查间隔和mtime，强制重新扫描
+        """
+        now = time.monotonic()
+        with self._lock:
+            if directories is None:
+                if not force and now - self._last_check < self.refresh_interval:
+                    return
+                self._last_check = now
+                directories = list(self._dirs)
+        for key in directories:
+            self._refresh_directory(key, force)
+
+    def query(self, directories=None, search=None, ext=None, sort='mtime', reverse=True, offset=0, limit=None):
+        """
+        查询文件
+
+        Args:
+            directories: 只返回这些目录（规范化路径）中的文件，为None时返回全部
+            search: 文件名包含的关键字（不区分大小写）
+            ext: 只返回该扩展名的文件
+            sort: 排序字段 mtime/size/name
+            reverse: 是否倒序
+            offset, limit: 分页
+
+        Returns:
+            (当前页的文件列表, 满足条件的文件总数)
+        """
+        with self._lock:
+            entries = self._sorted(tuple(directories) if directories is not None else None, sort, reverse)
+        if search:
+            search = search.lower()
+            entries = [e for e in entries if search in e['name'].lower()]
+        if ext:
+            ext = ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
+            entries = [e for e in entries if e['ext'] == ext]
+        total = len(entries)
+        end = offset + limit if limit is not None else None
+        return entries[offset:end], total
+
+    def get(self, file_id):
+        """按文件ID查找，不存在返回None"""
+        with self._lock:
+            return self._by_id.get(file_id)
+
+    def find_by_name(self, name):
+        """按文件名查找，不同目录中的同名文件都会返回"""
+        with self._lock:
+            entries = [self._by_id[file_id] for file_id in self._by_name.get(name, ())]
+        return sorted(entries, key=lambda entry: entry['path'])
+
+    def lookup(self, directory, name):
+        """查找指定目录中的文件，不存在返回None"""
+        path = Path(directory)
+        try:
+            key = str(path.resolve())
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._dirs.get(key, {}).get('files', {}).get(name)
+        return entry
+
+    def etag(self, query=b''):
+        """当前索引版本 + 查询参数对应的ETag，索引变化或进程重启后都会改变"""
+        return f'{self._instance}-{self.version}-{zlib.crc32(query):08x}'
+
+    def directories(self):
+        """已登记的目录（规范化路径）"""
+        with self._lock:
+            return list(self._dirs)
+
+    def _sorted(self, directories, sort, reverse):
+        cache_key = (self.version, directories, sort, reverse)
+        cached = self._sorted_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        keys = directories if directories is not None else list(self._dirs)
+        entries = [entry for key in keys if key in self._dirs for entry in self._dirs[key]['files'].values()]
+        entries.sort(key=SORT_KEYS.get(sort, SORT_KEYS['mtime']), reverse=reverse)
+        self._sorted_cache = {cache_key: entries}
+        return entries
+
+    def _refresh_directory(self, key, force):
+        try:
+            mtime_ns = os.stat(key).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        with self._lock:
+            directory = self._dirs.get(key)
+            if directory is None:
+                return
+            if not force and directory['mtime_ns'] == mtime_ns and mtime_ns is not None:
+                return
+
+        files = {}
+        if mtime_ns is not None:
+            try:
+                with os.scandir(key) as it:
+                    for item in it:
+                        if not item.name.lower().endswith(self.extensions):
+                            continue
+                        try:
+                            if not item.is_file():
+                                continue
+                            stat = item.stat()
+                        except OSError:
+                            continue
+                        files[item.name] = self._make_entry(directory, key, item.name, stat)
+            except OSError:
+                pass
+
+        with self._lock:
+            directory['mtime_ns'] = mtime_ns
+            if files != directory['files']:
+                for entry in directory['files'].values():
+                    self._unindex(entry)
+                directory['files'] = files
+                for entry in files.values():
+                    self._index(entry)
+                self._changed()
+
+    def _remove_directory(self, key):
+        directory = self._dirs.pop(key, None)
+        if directory is None:
+            return
+        for entry in directory['files'].values():
+            self._unindex(entry)
+        self._changed()
+
+    def _index(self, entry):
+        self._by_id[entry['id']] = entry
+        self._by_name.setdefault(entry['name'], set()).add(entry['id'])
+
+    def _unindex(self, entry):
+        if entry is None:
+            return
+        self._by_id.pop(entry['id'], None)
+        ids = self._by_name.get(entry['name'])
+        if ids is not None:
+            ids.discard(entry['id'])
+            if not ids:
+                del self._by_name[entry['name']]
+
+    def _make_entry(self, directory, key, name, stat):
+        display_dir = directory['display']
+        return {
+            'id': file_id(os.path.join(key, name)),
+            'name': name,
+            'path': os.path.join(display_dir, name),
+            'dir': display_dir,
+            'ext': os.path.splitext(name)[1].lower(),
+            'size': stat.st_size,
+            'size_mb': round(stat.st_size / (1024 * 1024), 2),
+            'mtime': stat.st_mtime,
+            'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def _changed(self):
+        self.version += 1
+
+
+def file_id(path):
+    """由文件的完整路径生成稳定的文件ID"""
+    return hashlib.sha1(os.path.normcase(str(path)).encode('utf-8')).hexdigest()[:16]
@@ -3,15 +3,23 @@
 """
 修复已下载的视频文件
 将MPEG-TS格式或其他格式转换为可播放的MP4格式
+优先只重新封装（-c copy，速度快、无损），编码不兼容或封装失败时才重新编码
+处理目录前先检查每个文件，只修复有问题的文件，检查结果缓存在目录中的 .fix_videos_cache.json
 需要ffmpeg支持
 """
 
 import os
 import sys
+import re
 import subprocess
 import shutil
+import threading
+from collections import deque
 from pathlib import Path
 
+from ffmpeg_commands import build_command, detect_h264_encoder
+from video_probe import CACHE_FILENAME, ProbeCache, can_remux, classify_video, probe_video
+
 # 设置Windows控制台编码为UTF-8
 if sys.platform == 'win32':
     try:
@@ -34,14 +42,66 @@ def check_ffmpeg():
     return False
 
 
-def fix_video(input_file, output_file=None, keep_original=True):
+# 进度输出的间隔（百分比）
+PROGRESS_STEP = 10
+
+# ffmpeg输出中的时长，例如 "Duration: 00:03:25.04"
+DURATION_RE = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+def run_ffmpeg(cmd, duration=None, label=''):
     """
-    修复视频文件，重新编码为标准的MP4格式
+    运行ffmpeg并实时解析 -progress 输出显示进度，stderr只保留最后几行
+    （没有ffprobe提供时长时，从stderr的 Duration 行读取）
+
+    Returns:
+        (是否成功, 最后几行错误信息)
+    """
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, encoding='utf-8', errors='replace')
+    stderr_tail = deque(maxlen=10)
+    media = {'duration': duration}
+    
+    def read_stderr():
+        for line in process.stderr:
+            stderr_tail.append(line)
+            if media['duration'] is None:
+                match = DURATION_RE.search(line)
+                if match:
+                    h, m, sec = match.groups()
+                    media['duration'] = int(h) * 3600 + int(m) * 60 + float(sec)
+    
+    reader = threading.Thread(target=read_stderr)
+    reader.daemon = True
+    reader.start()
+    
+    next_report = PROGRESS_STEP
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and media['duration'] and value.isdigit():
+            percent = int(value) / 1_000_000 / media['duration'] * 100
+            if percent >= next_report:
+                print(f"  {label}进度: {min(int(percent), 100)}%")
+                next_report = (int(percent) // PROGRESS_STEP + 1) * PROGRESS_STEP
+    
+    process.wait()
+    reader.join()
+    return process.returncode == 0, [line.rstrip() for line in stderr_tail if line.strip()]
+
+
+def fix_video(input_file, output_file=None, keep_original=True, mode='auto', encoder='libx264', threads=None,
+              store=None):
+    """
+    修复视频文件为标准的MP4格式
     
     Args:
         input_file: 输入视频文件路径
         output_file: 输出文件路径（如果为None，则自动生成）
         keep_original: 是否保留原文件
+        mode: auto 先尝试重新封装，失败或编码不兼容时重新编码；remux 只重新封装；reencode 总是重新编码
+        encoder: 重新编码时使用的H.264编码器
+        threads: 重新编码时ffmpeg使用的线程数（None表示由ffmpeg决定）
+        store: 内容存储目录，修复后的文件纳入存储（见 content_store.py），None表示不使用
     """
     if not os.path.exists(input_file):
         print(f"[错误] 文件不存在: {input_file}")
@@ -49,32 +109,41 @@ def fix_video(input_file, output_file=None, keep_original=True):
     
     if output_file is None:
         # 创建修复后的文件名
-        path = Path(input_file)
-        output_file = str(path.parent / f"{path.stem}_fixed.mp4")
+        output_file = str(fixed_output_path(input_file))
     
+    label = f"[{os.path.basename(input_file)}] "
     print(f"正在修复: {os.path.basename(input_file)}")
     print(f"输出文件: {os.path.basename(output_file)}")
     
-    # 使用ffmpeg重新编码视频为标准MP4格式
-    # 使用copy编码器尝试快速修复，如果不行则重新编码
-    cmd = [
-        'ffmpeg',
-        '-i', input_file,
-        '-c:v', 'libx264',  # 使用H.264视频编码
-        '-c:a', 'aac',      # 使用AAC音频编码
-        '-movflags', '+faststart',  # 优化web播放，将元数据移到文件开头
-        '-preset', 'medium',  # 编码速度和质量平衡
-        '-crf', '23',  # 质量设置（18-28，23是默认值）
-        '-y',  # 覆盖输出文件
-        output_file
-    ]
-    
     try:
-        print("正在重新编码视频...")
-        result = subprocess.run(cmd, 
-                              capture_output=True, 
-                              text=True,
-                              check=True)
+        probe = probe_video(input_file)
+        duration = probe['duration'] if probe else None
+        
+        attempts = []
+        if mode in ('auto', 'remux') and (mode == 'remux' or can_remux(probe)):
+            attempts.append('remux')
+        if mode in ('auto', 'reencode'):
+            attempts.append('reencode')
+        
+        errors = []
+        for attempt in attempts:
+            if attempt == 'remux':
+                print(f"  {label}重新封装（不重新编码）...")
+            else:
+                print(f"  {label}正在重新编码视频（{encoder}）...")
+            ok, errors = run_ffmpeg(build_command(input_file, output_file, attempt, encoder, threads, probe),
+                                    duration, label)
+            if ok:
+                break
+            if attempt == 'remux' and 'reencode' in attempts:
+                print(f"  {label}重新封装失败，改为重新编码")
+        else:
+            print(f"[错误] 修复失败: {os.path.basename(input_file)}")
+            # 只显示关键错误信息
+            for line in errors:
+                print(f"  {line}")
+            return False
+        
         print(f"[成功] 修复完成: {output_file}")
         
         # 如果成功且不保留原文件，删除原文件
@@ -85,16 +154,9 @@ def fix_video(input_file, output_file=None, keep_original=True):
             except:
                 print(f"[警告] 无法删除原文件: {os.path.basename(input_file)}")
         
+        if store:
+            store_fixed(store, input_file, output_file)
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"[错误] 修复失败")
-        if e.stderr:
-            # 只显示关键错误信息
-            error_lines = e.stderr.split('\n')
-            for line in error_lines[-10:]:  # 显示最后10行
-                if line.strip():
-                    print(f"  {line}")
-        return False
     except FileNotFoundError:
         print("[错误] ffmpeg未找到，请先安装ffmpeg")
         print("  Windows: 下载 https://ffmpeg.org/download.html 并添加到PATH")
@@ -102,8 +164,79 @@ def fix_video(input_file, output_file=None, keep_original=True):
         return False
 
 
-def fix_all_videos_in_directory(directory="downloads", keep_original=True):
-    """修复目录中的所有视频文件"""
+def store_fixed(store_dir, input_file, output_file):
+    """
+    把修复后的文件纳入内容存储：视频ID与原文件相同，格式为 <原格式>-fixed；
+    原文件已被删除（--replace）时移除它的记录
+    """
+    from content_store import ContentStore
+    store = ContentStore(store_dir)
+    try:
+        source = store.lookup(input_file) or {}
+        store.ingest(output_file, video_id=source.get('video_id') or 'local',
+                     format_id=f"{source.get('format_id') or 'unknown'}-fixed")
+        if not os.path.exists(input_file):
+            store.forget(input_file)
+    finally:
+        store.close()
+
+
+def _fix_video_job(kwargs):
+    """进程池中执行的修复任务（必须是模块级函数才能被pickle）"""
+    return fix_video(**kwargs)
+
+
+def fixed_output_path(input_file):
+    """修复后的输出文件路径"""
+    path = Path(input_file)
+    return path.parent / f"{path.stem}_fixed.mp4"
+
+
+def triage_videos(video_files, cache, mode='auto'):
+    """
+    检查文件，返回需要修复的文件和对应的修复方式
+
+    Returns:
+        ([(文件, 修复方式, 问题列表)], {处理方式: 文件数})
+    """
+    to_fix = []
+    summary = {}
+    for video_file in video_files:
+        fixed = fixed_output_path(video_file)
+        try:
+            if fixed.exists() and fixed.stat().st_mtime >= video_file.stat().st_mtime:
+                summary['already_fixed'] = summary.get('already_fixed', 0) + 1
+                continue
+            result, _ = cache.classify(video_file)
+        except OSError:
+            continue
+
+        action = result['action']
+        summary[action] = summary.get(action, 0) + 1
+        if action == 'none':
+            continue
+        if action in ('redownload', 'broken'):
+            reason = '文件不完整（缺少moov）' if action == 'broken' else '缺少音频或视频流'
+            print(f"[警告] {video_file.name}: {reason}，无法修复，请重新下载")
+            continue
+        file_mode = mode
+        if mode == 'auto' and action == 'reencode':
+            file_mode = 'reencode'
+        to_fix.append((video_file, file_mode, result['issues']))
+    return to_fix, summary
+
+
+def fix_all_videos_in_directory(directory="downloads", keep_original=True, jobs=1, mode='auto', encoder='libx264',
+                                check_all=False, dry_run=False, store=None):
+    """
+    修复目录中的所有视频文件
+    
+    Args:
+        jobs: 同时修复的文件数，大于1时使用进程池并行处理
+        check_all: 不检查，修复所有文件
+        dry_run: 只检查并显示结果，不修复
+        store: 内容存储目录（见 fix_video）
+    """
     dir_path = Path(directory)
     if not dir_path.exists():
         print(f"[错误] 目录不存在: {directory}")
@@ -124,21 +257,57 @@ def fix_all_videos_in_directory(directory="downloads", keep_original=True):
         return
     
     print(f"找到 {len(video_files)} 个视频文件")
+    
+    cache = ProbeCache(str(dir_path / CACHE_FILENAME))
+    if check_all:
+        to_fix = [(f, mode, []) for f in video_files]
+    else:
+        to_fix, summary = triage_videos(video_files, cache, mode)
+        cache.save()
+        print(f"检查完成: {len(to_fix)} 个需要修复，{summary.get('none', 0)} 个正常，"
+              f"{summary.get('already_fixed', 0)} 个已修复过")
+    
+    if dry_run:
+        for video_file, file_mode, issues in to_fix:
+            print(f"  {video_file.name}: {', '.join(issues) or '未检查'} -> {file_mode}")
+        return
+    if not to_fix:
+        print("[完成] 没有需要修复的文件")
+        return
     print("-" * 50)
     
+    # 并行重新编码时平分CPU线程，避免互相争抢
+    threads = max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 else None
+    job_args = [
+        {'input_file': str(f), 'keep_original': keep_original, 'mode': file_mode, 'encoder': encoder,
+         'threads': threads, 'store': store}
+        for f, file_mode, _ in to_fix
+    ]
+    
     success_count = 0
-    for video_file in video_files:
-        print(f"\n处理: {video_file.name}")
-        if fix_video(str(video_file), keep_original=keep_original):
-            success_count += 1
-        print("-" * 50)
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for kwargs, ok in zip(job_args, pool.map(_fix_video_job, job_args)):
+                if ok:
+                    success_count += 1
+                    cache.forget(kwargs['input_file'])
+    else:
+        for kwargs in job_args:
+            print(f"\n处理: {Path(kwargs['input_file']).name}")
+            if fix_video(**kwargs):
+                success_count += 1
+                cache.forget(kwargs['input_file'])
+            print("-" * 50)
+    cache.save()
     
-    print(f"\n[完成] 成功修复 {success_count}/{len(video_files)} 个文件")
+    print(f"\n[完成] 成功修复 {success_count}/{len(to_fix)} 个文件")
 
 
-def main():
+def main(argv=None, prog=None):
     import argparse
     parser = argparse.ArgumentParser(
+        prog=prog,
         description='修复已下载的视频文件（修复MPEG-TS等问题）',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
@@ -147,6 +316,10 @@ def main():
   python fix_videos.py video.mp4          # 修复指定视频文件
   python fix_videos.py --directory my_videos  # 修复指定目录中的视频
   python fix_videos.py --replace           # 修复后替换原文件
+  python fix_videos.py --jobs 4            # 同时修复4个文件
+  python fix_videos.py --mode reencode     # 总是重新编码
+  python fix_videos.py --check             # 只检查哪些文件需要修复
+  python fix_videos.py --all               # 不检查，修复所有文件
         """
     )
     
@@ -165,22 +338,78 @@ def main():
         action='store_true',
         help='修复后替换原文件（默认保留原文件）'
     )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='同时修复的文件数 (默认: 1)'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=['auto', 'remux', 'reencode'],
+        default='auto',
+        help='auto: 先重新封装，必要时重新编码; remux: 只重新封装; reencode: 总是重新编码 (默认: auto)'
+    )
+    parser.add_argument(
+        '--encoder',
+        default='auto',
+        help='重新编码使用的H.264编码器，auto 自动检测硬件编码器 (默认: auto)'
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='只检查文件并显示需要修复的文件，不修复'
+    )
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help='跳过检查，修复所有文件（包括正常的文件）'
+    )
+    parser.add_argument(
+        '--store',
+        default=os.environ.get('YTD_CONTENT_STORE') or None,
+        help='内容存储目录，修复后的文件纳入存储（默认: 环境变量 YTD_CONTENT_STORE，未设置时不使用）'
+    )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error('--jobs 必须大于0')
     
-    if not check_ffmpeg():
+    if not args.check and not check_ffmpeg():
         print("[错误] 需要ffmpeg来修复视频文件")
         print("\n请安装ffmpeg:")
         print("  Windows: 下载 https://ffmpeg.org/download.html 并添加到PATH")
         print("  或使用: winget install ffmpeg")
         sys.exit(1)
     
+    encoder = args.encoder
+    if encoder == 'auto':
+        encoder = detect_h264_encoder() if args.mode != 'remux' and not args.check else 'libx264'
+        if args.mode != 'remux' and not args.check:
+            print(f"[信息] 使用编码器: {encoder}")
+    
     if args.file:
         # 修复单个文件
-        fix_video(args.file, keep_original=not args.replace)
+        mode = args.mode
+        if not args.all and os.path.exists(args.file):
+            result = classify_video(args.file)
+            print(f"检查结果: {', '.join(result['issues']) or '正常'}")
+            if args.check:
+                return
+            if result['action'] == 'none':
+                print("[信息] 文件正常，不需要修复（使用 --all 强制修复）")
+                return
+            if result['action'] in ('redownload', 'broken'):
+                print("[警告] 文件不完整或缺少音视频流，无法修复，请重新下载（使用 --all 强制尝试）")
+                return
+            if result['action'] == 'reencode' and mode == 'auto':
+                mode = 'reencode'
+        fix_video(args.file, keep_original=not args.replace, mode=mode, encoder=encoder, store=args.store)
     else:
         # 修复目录中的所有视频
-        fix_all_videos_in_directory(args.directory, keep_original=not args.replace)
+        fix_all_videos_in_directory(args.directory, keep_original=not args.replace,
+                                    jobs=args.jobs, mode=args.mode, encoder=encoder,
+                                    check_all=args.all, dry_run=args.check, store=args.store)
 
 
 if __name__ == "__main__":
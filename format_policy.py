@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载格式选择策略
+app.py、download_youtube.py、redownload_fixed.py 共用的格式选择规则：
+- 排除HLS流（m3u8），避免MPEG-TS封装在MP4中的问题
+- 有ffmpeg时下载分离的视频+音频并合并为mp4，没有ffmpeg时只选择同时包含音视频的单一格式
+- strict（Plan B）：总是选择单一格式，并排除format_id 96
+常用的画质组合在导入时生成，其余组合生成后缓存。
+"""
+
+import re
+import shutil
+from functools import lru_cache
+
+# 常用画质（网页和命令行的选项）
+QUALITIES = ('best', '1080p', '720p', 'worst')
+
+# 可选的视频编码偏好：yt-dlp中vcodec的匹配规则和排序写法
+CODECS = {
+    'h264': ("^(avc|h264)", 'vcodec:h264'),
+    'hevc': ("^(hvc1|hev1|h265|hevc)", 'vcodec:h265'),
+    'vp9': ("^(vp0?9)", 'vcodec:vp9'),
+    'av1': ("^(av01|av1)", 'vcodec:av01'),
+}
+
+# 默认的排序：优先mp4，其次webm，然后分辨率，相同分辨率优先H.264
+DEFAULT_FORMAT_SORT = ('ext:mp4', 'ext:webm', 'res', 'codec:h264', 'codec:vp9')
+
+QUALITY_RE = re.compile(r'^(\d{2,4})p?$')
+
+NO_HLS = '[protocol!*=m3u8]'
+STRICT_FILTER = "[protocol!*=m3u8][format_id!='96']"
+# 同时包含音视频（编码未知的格式不排除，与yt-dlp中 best 的规则一致）
+HAS_AV = '[vcodec!=?none][acodec!=?none]'
+
+
+@lru_cache(maxsize=None)
+def has_ffmpeg():
+    """ffmpeg是否可用（只检查一次）"""
+    return shutil.which('ffmpeg') is not None
+
+
+def parse_quality(quality):
+    """
+    解析画质参数
+
+    Args:
+        quality: best / worst / economy（满足要求的最小文件）/ 720p、1440p、480 等任意高度上限
+
+    Returns:
+        (mode, height)：mode 为 best/worst/economy，height 为高度上限（None表示不限制）；
+        无法识别时抛出 ValueError
+    """
+    quality = str(quality or 'best').strip().lower()
+    if quality in ('best', 'worst', 'economy'):
+        return quality, None
+    mode = 'best'
+    if quality.startswith('economy-'):
+        mode, quality = 'economy', quality[len('economy-'):]
+    match = QUALITY_RE.match(quality)
+    if not match or not 144 <= int(match.group(1)) <= 4320:
+        raise ValueError(f'不支持的画质: {quality}')
+    return mode, int(match.group(1))
+
+
+def quality_arg(value):
+    """argparse 的 type：检查画质参数"""
+    import argparse
+    try:
+        parse_quality(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def policy_key(quality='best', codec=None, single=False):
+    """格式策略的唯一标识（用于下载去重等），single 表示只选择单一文件格式"""
+    mode, height = parse_quality(quality)
+    return f"{mode}-{height or 'any'}-{codec or 'auto'}{'-single' if single else ''}"
+
+
+def format_options(quality='best', merge=None, strict=False, codec=None):
+    """
+    生成yt-dlp的格式相关选项
+
+    Args:
+        quality: 画质，见 parse_quality
+        merge: 是否允许下载分离的音视频再合并，None表示有ffmpeg时允许
+        strict: Plan B，只选择单一格式并排除format_id 96
+        codec: 优先的视频编码 h264/hevc/vp9/av1（vp9/av1相同画质下文件更小）
+
+    Returns:
+        {'format': ..., 'format_sort': [...], 'merge_output_format': 'mp4'（合并时）}
+    """
+    if codec is not None and codec not in CODECS:
+        raise ValueError(f'不支持的编码: {codec}')
+    if merge is None:
+        merge = has_ffmpeg()
+    mode, height = parse_quality(quality)
+    options = _build_options(mode, height, bool(merge) and not strict, strict, codec)
+    # 返回副本，调用方可以修改
+    return {key: list(value) if isinstance(value, tuple) else value for key, value in options.items()}
+
+
+@lru_cache(maxsize=256)
+def _build_options(mode, height, merge, strict, codec):
+    cap = f'[height<={height}]' if height else ''
+    protocol = STRICT_FILTER if strict else NO_HLS
+    codec_filter = f"[vcodec~='{CODECS[codec][0]}']" if codec else ''
+
+    if mode == 'economy':
+        # 按分辨率（不超过上限）取最高，同分辨率下选文件最小的格式
+        format_sort = (f'res:{height}' if height else 'res', '+size', '+br')
+        if merge:
+            selector = f'bv*{cap}{protocol}+ba{protocol}/b{cap}{protocol}'
+        else:
+            selector = f'b{cap}{protocol}{HAS_AV}'
+    else:
+        pick = 'worst' if mode == 'worst' else 'best'
+        format_sort = DEFAULT_FORMAT_SORT
+        alternatives = []
+        if codec:
+            format_sort = (CODECS[codec][1],) + DEFAULT_FORMAT_SORT
+        if merge and pick == 'best':
+            if codec:
+                alternatives.append(f'bestvideo{cap}{codec_filter}{protocol}+bestaudio{protocol}')
+            alternatives += [
+                f'bestvideo{cap}[ext=mp4]{protocol}+bestaudio[ext=m4a]{protocol}',
+                f'bestvideo{cap}[ext=webm]{protocol}+bestaudio[ext=webm]{protocol}',
+                f'best{cap}[ext=mp4]{protocol}',
+                f'best{cap}[ext=webm]{protocol}',
+                f'best{cap}{protocol}',
+            ]
+        else:
+            # 单一格式必须同时包含音视频；合并模式下的worst本来就选择单一格式
+            av = '' if merge else HAS_AV
+            if codec:
+                alternatives.append(f'{pick}{cap}{codec_filter}{protocol}{av}')
+            alternatives += [
+                f'{pick}{cap}[ext=mp4]{protocol}{av}',
+                f'{pick}{cap}[ext=webm]{protocol}{av}',
+                f'{pick}{cap}{protocol}{av}',
+            ]
+        selector = '/'.join(alternatives)
+
+    options = {'format': selector, 'format_sort': format_sort}
+    if merge:
+        options['merge_output_format'] = 'mp4'
+    return options
+
+
+def _warm_up():
+    for quality in QUALITIES:
+        for merge in (True, False):
+            _build_options(*parse_quality(quality), merge, False, None)
+        _build_options(*parse_quality(quality), False, True, None)
+
+
+_warm_up()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量获取视频信息（/api/info/batch）
+前端一次预览几十到几百个链接时，逐个请求 /api/info 每个都要占用一个网页线程等待解析。
+这里用所有批次共用的线程池并发解析，哪个先解析完就先返回哪个：
+- 缓存中已有的链接直接返回，不占用解析线程
+- 每个批次同时解析的链接数有上限，一个很大的批次不会占满线程池，其他批次和 /api/info 仍能及时得到结果
+- 单个链接从开始解析起超过超时时间就返回超时错误，不再等待；解析线程无法中断，
+  仍在后台完成解析并写入缓存，稍后再次请求时直接命中缓存。后台解析完成前仍占用该批次的名额，
+  超时很多的批次不会因此占满线程池
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# 有链接还在线程池中排队（尚未开始解析，没有截止时间）时，检查的间隔（秒）
+POLL_INTERVAL = 0.2
+
+# 单个批次默认最多占用的解析线程比例
+PER_BATCH_SHARE = 0.5
+
+
+class BatchInfoResolver:
+    """
+    并发解析多个链接的视频信息
+
+    Args:
+        resolve: resolve(url)，返回视频信息（失败时为 {'success': False, 'error': ...}）
+        cached: cached(url)，返回缓存中的视频信息，没有时返回None；为None时都交给 resolve
+        workers: 所有批次共用的解析线程数
+        per_batch: 单个批次同时解析的链接数（包括已超时、仍在后台解析的链接），默认为 workers 的 PER_BATCH_SHARE
+        timeout: 单个链接的默认解析超时（秒）
+    """
+
+    def __init__(self, resolve, cached=None, workers=8, per_batch=None, timeout=30.0):
+        self.resolve = resolve
+        self.cached = cached
+        self.workers = workers
+        self.per_batch = per_batch or max(1, int(workers * PER_BATCH_SHARE))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='info-batch')
+        self._lock = threading.Lock()
+        self._running = 0
+
+    def iter_results(self, urls, timeout=None):
+        """
+        按完成顺序逐个生成解析结果
+
+        Args:
+            urls: 链接列表
+            timeout: 单个链接的解析超时（秒），为None时使用默认值
+
+        Yields:
+            (序号, 链接, 视频信息)；超时的链接为 {'success': False, 'error': ..., 'timeout': True}
+        """
+        timeout = self.timeout if timeout is None else timeout
+        queue = deque()
+        # 缓存中已有的先全部返回
+        for index, url in enumerate(urls):
+            info = self.cached(url) if self.cached else None
+            if info is not None:
+                yield index, url, info
+            else:
+                queue.append((index, url))
+        # future -> (序号, 链接, {'started': 开始解析的时间})
+        pending = {}
+        # 已经返回超时、仍在后台解析的链接，完成前继续占用本批次的名额
+        abandoned = set()
+        try:
+            while queue or pending:
+                abandoned = {future for future in abandoned if not future.done()}
+                while queue and len(pending) + len(abandoned) < self.per_batch:
+                    index, url = queue.popleft()
+                    # 批次中重复的链接可能已经解析完成
+                    info = self.cached(url) if self.cached else None
+                    if info is not None:
+                        yield index, url, info
+                        continue
+                    state = {}
+                    pending[self._executor.submit(self._run, url, state)] = (index, url, state)
+                if not pending:
+                    if queue:
+                        # 名额都被超时的链接占用，等其中一个完成
+                        wait(abandoned, return_when=FIRST_COMPLETED)
+                    continue
+
+                done, _ = wait(set(pending) | abandoned, timeout=self._wait_time(pending, timeout),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future not in pending:
+                        continue
+                    index, url, _ = pending.pop(future)
+                    try:
+                        info = future.result()
+                    except Exception as e:
+                        info = {'success': False, 'error': str(e)}
+                    yield index, url, info
+
+                now = time.monotonic()
+                for future, (index, url, state) in list(pending.items()):
+                    if 'started' in state and now - state['started'] >= timeout:
+                        del pending[future]
+                        abandoned.add(future)
+                        yield index, url, {'success': False, 'error': f'解析超时（{timeout:g}秒）', 'timeout': True}
+        finally:
+            # 客户端断开或批次结束：还没开始解析的链接不再解析
+            for future in pending:
+                future.cancel()
+
+    def stats(self):
+        """正在解析的链接数和线程数"""
+        with self._lock:
+            return {'running': self._running, 'workers': self.workers}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, url, state):
+        state['started'] = time.monotonic()
+        with self._lock:
+            self._running += 1
+        try:
+            return self.resolve(url)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    @staticmethod
+    def _wait_time(pending, timeout):
+        """等到最早的截止时间；有链接还在排队时最多等 POLL_INTERVAL（开始解析后才有截止时间）"""
+        started = [state['started'] for _, _, state in pending.values() if 'started' in state]
+        wait_time = max(0.0, min(started) + timeout - time.monotonic()) if started else POLL_INTERVAL
+        if len(started) < len(pending):
+            wait_time = min(wait_time, POLL_INTERVAL)
+        return wait_time
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多个下载节点的任务租约
+下载节点领取任务时获得 YTD_LEASE_TTL 秒的租约，下载期间定期发送心跳续约；
+节点崩溃或断网后租约过期，任务重新排队，由其他节点领取（下载目录在共享存储上时继续使用 .part 文件）。
+原来的节点恢复后从心跳结果得知任务已被重新分配，停止下载且不再写入该任务的状态；
+超过半个租约时长没有续约成功（进程被挂起、网络中断）时，下载进度回调先同步发送心跳确认，再继续写入文件。
+"""
+
+import threading
+import time
+
+
+class LeaseLostError(Exception):
+    """任务的租约已过期，已被重新分配给其他节点"""
+
+
+class _Periodic:
+    """后台定期执行 run_once() 的线程"""
+    name = 'periodic'
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[警告] {self.name} 失败: {e}")
+            self._stop.wait(self.interval)
+
+
+class LeaseKeeper(_Periodic):
+    """
+    下载节点的心跳：每 ttl/3 秒为正在下载的任务续约，并记录节点信息（/api/queue 中显示）
+
+    Args:
+        store: 任务存储
+        node: 节点名（任务的 worker 字段）
+        running: 返回本节点正在下载的任务ID的函数
+        ttl: 租约时长（秒）
+        info: 返回节点信息字典的函数（下载线程数等），可以为None
+    """
+    name = 'lease-keeper'
+
+    def __init__(self, store, node, running, ttl, info=None):
+        super().__init__(ttl / 3)
+        self.store = store
+        self.node = node
+        self.running = running
+        self.ttl = ttl
+        self.info = info
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._beat_lock = threading.Lock()
+        self._renewed_at = time.monotonic()
+
+    def run_once(self):
+        """发送一次心跳，返回新发现的已被重新分配的任务ID"""
+        with self._beat_lock:
+            return self._beat()
+
+    def _beat(self):
+        started = time.monotonic()
+        task_ids = list(self.running())
+        lost = self.store.heartbeat(self.node, task_ids, self.ttl, info=self.info() if self.info else None)
+        self._renewed_at = started
+        # 心跳期间已经结束的任务不算
+        lost = set(lost) & set(self.running())
+        if lost:
+            self._mark_lost(lost)
+        return lost
+
+    def is_lost(self, task_id):
+        with self._lock:
+            return task_id in self._lost
+
+    def check(self, task_id):
+        """
+        任务已被重新分配时抛出 LeaseLostError（在下载进度回调中调用，中止下载）
+        心跳线程长时间没有续约成功时先同步发送心跳（心跳线程正在发送时等待其结果），
+        租约可能已过期时不再继续写入
+        """
+        if self._thread is not None and time.monotonic() - self._renewed_at > self.ttl / 2:
+            with self._beat_lock:
+                if time.monotonic() - self._renewed_at > self.ttl / 2:
+                    self._beat()
+        if self.is_lost(task_id):
+            raise LeaseLostError(f'任务 {task_id} 的租约已过期，已由其他节点下载')
+
+    def holds(self, task_id):
+        """写入最终状态前向任务存储确认任务仍由本节点下载（没有启动心跳时总是True）"""
+        if self._thread is None:
+            return True
+        if self.is_lost(task_id):
+            return False
+        task = self.store.get(task_id)
+        if task is not None and task.get('status') == 'downloading' and task.get('worker') == self.node:
+            return True
+        self._mark_lost({task_id})
+        return False
+
+    def confirm(self, task_id):
+        """同 holds()，不再属于本节点时抛出 LeaseLostError"""
+        if not self.holds(task_id):
+            raise LeaseLostError(f'任务 {task_id} 的租约已过期，已由其他节点下载')
+
+    def forget(self, task_id):
+        """任务在本节点结束"""
+        with self._lock:
+            self._lost.discard(task_id)
+
+    def _mark_lost(self, task_ids):
+        with self._lock:
+            new = set(task_ids) - self._lost
+            self._lost |= new
+        if new:
+            print(f"[警告] 任务租约已过期并被重新分配，停止下载: {', '.join(sorted(new))}")
+
+
+class LeaseReaper(_Periodic):
+    """
+    定期把租约过期（节点失去响应）的任务重新排队
+
+    Args:
+        store: 任务存储
+        interval: 检查间隔（秒）
+        on_reassigned: 重新排队后的回调 on_reassigned(tasks)，可以为None
+    """
+    name = 'lease-reaper'
+
+    def __init__(self, store, interval, on_reassigned=None):
+        super().__init__(interval)
+        self.store = store
+        self.on_reassigned = on_reassigned
+
+    def run_once(self):
+        tasks = self.store.reassign_expired()
+        for task in tasks:
+            print(f"[信息] 下载节点 {task.get('previous_worker')} 的租约已过期，任务 {task['task_id']} 重新排队")
+        if tasks and self.on_reassigned:
+            self.on_reassigned(tasks)
+        return tasks
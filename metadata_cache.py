@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频元数据缓存
+按视频ID（或规范化后的URL）缓存yt-dlp的extract_info结果，
+避免同一个链接反复解析。内存LRU + 可选的SQLite磁盘缓存，均带TTL。
+"""
+
+import copy
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# YouTube视频ID的常见位置
+_YOUTUBE_ID_PATTERNS = [
+    re.compile(r'(?:youtube\.com|youtube-nocookie\.com)/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/)([0-9A-Za-z_-]{11})'),
+    re.compile(r'youtu\.be/([0-9A-Za-z_-]{11})'),
+]
+
+# 不影响内容的跟踪参数
+_TRACKING_PARAMS = {'si', 'feature', 'pp', 'fbclid', 'gclid'}
+
+
+def extract_video_id(url):
+    """从YouTube链接中提取视频ID，无法识别时返回None"""
+    for pattern in _YOUTUBE_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
+
+def normalize_url(url):
+    """规范化URL：小写协议和域名，去掉锚点和跟踪参数，参数排序"""
+    parts = urlsplit(url.strip())
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if k not in _TRACKING_PARAMS and not k.startswith('utm_')]
+    query.sort()
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+def cache_key(url):
+    """缓存键：优先使用视频ID，同一视频的不同链接形式共享缓存"""
+    video_id = extract_video_id(url)
+    if video_id:
+        return f'youtube:{video_id}'
+    return f'url:{normalize_url(url)}'
+
+
+class MetadataCache:
+    """
+    元数据缓存
+
+    Args:
+        max_entries: 内存中最多缓存的条目数（LRU淘汰）
+        ttl: 缓存有效期（秒）。视频的下载地址会过期，不宜设置过长
+        db_path: SQLite缓存文件路径，为None时只使用内存缓存
+        max_disk_entries: 磁盘缓存最多保存的条目数
+    """
+
+    def __init__(self, max_entries=128, ttl=1800, db_path=None, max_disk_entries=10000):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stats = {'hits': 0, 'misses': 0, 'memory_hits': 0, 'disk_hits': 0, 'evictions': 0}
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                'key TEXT PRIMARY KEY, info TEXT NOT NULL, created REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS idx_metadata_created ON metadata(created)')
+            self._db.commit()
+
+    def get(self, url, count_miss=True):
+        """
+        读取缓存，未命中或已过期返回None
+        count_miss 为False时未命中不计入统计（随后还会通过 get_or_extract 读取，避免重复计数）
+        """
+        key = cache_key(url)
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                created, info = item
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(info)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute('SELECT info, created FROM metadata WHERE key = ?', (key,)).fetchone()
+                if row and now - row[1] < self.ttl:
+                    info = json.loads(row[0])
+                    self._remember(key, row[1], info)
+                    self._stats['hits'] += 1
+                    self._stats['disk_hits'] += 1
+                    return copy.deepcopy(info)
+                if row:
+                    self._db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+                    self._db.commit()
+
+            if count_miss:
+                self._stats['misses'] += 1
+            return None
+
+    def put(self, url, info):
+        """写入缓存（info需要能被JSON序列化，建议先经过YoutubeDL.sanitize_info）"""
+        key = cache_key(url)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, copy.deepcopy(info))
+            if self._db is not None:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO metadata (key, info, created) VALUES (?, ?, ?)',
+                    (key, json.dumps(info, ensure_ascii=False), now)
+                )
+                self._db.execute(
+                    'DELETE FROM metadata WHERE key IN ('
+                    'SELECT key FROM metadata ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                    (self.max_disk_entries,)
+                )
+                self._db.commit()
+
+    def get_or_extract(self, url, extractor):
+        """
+        读取缓存，未命中时调用 extractor(url) 获取并写入缓存
+        同一个视频同时只会解析一次，其他请求等待结果
+        """
+        info = self.get(url)
+        if info is not None:
+            return info
+
+        key = cache_key(url)
+        with self._lock:
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not owner:
+            event.wait()
+            info = self.get(url)
+            if info is not None:
+                return info
+            # 另一个请求解析失败，自己再试一次
+            return self._extract_and_store(url, extractor)
+
+        try:
+            return self._extract_and_store(url, extractor)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def invalidate(self, url):
+        """删除某个链接的缓存"""
+        key = cache_key(url)
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute('DELETE FROM metadata WHERE key = ?', (key,))
+                self._db.commit()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM metadata')
+                self._db.commit()
+
+    def stats(self):
+        """命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._memory)
+            stats['max_entries'] = self.max_entries
+            stats['ttl'] = self.ttl
+            stats['disk'] = self._db is not None
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+            return stats
+
+    def _extract_and_store(self, url, extractor):
+        info = extractor(url)
+        self.put(url, info)
+        return copy.deepcopy(info)
+
+    def _remember(self, key, created, info):
+        self._memory[key] = (created, info)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats['evictions'] += 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+播放列表/频道展开
+按需逐条展开播放列表中的视频（生成器），不会一次性解析整个列表。
+"""
+
+# 频道 -> 标签页 -> 播放列表 这样的嵌套最多展开几层
+MAX_DEPTH = 3
+
+# 一个链接最多再请求几次嵌套的条目（频道的各个播放列表等），超过后其余条目不展开，下载时再由yt-dlp处理
+MAX_EXPANSIONS = 50
+
+
+def iter_playlist_entries(url, max_items=None, ydl_opts=None):
+    """
+    逐条生成播放列表中的视频
+
+    Args:
+        url: 视频、播放列表或频道链接
+        max_items: 最多生成的条目数，None表示不限制
+        ydl_opts: 额外的yt-dlp选项
+
+    Yields:
+        {'url': 视频链接, 'id': 视频ID, 'title': 标题}；单个视频链接只生成一条
+    """
+    import yt_dlp
+    opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+        'lazy_playlist': True,
+    }
+    if ydl_opts:
+        opts.update(ydl_opts)
+
+    count = 0
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        for entry in _walk(ydl, url, 0, {'expansions': MAX_EXPANSIONS}):
+            yield entry
+            count += 1
+            if max_items is not None and count >= max_items:
+                return
+
+
+def _walk(ydl, url, depth, budget):
+    info = ydl.extract_info(url, download=False, process=False)
+    if info is not None:
+        yield from _walk_info(ydl, info, url, depth, budget)
+
+
+def _walk_info(ydl, info, url, depth, budget):
+    result_type = info.get('_type', 'video')
+    if result_type in ('url', 'url_transparent') and depth < MAX_DEPTH:
+        yield from _walk(ydl, info['url'], depth + 1, budget)
+        return
+    if result_type not in ('playlist', 'multi_video'):
+        yield _entry(info, url)
+        return
+
+    # entries 是生成器/惰性列表，逐页获取
+    for entry in info.get('entries') or ():
+        if not entry:
+            continue
+        entry_type = entry.get('_type', 'video')
+        entry_url = entry.get('url') or entry.get('webpage_url')
+        if entry_type in ('playlist', 'multi_video') and entry.get('entries') is not None:
+            yield from _walk_info(ydl, entry, entry_url, depth + 1, budget)
+        elif entry_type in ('url', 'url_transparent') and entry_url and depth < MAX_DEPTH \
+                and budget['expansions'] > 0 and _is_playlist(ydl, entry, entry_url):
+            budget['expansions'] -= 1
+            yield from _walk(ydl, entry_url, depth + 1, budget)
+        elif entry_url:
+            yield _entry(entry, entry_url)
+
+
+def _is_playlist(ydl, entry, url):
+    """
+    根据提取器判断条目是否需要展开（不访问网络）：
+    提取器声明是单个视频时不展开；没有专门的提取器（只有Generic能处理）时也不展开，下载时再由yt-dlp处理；
+    其余（播放列表、频道标签页等没有声明返回类型的提取器）展开
+    """
+    ie = _extractor(ydl, entry, url)
+    if ie is None:
+        return False
+    try:
+        return not ie.is_single_video(url)
+    except Exception:
+        return True
+
+
+def _extractor(ydl, entry, url):
+    """处理条目链接的提取器：有 ie_key 时使用它，否则按顺序查找；只有Generic能处理时返回None"""
+    ie_key = entry.get('ie_key')
+    if ie_key == 'Generic':
+        return None
+    if ie_key:
+        try:
+            return ydl.get_info_extractor(ie_key)
+        except Exception:
+            return None
+    from yt_dlp.extractor import gen_extractor_classes
+    for ie in gen_extractor_classes():
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            return ie
+    return None
+
+
+def _entry(info, fallback_url):
+    return {
+        'url': info.get('webpage_url') or info.get('url') or fallback_url,
+        'id': info.get('id'),
+        'title': info.get('title'),
+    }
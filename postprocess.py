@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载后的处理流水线
+文件下载完成后依次经过各个阶段：
+- merge：合并分别下载的视频和音频（.fNNN.ext）
+- verify：检查文件（文件不完整、缺少视频流时任务失败）
+- remux：MPEG-TS封装在MP4中、moov不在文件开头时重新封装（faststart，不重新编码）
+- transcode：重新编码为H.264 MP4（只在下载时指定 transcode 的任务上执行）
+- thumbnail：截取一帧作为缩略图（保存在下载目录的 .thumbnails 中）
+- checksum：计算SHA-256
+每个阶段有自己的有界线程池（ffmpeg在子进程中运行），与下载线程池分开：下载线程在文件下载完成后立即返回，
+ffmpeg的工作不占用下载名额，下载并发数按网络、各阶段的并发数按CPU分别调整。
+merge和verify失败时任务失败；其余阶段失败时保留原文件，记录警告后继续。
+"""
+
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+from content_store import file_checksum
+from ffmpeg_commands import build_command, detect_h264_encoder
+from format_policy import has_ffmpeg
+from video_probe import classify_video, probe_video
+
+STAGES = ('merge', 'verify', 'remux', 'transcode', 'thumbnail', 'checksum')
+
+# 默认启用的阶段（merge在有分别下载的文件时总是执行；transcode由任务选项决定）
+DEFAULT_STAGES = ('verify', 'remux', 'thumbnail', 'checksum')
+
+# 各阶段的默认并发数
+DEFAULT_WORKERS = {'merge': 2, 'verify': 2, 'remux': 2, 'transcode': 1, 'thumbnail': 1, 'checksum': 2}
+
+# 需要ffmpeg的阶段，没有ffmpeg时跳过
+FFMPEG_STAGES = ('merge', 'remux', 'transcode', 'thumbnail')
+
+# 失败时任务失败的阶段
+REQUIRED_STAGES = ('merge', 'verify')
+
+# 各阶段对应的任务阶段（/api/status 的 phase）
+STAGE_PHASES = {
+    'merge': 'merging',
+    'verify': 'verifying',
+    'remux': 'remuxing',
+    'transcode': 'transcoding',
+    'thumbnail': 'thumbnailing',
+    'checksum': 'checksumming',
+}
+
+# 缩略图目录（在视频所在的目录中）和宽度
+THUMBNAIL_DIR = '.thumbnails'
+THUMBNAIL_WIDTH = 320
+
+# 需要重新封装（不重新编码）的问题
+REMUX_ISSUES = ('mpegts_in_mp4', 'no_faststart')
+
+# 会替换原文件的阶段：文件正在被读取（边下载边传输）时推迟
+REPLACING_STAGES = ('remux', 'transcode')
+
+# 推迟的检查间隔（秒）和最多推迟的次数，超过后跳过该阶段
+POSTPONE_INTERVAL = 5.0
+MAX_POSTPONES = 120
+
+
+class StageError(Exception):
+    """处理阶段失败"""
+
+
+def parse_stages(value):
+    """
+    解析启用的阶段（逗号分隔，如 "verify,checksum"；空字符串表示都不启用）
+
+    Returns:
+        阶段元组；有无法识别的阶段时抛出 ValueError
+    """
+    stages = tuple(s.strip() for s in (value or '').split(',') if s.strip())
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"未知的阶段: {', '.join(unknown)}，可选: {', '.join(STAGES)}")
+    return stages
+
+
+def parse_stage_workers(value):
+    """
+    解析各阶段的并发数（如 "transcode=2,merge=1"），未指定的阶段使用默认值
+
+    Returns:
+        {阶段: 并发数}；格式错误时抛出 ValueError
+    """
+    workers = dict(DEFAULT_WORKERS)
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        stage, _, count = item.partition('=')
+        stage = stage.strip()
+        if stage not in STAGES:
+            raise ValueError(f"未知的阶段: {stage}，可选: {', '.join(STAGES)}")
+        try:
+            workers[stage] = max(1, int(count))
+        except ValueError:
+            raise ValueError(f'{stage} 的并发数必须是整数: {count}')
+    return workers
+
+
+def part_filename(filename, fmt):
+    """分别下载的格式的文件名，与yt-dlp相同：'Title.mp4' -> 'Title.f137.mp4'"""
+    return f"{os.path.splitext(filename)[0]}.f{fmt['format_id']}.{fmt['ext']}"
+
+
+def download_parts(ydl, info):
+    """
+    分别下载 info['requested_formats'] 中的各个格式（视频、音频），不在yt-dlp中合并
+    （合并由流水线的merge阶段执行）。合并后的文件已存在时不下载。
+
+    Args:
+        ydl: YoutubeDL
+        info: process_ie_result(..., download=False) 的结果
+
+    Returns:
+        [{'path', 'vcodec', 'acodec'}]，合并后的文件已存在时为空列表
+    """
+    from yt_dlp.networking.exceptions import network_exceptions
+    from yt_dlp.utils import ContentTooShortError, DownloadError
+
+    filename = ydl.prepare_filename(info)
+    if os.path.exists(filename) and not ydl.params.get('overwrites'):
+        return []
+    parts = []
+    for fmt in info['requested_formats']:
+        part_info = dict(info)
+        del part_info['requested_formats']
+        part_info.update(fmt)
+        path = part_filename(filename, fmt)
+        try:
+            success, _ = ydl.dl(path, part_info)
+        except (network_exceptions, ContentTooShortError) as err:
+            # 与yt-dlp自己下载时相同，report_error 抛出DownloadError（保留原始异常，用于判断能否重试）；
+            # 设置了 ignoreerrors 时不抛出，按下载失败处理
+            ydl.report_error(f'unable to download video data: {err}')
+            success = False
+        if not success:
+            raise DownloadError(f"格式 {fmt['format_id']} 下载失败")
+        parts.append({'path': path, 'vcodec': fmt.get('vcodec'), 'acodec': fmt.get('acodec')})
+    return parts
+
+
+def thumbnail_path(path):
+    """视频文件的缩略图路径"""
+    path = Path(path)
+    return path.parent / THUMBNAIL_DIR / f'{path.name}.jpg'
+
+
+@lru_cache(maxsize=None)
+def h264_encoder():
+    """重新编码使用的H.264编码器（优先硬件编码器，只检测一次）"""
+    return detect_h264_encoder()
+
+
+def temp_filename(path, ext=None):
+    """处理过程中的输出文件，与yt-dlp后处理的 .temp.ext 相同，完成后再替换"""
+    path = Path(path)
+    return path.with_name(f'{path.stem}.temp.{ext or path.suffix.lstrip(".")}')
+
+
+def run_ffmpeg(cmd):
+    """运行ffmpeg，失败时抛出 StageError（包含最后一行错误信息）"""
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, encoding='utf-8', errors='replace')
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if line.strip()]
+        raise StageError(f"ffmpeg失败: {lines[-1] if lines else result.returncode}")
+
+
+def replace_output(temp, path):
+    """用处理后的文件替换原文件（失败时删除临时文件）"""
+    try:
+        os.replace(temp, path)
+    except OSError:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+
+class PostProcessJob:
+    """
+    一个任务的处理过程
+
+    Args:
+        task_id: 任务ID
+        filepath: 最终文件路径（有parts时为合并后的文件）
+        parts: 分别下载的文件 [{'path', 'vcodec', 'acodec'}]
+        options: 任务的下载选项（transcode 等）
+        context: 调用方需要在结束时使用的数据（开始时间、下载目录等）
+    """
+
+    def __init__(self, task_id, filepath, parts=None, options=None, context=None):
+        self.task_id = task_id
+        self.filepath = str(filepath)
+        self.parts = parts or []
+        self.options = options or {}
+        self.context = context or {}
+        self.stages = []
+        self.issues = None
+        self.fields = {}
+        self.warnings = []
+        self.postponed = 0
+
+
+class PostProcessPipeline:
+    """
+    下载后的处理流水线
+
+    Args:
+        stages: 启用的阶段（merge在有分别下载的文件时总是执行，transcode在任务选项中指定时执行）
+        workers: {阶段: 并发数}
+        on_stage: 阶段开始时的回调 on_stage(task_id, stage, index, count)
+        on_done: 处理结束的回调 on_done(job, error)，error 为None表示成功
+        on_timing: 阶段耗时的回调 on_timing(stage, seconds)，可以为None
+        busy: busy(job) 返回True时文件正在被读取，推迟 REPLACING_STAGES 中的阶段（替换文件会破坏正在传输的内容）；
+              推迟 MAX_POSTPONES 次后跳过该阶段。可以为None
+    """
+
+    def __init__(self, stages=DEFAULT_STAGES, workers=None, on_stage=None, on_done=None, on_timing=None,
+                 busy=None):
+        self.enabled = set(stages) | {'merge', 'transcode'}
+        self.workers = dict(DEFAULT_WORKERS, **(workers or {}))
+        self.on_stage = on_stage
+        self.on_done = on_done
+        self.on_timing = on_timing
+        self.busy = busy
+        self._pools = {
+            stage: ThreadPoolExecutor(max_workers=self.workers[stage], thread_name_prefix=f'postprocess-{stage}')
+            for stage in STAGES
+        }
+        self._handlers = {
+            'merge': self._merge,
+            'verify': self._verify,
+            'remux': self._remux,
+            'transcode': self._transcode,
+            'thumbnail': self._thumbnail,
+            'checksum': self._checksum,
+        }
+        self._jobs = {}
+        self._queued = dict.fromkeys(STAGES, 0)
+        self._running = dict.fromkeys(STAGES, 0)
+        self._cond = threading.Condition()
+
+    def plan(self, job):
+        """任务要经过的阶段"""
+        stages = []
+        for stage in STAGES:
+            if stage not in self.enabled:
+                continue
+            if stage == 'merge' and not job.parts:
+                continue
+            if stage == 'transcode' and not job.options.get('transcode'):
+                continue
+            if stage in FFMPEG_STAGES and not has_ffmpeg():
+                continue
+            stages.append(stage)
+        return stages
+
+    def submit(self, job):
+        """
+        开始处理；没有要执行的阶段时立即调用 on_done
+
+        Returns:
+            要执行的阶段列表
+        """
+        job.stages = self.plan(job)
+        if job.parts and 'merge' not in job.stages:
+            raise StageError('合并分别下载的视频和音频需要ffmpeg')
+        with self._cond:
+            self._jobs[job.task_id] = job
+        self._next(job, 0)
+        return list(job.stages)
+
+    def active_tasks(self):
+        """正在处理（包括等待某个阶段）的任务ID"""
+        with self._cond:
+            return list(self._jobs)
+
+    def stats(self):
+        """各阶段的并发数、等待和处理中的任务数"""
+        with self._cond:
+            return {
+                stage: {'workers': self.workers[stage], 'queued': self._queued[stage], 'running': self._running[stage]}
+                for stage in STAGES
+            }
+
+    def drain(self, timeout=None):
+        """
+        等待处理中的任务结束，之后不再接收新任务
+
+        Returns:
+            超时后仍未完成的任务数
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._jobs:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            left = len(self._jobs)
+        for pool in self._pools.values():
+            pool.shutdown(wait=False)
+        return left
+
+    def _next(self, job, index):
+        if index >= len(job.stages):
+            self._finish(job, None)
+            return
+        stage = job.stages[index]
+        if stage in REPLACING_STAGES and self.busy is not None and self._is_busy(job):
+            if job.postponed < MAX_POSTPONES:
+                job.postponed += 1
+                timer = threading.Timer(POSTPONE_INTERVAL, self._next, (job, index))
+                timer.daemon = True
+                timer.start()
+                return
+            job.warnings.append(f'{stage}: 文件一直在被读取，已跳过')
+            print(f"[警告] 任务 {job.task_id} 的文件一直在被读取，跳过 {stage} 阶段")
+            self._next(job, index + 1)
+            return
+        with self._cond:
+            self._queued[stage] += 1
+        self._pools[stage].submit(self._run, job, index)
+
+    def _is_busy(self, job):
+        try:
+            return bool(self.busy(job))
+        except Exception as e:
+            print(f"[警告] 检查任务 {job.task_id} 的文件是否正在被读取失败: {e}")
+            return False
+
+    def _run(self, job, index):
+        stage = job.stages[index]
+        with self._cond:
+            self._queued[stage] -= 1
+            self._running[stage] += 1
+        started = time.perf_counter()
+        error = None
+        try:
+            if self.on_stage:
+                self.on_stage(job.task_id, stage, index, len(job.stages))
+            self._handlers[stage](job)
+        except Exception as e:
+            if stage in REQUIRED_STAGES:
+                error = e
+            else:
+                job.warnings.append(f'{stage}: {e}')
+                print(f"[警告] 任务 {job.task_id} 的 {stage} 阶段失败（保留原文件）: {e}")
+        finally:
+            with self._cond:
+                self._running[stage] -= 1
+            if self.on_timing:
+                self.on_timing(stage, time.perf_counter() - started)
+        if error is not None:
+            self._finish(job, error)
+        else:
+            self._next(job, index + 1)
+
+    def _finish(self, job, error):
+        try:
+            if self.on_done:
+                self.on_done(job, error)
+        except Exception as e:
+            print(f"[警告] 任务 {job.task_id} 处理结束后更新状态失败: {e}")
+        finally:
+            with self._cond:
+                self._jobs.pop(job.task_id, None)
+                self._cond.notify_all()
+
+    def _merge(self, job):
+        """合并视频和音频（-c copy），完成后删除分别下载的文件"""
+        output = job.filepath
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y']
+        maps = []
+        for i, part in enumerate(job.parts):
+            cmd += ['-i', part['path']]
+            # 编码未知（None）时也可能没有这种流，使用可选的映射
+            if part.get('vcodec') != 'none':
+                maps += ['-map', f'{i}:v:0?']
+            if part.get('acodec') != 'none':
+                maps += ['-map', f'{i}:a:0?']
+        cmd += maps + ['-c', 'copy']
+        if Path(output).suffix.lower() in ('.mp4', '.m4v', '.mov'):
+            cmd += ['-movflags', '+faststart']
+        temp = temp_filename(output)
+        run_ffmpeg(cmd + [str(temp)])
+        replace_output(temp, output)
+        for part in job.parts:
+            Path(part['path']).unlink(missing_ok=True)
+
+    def _verify(self, job):
+        """检查文件，文件不完整或缺少视频流时失败；发现的问题供remux阶段使用"""
+        if not os.path.isfile(job.filepath):
+            raise StageError('下载的文件不存在')
+        result = classify_video(job.filepath)
+        job.issues = result['issues']
+        if result['action'] == 'broken':
+            raise StageError('文件不完整（缺少moov）')
+        if 'missing_video' in result['issues']:
+            raise StageError('文件中没有视频流')
+        if result['issues']:
+            job.fields['issues'] = result['issues']
+
+    def _remux(self, job):
+        """MP4文件中是MPEG-TS、或moov不在文件开头时重新封装（不重新编码）"""
+        issues = job.issues if job.issues is not None else classify_video(job.filepath)['issues']
+        if not any(issue in REMUX_ISSUES for issue in issues):
+            return
+        temp = temp_filename(job.filepath)
+        run_ffmpeg(build_command(job.filepath, str(temp), 'remux', probe=probe_video(job.filepath)))
+        replace_output(temp, job.filepath)
+        job.fields['remuxed'] = True
+        remaining = [issue for issue in issues if issue not in REMUX_ISSUES]
+        if remaining:
+            job.fields['issues'] = remaining
+        else:
+            job.fields.pop('issues', None)
+
+    def _transcode(self, job):
+        """重新编码为H.264/AAC的MP4（原文件不是mp4时替换为 .mp4 文件）"""
+        source = Path(job.filepath)
+        output = source.with_suffix('.mp4')
+        temp = temp_filename(output)
+        threads = max(1, (os.cpu_count() or 1) // self.workers['transcode'])
+        run_ffmpeg(build_command(str(source), str(temp), 'reencode', h264_encoder(), threads))
+        replace_output(temp, output)
+        if output != source:
+            source.unlink(missing_ok=True)
+            thumbnail_path(source).unlink(missing_ok=True)
+            job.filepath = str(output)
+        job.fields['transcoded'] = True
+
+    def _thumbnail(self, job):
+        """在视频的10%处截取一帧作为缩略图"""
+        output = thumbnail_path(job.filepath)
+        output.parent.mkdir(exist_ok=True)
+        probe = probe_video(job.filepath)
+        offset = (probe or {}).get('duration') or 0
+        temp = temp_filename(output)
+        # 时长未知时使用第一帧
+        run_ffmpeg(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-ss', f'{offset * 0.1:.2f}',
+                    '-i', job.filepath, '-frames:v', '1', '-vf', f'scale={THUMBNAIL_WIDTH}:-2',
+                    '-q:v', '4', '-f', 'image2', str(temp)])
+        if not temp.exists():
+            raise StageError('没有截取到画面')
+        replace_output(temp, output)
+        job.fields['thumbnail'] = str(output)
+
+    def _checksum(self, job):
+        job.fields['sha256'] = file_checksum(job.filepath)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载进度跟踪
+yt-dlp的进度回调每秒调用很多次（分片并发下载时来自多个线程），每次都写任务存储的代价很高。
+这里在内存中为每个任务维护一条紧凑的进度记录（加锁更新），按时间间隔合并后再写入任务存储；
+阶段变化（开始下载音频、开始合并等）立即写入。
+
+阶段：extracting（解析）→ downloading / downloading_video / downloading_audio → postprocessing（等待处理）
+→ 处理流水线的各阶段（merging、verifying 等，见 postprocess.STAGE_PHASES）。总进度按各文件的字节数加权，
+下载部分占 0~95%，剩余部分留给处理流水线，任务完成时为100%。
+"""
+
+import threading
+import time
+
+PHASES = ('extracting', 'downloading', 'downloading_video', 'downloading_audio', 'merging', 'postprocessing',
+          'verifying', 'remuxing', 'transcoding', 'thumbnailing', 'checksumming')
+
+# 下载部分在总进度中所占的百分比，其余留给合并/后处理
+DOWNLOAD_SHARE = 95
+
+
+class ProgressRecord:
+    """单个任务的进度（只在持有 lock 时修改）"""
+    __slots__ = ('lock', 'phase', 'sizes', 'index', 'current_file', 'current_downloaded', 'current_total',
+                 'done_bytes', 'speed', 'eta', 'flushed_at', 'flushed_phase', 'postprocessors')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = 'extracting'
+        self.sizes = []
+        self.index = 0
+        self.current_file = None
+        self.current_downloaded = 0
+        self.current_total = None
+        self.done_bytes = 0
+        self.speed = 0
+        self.eta = 0
+        self.flushed_at = 0.0
+        self.flushed_phase = None
+        # yt-dlp内的后处理器 -> 开始时间（perf_counter），用于记录耗时
+        self.postprocessors = {}
+
+    def fraction(self):
+        """下载部分的完成比例（0~1）：各文件大小都已知时按字节加权，否则按文件数平均"""
+        # index 为已下载完成的文件数，current_file 不为None时正在下载第 index+1 个
+        count = max(len(self.sizes), self.index + (self.current_file is not None), 1)
+        sizes = self.sizes + [None] * (count - len(self.sizes))
+        if self.current_total and self.index < count:
+            sizes[self.index] = self.current_total
+        if self.index >= count:
+            return 1.0
+        if all(sizes):
+            return min(1.0, (self.done_bytes + self.current_downloaded) / sum(sizes))
+        current = self.current_downloaded / self.current_total if self.current_total else 0
+        return min(1.0, (self.index + current) / count)
+
+    def progress(self):
+        """总进度（百分比）"""
+        if self.phase in ('merging', 'postprocessing'):
+            return DOWNLOAD_SHARE
+        return int(self.fraction() * DOWNLOAD_SHARE)
+
+    def fields(self):
+        """写入任务存储/对外显示的字段"""
+        return {
+            'phase': self.phase,
+            'progress': self.progress(),
+            'speed': self.speed,
+            'eta': self.eta,
+            'downloaded_bytes': self.done_bytes + self.current_downloaded,
+        }
+
+
+class ProgressTracker:
+    """
+    所有进行中任务的进度
+
+    Args:
+        store: 任务存储
+        flush_interval: 同一阶段内两次写入任务存储的最小间隔（秒）
+    """
+
+    def __init__(self, store, flush_interval=0.5):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def start(self, task_id):
+        """任务开始（解析阶段）"""
+        record = ProgressRecord()
+        with self._lock:
+            self._records[task_id] = record
+        with record.lock:
+            self._flush(task_id, record, self._due(record, force=True))
+
+    def finish(self, task_id):
+        """任务结束（最终状态由调用方写入）"""
+        with self._lock:
+            self._records.pop(task_id, None)
+
+    def snapshot(self, task_id):
+        """内存中的最新进度字段（比任务存储中的更新），任务不在进行中返回None"""
+        record = self._records.get(task_id)
+        if record is None:
+            return None
+        with record.lock:
+            return record.fields()
+
+    def plan(self, task_id, formats):
+        """记录要下载的文件（视频+音频分别下载时为两个）的预计大小，用于按字节加权"""
+        record = self._records.get(task_id)
+        if record is None:
+            return
+        with record.lock:
+            record.sizes = [f.get('filesize') or f.get('filesize_approx') for f in formats]
+
+    def on_download(self, task_id, d):
+        """yt-dlp进度回调（progress_hooks）"""
+        record = self._records.get(task_id)
+        if record is None or d['status'] not in ('downloading', 'finished'):
+            return
+        extra = None
+        # 写入任务存储也在锁内进行，分片并发下载时较旧的进度不会覆盖较新的
+        with record.lock:
+            downloaded = d.get('downloaded_bytes') or 0
+            if d['status'] == 'finished':
+                # 一个文件下载完成（已存在的文件只有这一次回调）
+                record.done_bytes += d.get('total_bytes') or downloaded or record.current_total or 0
+                record.index += 1
+                record.current_file = None
+                record.current_downloaded = 0
+                record.current_total = None
+            else:
+                filename = d.get('tmpfilename') or d.get('filename')
+                if filename != record.current_file:
+                    if record.current_file is not None:
+                        # 没有收到上一个文件的finished就开始了新文件
+                        record.done_bytes += record.current_total or record.current_downloaded
+                        record.index += 1
+                    record.current_file = filename
+                    record.current_total = None
+                    record.phase = _download_phase(d.get('info_dict') or {})
+                    # 新文件：/api/stream 和临时文件清理需要尽快知道文件位置
+                    extra = {'partial': d.get('tmpfilename'), 'total_bytes': d.get('total_bytes')}
+                record.current_total = d.get('total_bytes') or d.get('total_bytes_estimate') or record.current_total
+                record.current_downloaded = downloaded
+                record.speed = d.get('speed') or 0
+                record.eta = d.get('eta') or 0
+            fields = self._due(record, force=extra is not None or d['status'] == 'finished')
+            if fields is not None:
+                self._flush(task_id, record, dict(fields, **extra) if extra else fields)
+
+    def on_postprocessor(self, task_id, d):
+        """
+        yt-dlp后处理回调（postprocessor_hooks）：合并音视频、修复等
+
+        Returns:
+            后处理器结束时返回它的耗时（秒），其余返回None；开始时间保存在进度记录中，任务结束时一起清除
+        """
+        record = self._records.get(task_id)
+        if record is None:
+            return None
+        name = d.get('postprocessor')
+        with record.lock:
+            if d['status'] == 'finished':
+                started = record.postprocessors.pop(name, None)
+                return None if started is None else time.perf_counter() - started
+            if d['status'] != 'started':
+                return None
+            record.postprocessors[name] = time.perf_counter()
+            if record.index == 0 and record.current_file is None:
+                # 下载开始前运行的后处理器（记录格式等），仍属于解析阶段
+                return None
+            record.phase = 'merging' if name == 'Merger' else 'postprocessing'
+            record.speed = record.eta = 0
+            fields = self._due(record, force=False)
+            if fields is not None:
+                self._flush(task_id, record, fields)
+        return None
+
+    def _due(self, record, force):
+        """是否需要写入任务存储（阶段变化、强制或超过间隔），需要时返回要写入的字段"""
+        now = time.monotonic()
+        if not force and record.phase == record.flushed_phase and now - record.flushed_at < self.flush_interval:
+            return None
+        record.flushed_at = now
+        record.flushed_phase = record.phase
+        return record.fields()
+
+    def _flush(self, task_id, record, fields):
+        if self._records.get(task_id) is not record:
+            return
+        try:
+            self.store.update(task_id, **fields)
+        except Exception as e:
+            # 进度写入失败（远程任务存储暂时无法连接等）不中断下载，下次写入时补上
+            record.flushed_at = 0.0
+            print(f"[警告] 更新任务 {task_id} 的进度失败: {e}")
+
+
+def _download_phase(info):
+    """根据正在下载的格式判断阶段"""
+    if info.get('vcodec') == 'none':
+        return 'downloading_audio'
+    if info.get('acodec') == 'none':
+        return 'downloading_video'
+    return 'downloading'
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载进度推送（Server-Sent Events）
+任务存储发生变化时唤醒订阅者，订阅者按最小间隔合并变化，只推送改变的字段。
+"""
+
+import json
+import threading
+import time
+
+from task_store import FINISHED_STATUSES
+
+# 没有指定任务时，跟踪这些状态的任务
+ACTIVE_STATUSES = ('pending', 'queued', 'downloading')
+
+
+class TaskEventBroker:
+    """
+    任务进度事件
+
+    Args:
+        store: 任务存储
+        serialize: 把任务记录转换为对外字段的函数 serialize(task) -> dict
+        min_interval: 两次推送之间的最小间隔（秒），期间的多次变化合并为一次
+        heartbeat: 没有推送时发送心跳注释的间隔（秒），防止代理断开连接
+        poll_interval: 没有收到变化通知时重新读取任务存储的间隔（秒）
+    """
+
+    def __init__(self, store, serialize, min_interval=0.5, heartbeat=15, poll_interval=5):
+        self.store = store
+        self.serialize = serialize
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._version = 0
+        store.add_listener(self.notify)
+
+    def notify(self, task_id=None):
+        """任务发生变化（由任务存储回调）"""
+        with self._cond:
+            self._version += 1
+            self._cond.notify_all()
+
+    def wait(self, version, timeout):
+        """等待版本号变化，返回最新版本号"""
+        with self._cond:
+            if self._version == version:
+                self._cond.wait(timeout)
+            return self._version
+
+    def wait_for_change(self, timeout):
+        """等待下一次任务变化（或超时）"""
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def stream(self, task_ids=None):
+        """
+        生成SSE文本
+
+        Args:
+            task_ids: 要跟踪的任务ID列表；为空时跟踪所有进行中的任务
+        """
+        follow_active = not task_ids
+        watched = list(task_ids or [])
+        sent = {}
+        event_id = 0
+        version = self._version
+        last_emit = 0
+        last_write = time.monotonic()
+        yield 'retry: 2000\n\n'
+
+        while True:
+            if follow_active:
+                for task in self.store.find_by_status(*ACTIVE_STATUSES):
+                    if task['task_id'] not in watched:
+                        watched.append(task['task_id'])
+
+            emitted = False
+            for task_id in list(watched):
+                task = self.store.get(task_id)
+                if task is None:
+                    if task_id not in sent or sent[task_id] is not None:
+                        event_id += 1
+                        yield _format_event('missing', {'task_id': task_id}, event_id)
+                        sent[task_id] = None
+                        emitted = True
+                    if follow_active:
+                        watched.remove(task_id)
+                    continue
+                current = self.serialize(task)
+                previous = sent.get(task_id) or {}
+                delta = {k: v for k, v in current.items() if previous.get(k) != v or k not in previous}
+                if delta:
+                    delta['task_id'] = task_id
+                    event_id += 1
+                    yield _format_event('progress', delta, event_id)
+                    sent[task_id] = current
+                    emitted = True
+                if follow_active and current.get('status') in FINISHED_STATUSES:
+                    watched.remove(task_id)
+
+            if not follow_active and all(
+                    sent.get(tid) is None or sent[tid].get('status') in FINISHED_STATUSES for tid in watched):
+                yield _format_event('end', {}, event_id + 1)
+                return
+
+            if emitted:
+                last_emit = last_write = time.monotonic()
+            # 心跳按距离上次写出的时间发送：其他任务一直在变化（版本号一直改变）、但跟踪的任务没有变化时也要发送
+            until_heartbeat = last_write + self.heartbeat - time.monotonic()
+            new_version = self.wait(version, max(0, min(self.poll_interval, until_heartbeat)))
+            now = time.monotonic()
+            if now - last_write >= self.heartbeat:
+                yield ': keepalive\n\n'
+                last_write = now
+            if new_version != version:
+                # 合并短时间内的多次变化
+                remaining = last_emit + self.min_interval - now
+                if remaining > 0:
+                    time.sleep(remaining)
+            version = self._version
+
+
+def _format_event(event, data, event_id):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
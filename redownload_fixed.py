@@ -9,7 +9,7 @@ import os
 import sys
 import argparse
 from pathlib import Path
-import yt_dlp
+from format_policy import format_options, quality_arg
 
 # 设置Windows控制台编码为UTF-8
 if sys.platform == 'win32':
@@ -20,15 +20,18 @@ if sys.platform == 'win32':
         pass
 
 
-def redownload_video(url, output_dir="downloads", quality="best"):
+def redownload_video(url, output_dir="downloads", quality="best", store=None):
     """
     重新下载视频，使用更严格的格式过滤，完全避免MPEG-TS格式
     
     Args:
         url: YouTube视频链接
         output_dir: 输出目录，默认为"downloads"
-        quality: 视频质量，可选值: "best", "worst", "720p", "1080p"等
+        quality: 视频质量，可选值: "best", "worst", "economy", "720p", "1080p"等（任意高度上限）
+        store: 内容存储目录，下载的文件按视频ID和格式纳入存储（见 content_store.py），None表示不使用
     """
+    # 导入yt-dlp需要约0.2秒，只在真正下载时导入（--help、参数错误时不需要）
+    import yt_dlp
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True)
     
@@ -37,21 +40,11 @@ def redownload_video(url, output_dir="downloads", quality="best"):
         'outtmpl': str(output_path / '%(title)s_fixed.%(ext)s'),
         'noplaylist': True,
         'prefer_free_formats': False,
-        # 关键：完全排除HLS流（m3u8），这是导致MPEG-TS问题的主要原因
-        'format_sort': ['ext:mp4', 'ext:webm', 'res', 'codec:h264', 'codec:vp9'],
     }
     
-    # 只选择单一格式（不需要合并），完全排除HLS流
-    # 明确排除format_id 96（HLS流格式，会导致MPEG-TS问题）
-    if quality == "best":
-        # 排除m3u8协议和format_id 96，只选择mp4/webm格式，确保有视频和音频
-        ydl_opts['format'] = 'best[ext=mp4][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[ext=webm][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]'
-    elif quality == "720p":
-        ydl_opts['format'] = 'best[height<=720][ext=mp4][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[height<=720][ext=webm][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[height<=720][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]'
-    elif quality == "1080p":
-        ydl_opts['format'] = 'best[height<=1080][ext=mp4][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[height<=1080][ext=webm][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/best[height<=1080][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]'
-    elif quality == "worst":
-        ydl_opts['format'] = 'worst[ext=mp4][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/worst[ext=webm][protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]/worst[protocol!=m3u8][format_id!=96][vcodec!=none][acodec!=none]'
+    # 只选择单一格式（不需要合并），完全排除HLS流（m3u8），
+    # 明确排除format_id 96（HLS流格式，会导致MPEG-TS问题），确保有视频和音频
+    ydl_opts.update(format_options(quality, strict=True))
     
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -66,6 +59,15 @@ def redownload_video(url, output_dir="downloads", quality="best"):
             print(f"开始下载...")
             
             ydl.download([url])
+            # 只选择单一格式（不合并），文件名就是下载前确定的文件名
+            filename = ydl.prepare_filename(info)
+            if store and os.path.exists(filename):
+                from content_store import ContentStore
+                content_store = ContentStore(store)
+                try:
+                    content_store.ingest(filename, video_id=info.get('id'), format_id=info.get('format_id'))
+                finally:
+                    content_store.close()
             
             print(f"\n[成功] 重新下载完成！")
             print(f"保存位置: {output_path.absolute()}")
@@ -81,8 +83,9 @@ def redownload_video(url, output_dir="downloads", quality="best"):
         sys.exit(1)
 
 
-def main():
+def main(argv=None, prog=None):
     parser = argparse.ArgumentParser(
+        prog=prog,
         description='Plan B: 重新下载视频（避免MPEG-TS格式问题）',
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
@@ -105,14 +108,19 @@ Plan B策略:
     )
     parser.add_argument(
         '-q', '--quality',
-        choices=['best', 'worst', '720p', '1080p'],
+        type=quality_arg,
         default='best',
-        help='视频质量 (默认: best)'
+        help='视频质量: best、worst、economy 或高度上限如 720p (默认: best)'
+    )
+    parser.add_argument(
+        '--store',
+        default=os.environ.get('YTD_CONTENT_STORE') or None,
+        help='内容存储目录，下载的文件纳入存储（默认: 环境变量 YTD_CONTENT_STORE，未设置时不使用）'
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
-    redownload_video(args.url, args.output, args.quality)
+    redownload_video(args.url, args.output, args.quality, args.store)
 
 
 if __name__ == "__main__":
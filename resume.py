@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+断点续传与临时文件清理
+- 判断下载错误是否是暂时性的网络错误（可以重试），计算指数退避的等待时间
+- 识别yt-dlp留下的临时文件（.part、.part-FragN、.ytdl、.temp.ext，以及未合并的 .fNNN.ext）
+- 定期清理超过一定时间、且不属于进行中任务的临时文件
+"""
+
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+# 临时文件名：.part / .part-Frag12(.part) / .ytdl / 后处理的 .temp.mp4
+PARTIAL_RE = re.compile(r'(\.part(-Frag\d+(\.part)?)?|\.ytdl|\.temp\.\w+)$', re.IGNORECASE)
+
+# 分别下载、还没有合并的格式文件名（.f137.mp4）。标题以 .f数字 结尾的已完成文件也符合，
+# 只有同一视频还有其他临时文件、或属于已知任务时才当作临时文件
+FORMAT_RE = re.compile(r'\.f\d+(-\w+)?\.\w+$', re.IGNORECASE)
+
+# 这些错误信息说明是暂时性的网络问题，重试可能成功
+TRANSIENT_MARKERS = (
+    'timed out', 'timeout', 'connection reset', 'connection aborted', 'connection refused',
+    'remote end closed', 'temporary failure in name resolution', 'network is unreachable',
+    'incompleteread', 'incomplete read', 'eof occurred', 'http error 429',
+    'http error 500', 'http error 502', 'http error 503', 'http error 504',
+)
+
+
+def is_transient_error(error):
+    """下载错误是否是暂时性的（超时、连接中断、429/5xx等）"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (socket.timeout, TimeoutError, ConnectionError)):
+            return True
+        status = getattr(error, 'status', None) or getattr(getattr(error, 'response', None), 'status', None)
+        if isinstance(status, int) and (status == 429 or 500 <= status < 600):
+            return True
+        message = str(error).lower()
+        if any(marker in message for marker in TRANSIENT_MARKERS):
+            return True
+        # yt-dlp的DownloadError把原始异常放在exc_info中
+        exc_info = getattr(error, 'exc_info', None)
+        cause = exc_info[1] if exc_info and len(exc_info) > 1 else None
+        error = cause or error.__cause__ or error.__context__
+    return False
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """第attempt次重试（从0开始）前的等待时间：指数增长 + 随机抖动，不超过cap"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_partial_file(name):
+    """是否是下载过程中的临时文件"""
+    return PARTIAL_RE.search(name) is not None
+
+
+def partial_stem(name):
+    """
+    临时文件对应的视频文件名（不含扩展名）
+    例如 'Title.f137.mp4.part' -> 'Title'，'Title.mp4.part-Frag3' -> 'Title'
+    """
+    name = os.path.basename(name)
+    while True:
+        stripped = FORMAT_RE.sub('', PARTIAL_RE.sub('', name))
+        if stripped == name:
+            break
+        name = stripped
+    return os.path.splitext(name)[0]
+
+
+def find_partials(directory, known_stems=()):
+    """
+    目录中的临时文件 [(路径, 修改时间, 大小)]
+    未合并的格式文件（.fNNN.ext）只在同一视频还有 .part/.ytdl/.temp 文件、或属于 known_stems 时返回
+    """
+    partials = []
+    formats = []
+    try:
+        with os.scandir(directory) as it:
+            for item in it:
+                if is_partial_file(item.name):
+                    target = partials
+                elif FORMAT_RE.search(item.name):
+                    target = formats
+                else:
+                    continue
+                try:
+                    if not item.is_file():
+                        continue
+                    stat = item.stat()
+                except OSError:
+                    continue
+                target.append((item.path, stat.st_mtime, stat.st_size))
+    except OSError:
+        pass
+    stems = {partial_stem(path) for path, _, _ in partials} | set(known_stems)
+    return partials + [entry for entry in formats if partial_stem(entry[0]) in stems]
+
+
+def clean_partials(directories, max_age, protected_stems=(), known_stems=()):
+    """
+    删除超过max_age秒没有修改、且不属于进行中任务的临时文件
+
+    Args:
+        directories: 要检查的目录
+        max_age: 临时文件最后修改后保留的时间（秒）
+        protected_stems: 进行中任务的视频文件名（partial_stem），这些文件保留用于续传
+        known_stems: 任务记录中的视频文件名，这些视频的 .fNNN.ext 文件没有其他临时文件时也清理
+
+    Returns:
+        (删除的文件数, 释放的字节数)
+    """
+    protected = set(protected_stems)
+    known = set(known_stems)
+    cutoff = time.time() - max_age
+    removed = freed = 0
+    for directory in directories:
+        for path, mtime, size in find_partials(directory, known):
+            if mtime >= cutoff or partial_stem(path) in protected:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+    return removed, freed
+
+
+class PartialJanitor:
+    """
+    后台定期清理临时文件
+
+    Args:
+        directories: 返回要检查的目录列表的函数
+        protected: 返回进行中任务的 partial_stem 集合的函数
+        max_age: 临时文件保留时间（秒）
+        interval: 检查间隔（秒）
+        known: 返回任务记录中的 partial_stem 集合的函数（见 clean_partials 的 known_stems），可以为None
+    """
+
+    def __init__(self, directories, protected, max_age=24 * 3600, interval=3600, known=None):
+        self.directories = directories
+        self.protected = protected
+        self.known = known
+        self.max_age = max_age
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='partial-janitor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def run_once(self):
+        """清理一次，返回 (删除的文件数, 释放的字节数)"""
+        known = self.known() if self.known is not None else ()
+        return clean_partials(self.directories(), self.max_age, self.protected(), known)
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                removed, freed = self.run_once()
+                if removed:
+                    print(f"[信息] 已清理 {removed} 个过期的临时文件（{freed / (1024 * 1024):.1f} MB）")
+            except Exception as e:
+                print(f"[警告] 清理临时文件失败: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载任务调度器
+固定数量的工作线程 + 优先级队列，避免每个请求都启动一个下载线程
+下载进程与网页进程分离时，工作线程从共享的任务存储中领取任务（source）
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    """等待队列已满，拒绝接收新任务"""
+
+
+class SchedulerStoppedError(QueueFullError):
+    """调度器已停止，不再接收新任务"""
+
+
+class DownloadScheduler:
+    """
+    有界下载工作池
+
+    Args:
+        handler: 执行任务的函数，调用方式为 handler(task_id, *args)
+        max_workers: 同时运行的下载数量
+        max_queue: 等待队列的最大长度（0表示不限制）
+        source: 本地队列为空时领取任务的函数 source() -> (task_id, args) 或 None（可以启动后再设置）
+        poll_interval: source没有任务时，再次领取前的等待时间（秒）
+    """
+
+    def __init__(self, handler, max_workers=2, max_queue=100, source=None, poll_interval=1.0):
+        self.handler = handler
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.source = source
+        self.poll_interval = poll_interval
+        self._heap = []
+        self._entries = {}
+        self._running = set()
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._shutdown = False
+        self._draining = False
+
+    def start(self):
+        """启动工作线程（重复调用无副作用）"""
+        with self._cond:
+            if self._workers:
+                return
+            self._shutdown = False
+            self._draining = False
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"download-worker-{i}")
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, task_id, *args, priority=0, enforce_limit=True):
+        """
+        提交任务到队列；同一个task_id已经在队列中时替换原来的任务（参数和优先级使用新的值），不重复执行
+
+        Args:
+            task_id: 任务ID
+            *args: 传给handler的额外参数
+            priority: 优先级，数值越大越先执行；相同优先级按提交顺序（FIFO）
+            enforce_limit: 是否检查队列长度（恢复重启前已接收的任务时不检查）
+        """
+        with self._cond:
+            if self._shutdown or self._draining:
+                raise SchedulerStoppedError('调度器已停止')
+            old = self._entries.get(task_id)
+            if old is None and enforce_limit and self.max_queue and len(self._heap) >= self.max_queue:
+                raise QueueFullError(f'下载队列已满（最多{self.max_queue}个等待任务）')
+            if old is not None:
+                self._heap.remove(old)
+                heapq.heapify(self._heap)
+            entry = (-int(priority), next(self._counter), task_id, args)
+            heapq.heappush(self._heap, entry)
+            self._entries[task_id] = entry
+            self._cond.notify()
+        self.start()
+
+    def position(self, task_id):
+        """返回任务在队列中的位置（从1开始），不在队列中返回None"""
+        with self._cond:
+            entry = self._entries.get(task_id)
+            if entry is None:
+                return None
+            return 1 + sum(1 for other in self._heap if other < entry)
+
+    def is_running(self, task_id):
+        """任务是否正在执行"""
+        with self._cond:
+            return task_id in self._running
+
+    def running_tasks(self):
+        """正在执行的任务ID"""
+        with self._cond:
+            return list(self._running)
+
+    def stats(self):
+        """队列统计信息"""
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'running': len(self._running),
+                'queued': len(self._heap),
+                'max_queue': self.max_queue,
+            }
+
+    def shutdown(self, wait=True, timeout=None):
+        """停止接收新任务，等待正在执行的任务结束"""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join(timeout)
+
+    def drain(self, timeout=None):
+        """
+        停止接收新任务（也不再从source领取），等待本地队列中的任务和正在执行的任务结束
+
+        Returns:
+            超时后仍未完成的任务数（0表示全部完成）
+        """
+        with self._cond:
+            self._draining = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            worker.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        with self._cond:
+            remaining = len(self._heap) + len(self._running)
+            self._shutdown = True
+            self._cond.notify_all()
+        return remaining
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap and not self._shutdown and not self._draining and self.source is None:
+                    self._cond.wait()
+                if self._shutdown or (self._draining and not self._heap):
+                    return
+                job = None
+                if self._heap:
+                    entry = heapq.heappop(self._heap)
+                    job = entry[2], entry[3]
+                    self._entries.pop(job[0], None)
+                    self._running.add(job[0])
+            if job is None:
+                # 本地队列为空，从共享的任务存储中领取
+                job = self._claim()
+                if job is None:
+                    with self._cond:
+                        if not self._heap and not self._shutdown and not self._draining:
+                            self._cond.wait(self.poll_interval)
+                    continue
+            task_id, args = job
+            try:
+                self.handler(task_id, *args)
+            except Exception:
+                # handler自己负责记录任务错误，这里只保证工作线程不退出
+                pass
+            finally:
+                with self._cond:
+                    self._running.discard(task_id)
+
+    def _claim(self):
+        try:
+            claimed = self.source()
+        except Exception as e:
+            print(f"[警告] 领取任务失败: {e}")
+            return None
+        if claimed is not None:
+            with self._cond:
+                self._running.add(claimed[0])
+        return claimed
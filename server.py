@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产环境运行（python app.py --serve）
+- waitress（跨平台）：单进程多线程，网页请求和下载在同一个进程中
+- gunicorn（Linux/macOS）：多个网页进程 + 一个独立的下载进程，
+  通过共享的SQLite任务存储（YTD_TASK_DB）交换任务，网页进程不执行下载
+收到 SIGTERM/SIGINT 后先停止接收请求，再等待进行中的下载完成。
+waitress和gunicorn都是可选依赖，按需安装：pip install waitress 或 pip install gunicorn
+"""
+
+import argparse
+import importlib
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+SERVERS = ('auto', 'waitress', 'gunicorn')
+
+
+def build_parser(prog=None):
+    """app.py 的命令行参数（不需要导入app，--help 和参数错误时不加载Flask和yt-dlp）"""
+    parser = argparse.ArgumentParser(prog=prog, description='YouTube视频下载Web应用')
+    parser.add_argument('--serve', action='store_true',
+                        help='生产模式：使用waitress/gunicorn运行（默认使用Flask调试服务器）')
+    parser.add_argument('--worker', action='store_true',
+                        help='只运行下载进程，与 YTD_ROLE=web 的网页进程共用 YTD_TASK_DB')
+    parser.add_argument('--host', default=os.environ.get('YTD_HOST', '127.0.0.1'), help='监听地址')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('YTD_PORT', '5000')), help='端口')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('YTD_WEB_WORKERS', '1')),
+                        help='网页进程数（大于1时使用gunicorn）')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('YTD_WEB_THREADS', '8')),
+                        help='每个网页进程的线程数')
+    parser.add_argument('--server', choices=SERVERS, default='auto', help='WSGI服务器')
+    return parser
+
+
+def _importable(name):
+    try:
+        importlib.import_module(name)
+        return True
+    except ImportError:
+        return False
+
+
+def pick_server(name='auto', workers=1):
+    """
+    选择WSGI服务器
+
+    Args:
+        name: auto / waitress / gunicorn；auto 在多个网页进程时选择gunicorn，否则优先waitress
+        workers: 网页进程数
+
+    Returns:
+        'waitress' 或 'gunicorn'；需要的服务器没有安装时抛出 RuntimeError
+    """
+    if name == 'auto':
+        if workers > 1 or not _importable('waitress'):
+            name = 'gunicorn'
+        else:
+            name = 'waitress'
+    if name == 'gunicorn' and sys.platform == 'win32':
+        raise RuntimeError('gunicorn 不支持Windows，请使用 --server waitress（单个网页进程）')
+    if name == 'waitress' and workers > 1:
+        raise RuntimeError('waitress 只支持单个网页进程，多个网页进程请使用 gunicorn')
+    if not _importable(name):
+        raise RuntimeError(f'没有安装 {name}，请先运行: pip install {name}')
+    return name
+
+
+def wait_for_signal():
+    """阻塞直到收到 SIGTERM 或 SIGINT（Ctrl+C）"""
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    while not stop.is_set():
+        # 带超时等待，Windows上才能及时处理Ctrl+C
+        stop.wait(1.0)
+
+
+def run_waitress(wsgi_app, host, port, threads):
+    """用waitress运行，收到 SIGTERM/SIGINT 后停止接收请求并返回"""
+    from waitress.server import create_server
+
+    server = create_server(wsgi_app, host=host, port=port, threads=threads)
+    # waitress在 SystemExit/KeyboardInterrupt 时关闭监听并结束事件循环
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server.print_listen('服务地址: http://{}:{}')
+    server.run()
+
+
+def run_gunicorn(module, host, port, workers, threads, graceful_timeout):
+    """
+    用gunicorn运行（gthread工作模式，SSE和边下载边传输的长连接各占一个线程）
+
+    Args:
+        module: 应用所在的模块名，每个网页进程分别导入（不与主进程共用SQLite连接和线程）
+        graceful_timeout: 停止时等待进行中请求的时间（秒）
+    """
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': threads,
+        'graceful_timeout': int(graceful_timeout),
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, str(value))
+
+        def load(self):
+            return importlib.import_module(module).app
+
+    master_pid = os.getpid()
+    try:
+        Application().run()
+    except SystemExit as e:
+        # gunicorn的主进程和fork出的网页进程结束时都会调用 sys.exit
+        if os.getpid() != master_pid:
+            # 网页进程直接退出，不执行主进程的收尾（停止下载进程等）
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(e.code if isinstance(e.code, int) else 0)
+
+
+def spawn_download_worker(script, env):
+    """启动独立的下载进程（python <script> --worker）"""
+    return subprocess.Popen([sys.executable, script, '--worker'], env=env)
+
+
+def stop_process(process, timeout):
+    """发送SIGTERM让进程完成收尾，超时后强制结束"""
+    if process.poll() is not None:
+        return process.returncode
+    process.terminate()
+    try:
+        return process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return process.wait()
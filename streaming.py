@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+边下载边传输
+从正在写入的文件（yt-dlp的 .part 文件，下载完成后重命名为最终文件）中读取已经下载的部分，
+数据不够时等待下载进度，直到读完请求的范围或下载结束。
+每次读取都重新打开文件，不长期占用文件句柄（Windows上占用文件会导致 .part 无法重命名）。
+"""
+
+import os
+
+# 每次读取的块大小
+CHUNK_SIZE = 256 * 1024
+
+
+def available_bytes(path):
+    """文件当前的大小，不存在返回None"""
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def iter_growing_file(locate, start=0, end=None, wait=None, chunk_size=CHUNK_SIZE):
+    """
+    逐块读取正在下载的文件
+
+    Args:
+        locate: 返回当前状态的函数 locate() -> (文件路径, 状态)，状态为 downloading/completed/error
+        start: 起始位置
+        end: 结束位置（包含），None表示读到下载结束
+        wait: 等待下载进度的函数 wait(timeout)，数据不够时调用
+        chunk_size: 每次读取的字节数
+
+    Yields:
+        文件数据块；下载出错或文件消失时提前结束
+    """
+    position = start
+    while end is None or position <= end:
+        path, status = locate()
+        size = available_bytes(path)
+        if size is not None and size > position:
+            length = size - position if end is None else min(size, end + 1) - position
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(position)
+                    data = f.read(min(chunk_size, length))
+            except OSError:
+                # 文件正在被重命名（.part -> 最终文件），下次重新定位
+                data = b''
+            if data:
+                position += len(data)
+                yield data
+                continue
+        elif status == 'completed' or status == 'error':
+            # 下载已结束且没有更多数据
+            return
+        if wait is not None:
+            wait(1.0)
@@ -0,0 +1,824 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下载任务存储
+替代原来模块级的 download_tasks 字典：线程安全、按状态/URL索引、
+自动清理已结束的任务，SQLite后端在重启后可以恢复未完成的任务。
+其他主机上的下载节点通过 HTTPTaskStore 访问网页节点的任务存储（/api/worker/store）。
+批量下载的批次记录（kind='batch'）也保存在这里；按状态查找、统计时默认只包括下载任务，
+批次记录需要指定 kind。
+
+下载节点领取任务时可以带租约（lease，秒）：下载期间用 heartbeat() 续约，
+节点失去响应、租约过期后 reassign_expired() 把任务重新排队，由其他节点领取。
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# 已结束的任务状态，会被自动清理/归档（partial 为部分视频下载失败的批次）
+FINISHED_STATUSES = ('completed', 'error', 'partial')
+
+# 进程退出时可能被中断的任务状态，启动时重新排队
+INTERRUPTED_STATUSES = ('pending', 'queued', 'downloading')
+
+
+class MemoryTaskStore:
+    """
+    内存任务存储（线程安全）
+
+    Args:
+        max_finished: 最多保留的已结束任务数量，超出后淘汰最早结束的
+        finished_ttl: 已结束任务的保留时间（秒），0表示不按时间淘汰
+    """
+
+    def __init__(self, max_finished=500, finished_ttl=24 * 3600):
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self._tasks = {}
+        self._by_status = {}
+        self._by_url = {}
+        self._by_key = {}
+        self._by_primary = {}
+        # 等待下载的主任务数量，POST和 /api/queue 不需要遍历任务
+        self._queued_primaries = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._nodes = {}
+
+    def create(self, task):
+        """新建任务，task必须包含task_id"""
+        now = time.time()
+        task = dict(task)
+        task.setdefault('created_at', now)
+        task['updated_at'] = now
+        with self._lock:
+            old = self._tasks.get(task['task_id'])
+            if old is not None:
+                self._unindex(old)
+            self._tasks[task['task_id']] = task
+            self._index(task)
+        self.evict()
+        self._notify(task['task_id'])
+        return dict(task)
+
+    def create_or_join(self, task):
+        """
+        新建下载任务；有去重键（dedup_key）相同、仍在进行的主任务时，作为它的观察者（primary_task_id）新建。
+        查找和新建在同一个锁（SQLite为同一个事务）中完成，多个请求同时提交相同的下载时只有一个成为主任务
+
+        Returns:
+            (新建的任务, 主任务ID)；成为主任务时主任务ID就是自己的task_id
+        """
+        now = time.time()
+        task = dict(task)
+        task.setdefault('created_at', now)
+        task['updated_at'] = now
+        with self._lock:
+            if _joinable(task):
+                active = self._find_by_key(task['dedup_key'], INTERRUPTED_STATUSES)
+                if active:
+                    task['primary_task_id'] = active[0]['task_id']
+            old = self._tasks.get(task['task_id'])
+            if old is not None:
+                self._unindex(old)
+            self._tasks[task['task_id']] = task
+            self._index(task)
+        self.evict()
+        self._notify(task['task_id'])
+        return dict(task), task.get('primary_task_id') or task['task_id']
+
+    def get(self, task_id):
+        """获取任务（返回副本），不存在返回None"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id, **fields):
+        """更新任务字段，任务不存在返回False"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            self._unindex(task)
+            _apply_update(task, fields)
+            self._index(task)
+        self._notify(task_id)
+        return True
+
+    def delete(self, task_id):
+        """删除任务"""
+        with self._lock:
+            task = self._tasks.pop(task_id, None)
+            if task is not None:
+                self._unindex(task)
+        if task is not None:
+            self._notify(task_id)
+        return task is not None
+
+    def find_by_status(self, *statuses, kind=None):
+        """按状态查找任务，按创建时间排序；kind 为None时只查找下载任务，'batch' 时查找批次记录"""
+        with self._lock:
+            tasks = [dict(self._tasks[tid]) for status in statuses for tid in self._by_status.get((kind, status), ())]
+        tasks.sort(key=lambda t: t.get('created_at', 0))
+        return tasks
+
+    def find_by_url(self, url):
+        """按URL查找任务，按创建时间排序"""
+        with self._lock:
+            tasks = [dict(self._tasks[tid]) for tid in self._by_url.get(url, ())]
+        tasks.sort(key=lambda t: t.get('created_at', 0))
+        return tasks
+
+    def find_by_dedup_key(self, key, *statuses):
+        """去重键相同、状态在 statuses 中的主任务（不包括观察者任务），按创建时间排序"""
+        with self._lock:
+            return [dict(task) for task in self._find_by_key(key, statuses)]
+
+    def find_observers(self, primary_task_id):
+        """合并到该主任务的观察者任务，按创建时间排序"""
+        with self._lock:
+            tasks = [dict(self._tasks[tid]) for tid in self._by_primary.get(primary_task_id, ())]
+        tasks.sort(key=lambda t: t.get('created_at', 0))
+        return tasks
+
+    def all(self, kind=None):
+        """所有任务（kind 与 find_by_status 相同）"""
+        with self._lock:
+            return [dict(task) for task in self._tasks.values() if task.get('kind') == kind]
+
+    def count_by_status(self, kind=None):
+        """各状态的任务数量（kind 与 find_by_status 相同）"""
+        with self._lock:
+            return {status: len(ids) for (k, status), ids in self._by_status.items() if ids and k == kind}
+
+    def count_queued_primaries(self, exclude=None):
+        """等待下载的任务数（不包括合并到其他下载的观察者任务），exclude 为不计入的task_id"""
+        with self._lock:
+            task = self._tasks.get(exclude)
+            return self._queued_primaries - (1 if task is not None and _queued_primary(task) else 0)
+
+    def evict(self):
+        """清理已结束的任务，返回清理的数量"""
+        with self._lock:
+            finished = [self._tasks[tid] for (_, status), ids in self._by_status.items()
+                        if status in FINISHED_STATUSES for tid in ids]
+            expired = _select_expired(finished, self.max_finished, self.finished_ttl)
+            for task in expired:
+                del self._tasks[task['task_id']]
+                self._unindex(task)
+            return len(expired)
+
+    def claim(self, worker, lease=None):
+        """
+        领取下一个可以开始的排队任务，状态改为downloading并返回；没有时返回None
+        lease 为租约时长（秒），到期前需要用 heartbeat() 续约
+        """
+        with self._lock:
+            candidates = [self._tasks[tid] for tid in self._by_status.get((None, 'queued'), ()) if _claimable(self._tasks[tid])]
+            if not candidates:
+                return None
+            task = min(candidates, key=_claim_order)
+            self._unindex(task)
+            _apply_update(task, _claim_fields(worker, lease))
+            self._index(task)
+            task = dict(task)
+        self._notify(task['task_id'])
+        return task
+
+    def heartbeat(self, worker, task_ids, lease, info=None):
+        """
+        下载节点的心跳：为该节点正在下载的任务续约，记录节点信息
+
+        Returns:
+            已不属于该节点的任务ID列表（租约过期后被重新分配），节点应停止下载这些任务
+        """
+        now = time.time()
+        lost = []
+        with self._lock:
+            self._nodes[worker] = dict(info or {}, node=worker, last_seen=now)
+            for task_id in task_ids:
+                task = self._tasks.get(task_id)
+                if _holds_lease(task, worker):
+                    task['lease_expires'] = now + lease
+                elif task is None or task.get('worker') != worker:
+                    lost.append(task_id)
+        return lost
+
+    def reassign_expired(self):
+        """把租约已过期的下载任务重新排队，返回这些任务"""
+        now = time.time()
+        with self._lock:
+            expired = [self._tasks[tid] for tid in self._by_status.get((None, 'downloading'), ())
+                       if _lease_expired(self._tasks[tid], now)]
+            for task in expired:
+                self._unindex(task)
+                _apply_update(task, _requeue_fields(task))
+                self._index(task)
+            expired = [dict(task) for task in expired]
+        for task in expired:
+            self._notify(task['task_id'])
+        return expired
+
+    def nodes(self, max_age=None):
+        """最近有心跳的下载节点（max_age秒内），按节点名排序"""
+        with self._lock:
+            nodes = [dict(node) for node in self._nodes.values()]
+        return _recent_nodes(nodes, max_age)
+
+    def recover(self, worker=None):
+        """内存存储重启后没有历史任务，不需要恢复"""
+        return []
+
+    def add_listener(self, callback):
+        """注册任务变化回调 callback(task_id)，在创建/更新/删除任务后调用"""
+        self._listeners.append(callback)
+
+    def close(self):
+        pass
+
+    def _notify(self, task_id):
+        for callback in self._listeners:
+            callback(task_id)
+
+    def _find_by_key(self, key, statuses):
+        tasks = [self._tasks[tid] for tid in self._by_key.get(key, ())]
+        tasks = [t for t in tasks if t.get('status') in statuses and not t.get('primary_task_id') and not t.get('kind')]
+        tasks.sort(key=lambda t: t.get('created_at', 0))
+        return tasks
+
+    def _index(self, task):
+        if _queued_primary(task):
+            self._queued_primaries += 1
+        self._by_status.setdefault((task.get('kind'), task.get('status')), set()).add(task['task_id'])
+        self._by_url.setdefault(task.get('url'), set()).add(task['task_id'])
+        if task.get('dedup_key'):
+            self._by_key.setdefault(task['dedup_key'], set()).add(task['task_id'])
+        if task.get('primary_task_id'):
+            self._by_primary.setdefault(task['primary_task_id'], set()).add(task['task_id'])
+
+    def _unindex(self, task):
+        if _queued_primary(task):
+            self._queued_primaries -= 1
+        self._by_status.get((task.get('kind'), task.get('status')), set()).discard(task['task_id'])
+        self._by_url.get(task.get('url'), set()).discard(task['task_id'])
+        _discard(self._by_key, task.get('dedup_key'), task['task_id'])
+        _discard(self._by_primary, task.get('primary_task_id'), task['task_id'])
+
+
+class SQLiteTaskStore:
+    """
+    SQLite任务存储（WAL模式），进程重启后任务不丢失
+    已结束的任务超出保留数量或时间后移动到归档表 tasks_archive
+
+    Args:
+        db_path: 数据库文件路径
+        max_finished: 最多保留的已结束任务数量
+        finished_ttl: 已结束任务的保留时间（秒），0表示不按时间淘汰
+    """
+
+    _COLUMNS = ('task_id, status, url, created_at, updated_at, finished_at, '
+                'kind, priority, primary_task_id, retry_at, dedup_key, data')
+
+    # 查找、领取和去重时用到的字段，单独存为列（带索引），不用解析所有任务的JSON
+    _EXTRA_COLUMNS = (('kind', 'TEXT'), ('priority', 'REAL'), ('primary_task_id', 'TEXT'), ('retry_at', 'REAL'),
+                      ('dedup_key', 'TEXT'))
+
+    # 进行中的主任务（去重键相同的只能有一个）
+    _ACTIVE_PRIMARY = ('dedup_key IS NOT NULL AND primary_task_id IS NULL AND kind IS NULL AND status IN ({})'
+                       .format(', '.join(f"'{status}'" for status in INTERRUPTED_STATUSES)))
+
+    def __init__(self, db_path, max_finished=500, finished_ttl=24 * 3600):
+        self.db_path = str(db_path)
+        self.max_finished = max_finished
+        self.finished_ttl = finished_ttl
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for table in ('tasks', 'tasks_archive'):
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                'task_id TEXT PRIMARY KEY, status TEXT, url TEXT, '
+                'created_at REAL, updated_at REAL, finished_at REAL, '
+                'kind TEXT, priority REAL, primary_task_id TEXT, retry_at REAL, dedup_key TEXT, data TEXT NOT NULL)'
+            )
+            self._migrate(table)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, created_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_url ON tasks(url)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks(finished_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks(status, priority DESC, created_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_dedup ON tasks(dedup_key, status)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_primary ON tasks(primary_task_id)')
+        try:
+            self._conn.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_active_primary ON tasks(dedup_key) WHERE {self._ACTIVE_PRIMARY}'
+            )
+        except sqlite3.IntegrityError:
+            # 旧版本中并发提交留下了重复的主任务；create_or_join 的事务仍然保证之后不再重复
+            print("[警告] 任务存储中有去重键相同的进行中任务，暂不创建唯一索引")
+        self._conn.execute('CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, last_seen REAL, data TEXT NOT NULL)')
+        self._conn.commit()
+
+    def create(self, task):
+        now = time.time()
+        task = dict(task)
+        task.setdefault('created_at', now)
+        task['updated_at'] = now
+        with self._lock:
+            self._write(task, insert=True)
+            self._conn.commit()
+        self.evict()
+        self._notify(task['task_id'])
+        return dict(task)
+
+    def create_or_join(self, task):
+        now = time.time()
+        task = dict(task)
+        task.setdefault('created_at', now)
+        task['updated_at'] = now
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                if _joinable(task):
+                    row = self._conn.execute(
+                        f'SELECT task_id FROM tasks WHERE dedup_key = ? AND {self._ACTIVE_PRIMARY} '
+                        'ORDER BY created_at LIMIT 1', (task['dedup_key'],)
+                    ).fetchone()
+                    if row is not None:
+                        task['primary_task_id'] = row[0]
+                self._write(task, insert=True)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        self.evict()
+        self._notify(task['task_id'])
+        return dict(task), task.get('primary_task_id') or task['task_id']
+
+    def get(self, task_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id, **fields):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row is None:
+                return False
+            task = json.loads(row[0])
+            _apply_update(task, fields)
+            try:
+                self._write(task)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        self._notify(task_id)
+        return True
+
+    def delete(self, task_id):
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+            self._conn.commit()
+        if cursor.rowcount > 0:
+            self._notify(task_id)
+        return cursor.rowcount > 0
+
+    def find_by_status(self, *statuses, kind=None):
+        if not statuses:
+            return []
+        placeholders = ', '.join('?' * len(statuses))
+        return self._select(f'WHERE status IN ({placeholders}) AND kind IS ? ORDER BY created_at', statuses + (kind,))
+
+    def find_by_url(self, url):
+        return self._select('WHERE url = ? ORDER BY created_at', (url,))
+
+    def find_by_dedup_key(self, key, *statuses):
+        if not statuses:
+            return []
+        placeholders = ', '.join('?' * len(statuses))
+        return self._select(
+            f'WHERE dedup_key = ? AND status IN ({placeholders}) AND primary_task_id IS NULL AND kind IS NULL '
+            'ORDER BY created_at', (key,) + statuses
+        )
+
+    def find_observers(self, primary_task_id):
+        return self._select('WHERE primary_task_id = ? ORDER BY created_at', (primary_task_id,))
+
+    def all(self, kind=None):
+        return self._select('WHERE kind IS ? ORDER BY created_at', (kind,))
+
+    def count_by_status(self, kind=None):
+        with self._lock:
+            rows = self._conn.execute('SELECT status, COUNT(*) FROM tasks WHERE kind IS ? GROUP BY status',
+                                      (kind,)).fetchall()
+        return dict(rows)
+
+    def count_queued_primaries(self, exclude=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status = 'queued' AND primary_task_id IS NULL AND kind IS NULL "
+                "AND task_id IS NOT ?", (exclude,)
+            ).fetchone()
+        return row[0]
+
+    def evict(self):
+        """把超出保留数量或时间的已结束任务移动到归档表"""
+        with self._lock:
+            placeholders = ', '.join('?' * len(FINISHED_STATUSES))
+            rows = self._conn.execute(
+                f'SELECT task_id, finished_at, updated_at FROM tasks WHERE status IN ({placeholders})',
+                FINISHED_STATUSES
+            ).fetchall()
+            finished = [{'task_id': r[0], 'finished_at': r[1], 'updated_at': r[2]} for r in rows]
+            expired = [t['task_id'] for t in _select_expired(finished, self.max_finished, self.finished_ttl)]
+            for task_id in expired:
+                self._conn.execute(
+                    f'INSERT OR REPLACE INTO tasks_archive ({self._COLUMNS}) '
+                    f'SELECT {self._COLUMNS} FROM tasks WHERE task_id = ?', (task_id,)
+                )
+                self._conn.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+            if expired:
+                self._conn.commit()
+            return len(expired)
+
+    def claim(self, worker, lease=None):
+        """
+        领取下一个可以开始的排队任务（优先级高、创建早的优先），状态改为downloading并返回；没有时返回None
+        使用 BEGIN IMMEDIATE，多个进程共用同一个数据库时同一个任务只会被领取一次
+        """
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 与 _claimable / _claim_order 的规则相同：不是观察者任务、已到重试时间，优先级高、创建早的优先
+                row = self._conn.execute(
+                    "SELECT data FROM tasks WHERE status = 'queued' AND kind IS NULL AND primary_task_id IS NULL "
+                    "AND (retry_at IS NULL OR retry_at <= ?) ORDER BY priority DESC, created_at LIMIT 1",
+                    (time.time(),)
+                ).fetchone()
+                if row is None:
+                    self._conn.rollback()
+                    return None
+                task = json.loads(row[0])
+                _apply_update(task, _claim_fields(worker, lease))
+                self._write(task)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        self._notify(task['task_id'])
+        return task
+
+    def heartbeat(self, worker, task_ids, lease, info=None):
+        now = time.time()
+        lost = []
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO nodes (node, last_seen, data) VALUES (?, ?, ?)',
+                    (worker, now, json.dumps(dict(info or {}, node=worker, last_seen=now), ensure_ascii=False))
+                )
+                for task_id in task_ids:
+                    row = self._conn.execute('SELECT data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+                    task = json.loads(row[0]) if row else None
+                    if _holds_lease(task, worker):
+                        # 续约不改变 updated_at，不触发任务变化通知
+                        task['lease_expires'] = now + lease
+                        self._write(task)
+                    elif task is None or task.get('worker') != worker:
+                        lost.append(task_id)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return lost
+
+    def reassign_expired(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    "SELECT data FROM tasks WHERE status = 'downloading' AND kind IS NULL"
+                ).fetchall()
+                expired = [task for task in (json.loads(row[0]) for row in rows) if _lease_expired(task, now)]
+                for task in expired:
+                    _apply_update(task, _requeue_fields(task))
+                    self._write(task)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        for task in expired:
+            self._notify(task['task_id'])
+        return expired
+
+    def nodes(self, max_age=None):
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM nodes').fetchall()
+        return _recent_nodes([json.loads(row[0]) for row in rows], max_age)
+
+    def recover(self, worker=None):
+        """
+        找出上次运行时被中断的任务，状态重置为queued并返回
+        （按优先级从高到低、创建时间从早到晚排序）
+        worker 不为None时（多个下载节点）只恢复该节点领取后未完成的任务，其他节点的任务由租约过期处理
+        """
+        if worker is None:
+            tasks = self.find_by_status(*INTERRUPTED_STATUSES)
+        else:
+            tasks = [task for task in self.find_by_status('downloading') if task.get('worker') == worker]
+        for task in tasks:
+            self.update(task['task_id'], status='queued', progress=0, speed=0, eta=0, worker=None, lease_expires=None)
+            task['status'] = 'queued'
+        tasks.sort(key=lambda t: (-t.get('priority', 0), t.get('created_at', 0)))
+        return tasks
+
+    def add_listener(self, callback):
+        """注册任务变化回调 callback(task_id)，在创建/更新/删除任务后调用"""
+        self._listeners.append(callback)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _notify(self, task_id):
+        for callback in self._listeners:
+            callback(task_id)
+
+    def _select(self, clause, params):
+        with self._lock:
+            rows = self._conn.execute(f'SELECT data FROM tasks {clause}', params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _write(self, task, insert=False):
+        # 更新用 ON CONFLICT(task_id)：INSERT OR REPLACE 遇到唯一索引冲突时会删除另一个任务
+        columns = [name.strip() for name in self._COLUMNS.split(',')]
+        upsert = '' if insert else ' ON CONFLICT(task_id) DO UPDATE SET ' + ', '.join(
+            f'{name} = excluded.{name}' for name in columns[1:])
+        self._conn.execute(
+            f'INSERT INTO tasks ({self._COLUMNS}) VALUES ({", ".join("?" * len(columns))}){upsert}',
+            (task['task_id'], task.get('status'), task.get('url'), task.get('created_at'),
+             task.get('updated_at'), task.get('finished_at')) + _extra_values(task)
+            + (json.dumps(task, ensure_ascii=False),)
+        )
+
+    def _migrate(self, table):
+        """旧版本的数据库没有 _EXTRA_COLUMNS 中的列：添加后从JSON中补上"""
+        existing = {row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+        missing = [(name, kind) for name, kind in self._EXTRA_COLUMNS if name not in existing]
+        if not missing:
+            return
+        for name, kind in missing:
+            self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {kind}')
+        for task_id, data in self._conn.execute(f'SELECT task_id, data FROM {table}').fetchall():
+            assignments = ', '.join(f'{name} = ?' for name, _ in self._EXTRA_COLUMNS)
+            self._conn.execute(f'UPDATE {table} SET {assignments} WHERE task_id = ?',
+                               _extra_values(json.loads(data)) + (task_id,))
+
+
+class HTTPTaskStore:
+    """
+    远程任务存储：其他主机上的下载节点通过网页节点的 /api/worker/store/<方法> 读写任务
+    （网页节点需要设置相同的 YTD_WORKER_TOKEN）。变化通知只发给本进程的监听者。
+
+    Args:
+        base_url: 网页节点地址，如 http://192.168.1.10:5000
+        token: 共享的访问令牌
+        timeout: 每次请求的超时（秒）
+        retries: 网络错误时的重试次数（claim 不重试，避免同一个任务被领取两次后无人下载）
+    """
+
+    def __init__(self, base_url, token, timeout=30, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.retries = retries
+        self._listeners = []
+
+    def create(self, task):
+        task = self._call('create', task)
+        self._notify(task['task_id'])
+        return task
+
+    def create_or_join(self, task):
+        task, primary = self._call('create_or_join', task)
+        self._notify(task['task_id'])
+        return task, primary
+
+    def get(self, task_id):
+        return self._call('get', task_id)
+
+    def update(self, task_id, **fields):
+        updated = self._call('update', task_id, **fields)
+        if updated:
+            self._notify(task_id)
+        return updated
+
+    def delete(self, task_id):
+        deleted = self._call('delete', task_id)
+        if deleted:
+            self._notify(task_id)
+        return deleted
+
+    def find_by_status(self, *statuses, kind=None):
+        return self._call('find_by_status', *statuses, kind=kind)
+
+    def find_by_url(self, url):
+        return self._call('find_by_url', url)
+
+    def find_by_dedup_key(self, key, *statuses):
+        return self._call('find_by_dedup_key', key, *statuses)
+
+    def find_observers(self, primary_task_id):
+        return self._call('find_observers', primary_task_id)
+
+    def all(self, kind=None):
+        return self._call('all', kind=kind)
+
+    def count_by_status(self, kind=None):
+        return self._call('count_by_status', kind=kind)
+
+    def count_queued_primaries(self, exclude=None):
+        return self._call('count_queued_primaries', exclude=exclude)
+
+    def evict(self):
+        return self._call('evict')
+
+    def claim(self, worker, lease=None):
+        task = self._call('claim', worker, lease=lease, retry=False)
+        if task is not None:
+            self._notify(task['task_id'])
+        return task
+
+    def heartbeat(self, worker, task_ids, lease, info=None):
+        return self._call('heartbeat', worker, list(task_ids), lease, info=info)
+
+    def reassign_expired(self):
+        tasks = self._call('reassign_expired')
+        for task in tasks:
+            self._notify(task['task_id'])
+        return tasks
+
+    def nodes(self, max_age=None):
+        return self._call('nodes', max_age=max_age)
+
+    def recover(self, worker=None):
+        return self._call('recover', worker=worker)
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def close(self):
+        pass
+
+    def _notify(self, task_id):
+        for callback in self._listeners:
+            callback(task_id)
+
+    def _call(self, method, *args, retry=True, **kwargs):
+        body = json.dumps({'args': args, 'kwargs': kwargs}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(
+            f'{self.base_url}/api/worker/store/{method}', data=body,
+            headers={'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'},
+        )
+        attempts = self.retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    payload = json.load(response)
+                break
+            except urllib.error.HTTPError as e:
+                try:
+                    error = json.load(e).get('error')
+                except ValueError:
+                    error = None
+                raise RuntimeError(f'任务存储请求失败（{method}）: {error or e}') from e
+            except (urllib.error.URLError, OSError) as e:
+                if attempt + 1 >= attempts:
+                    raise ConnectionError(f'无法连接任务存储 {self.base_url}: {e}') from e
+                time.sleep(0.5 * (attempt + 1))
+        if not payload.get('success'):
+            raise RuntimeError(f"任务存储请求失败（{method}）: {payload.get('error')}")
+        return payload['result']
+
+
+# 下载节点可以通过 /api/worker/store 调用的方法
+REMOTE_METHODS = (
+    'create', 'create_or_join', 'get', 'update', 'delete', 'find_by_status', 'find_by_url', 'find_by_dedup_key',
+    'find_observers', 'all', 'count_by_status', 'count_queued_primaries', 'evict', 'claim', 'heartbeat',
+    'reassign_expired', 'nodes', 'recover',
+)
+
+
+def create_task_store(db_path=None, url=None, token=None, **kwargs):
+    """
+    根据配置创建任务存储：指定url时访问网页节点的任务存储（其他主机上的下载节点），
+    指定db_path时使用SQLite，否则使用内存
+    """
+    if url:
+        return HTTPTaskStore(url, token)
+    if db_path:
+        return SQLiteTaskStore(db_path, **kwargs)
+    return MemoryTaskStore(**kwargs)
+
+
+def _apply_update(task, fields):
+    """合并字段并维护时间戳"""
+    now = time.time()
+    if fields.get('status') in FINISHED_STATUSES and task.get('status') not in FINISHED_STATUSES:
+        fields.setdefault('finished_at', now)
+    task.update(fields)
+    task['updated_at'] = now
+
+
+def order_claimable(tasks):
+    """排队任务中可以开始的部分，按领取顺序排列"""
+    return sorted((task for task in tasks if _claimable(task)), key=_claim_order)
+
+
+def _claimable(task):
+    """排队任务是否可以开始：不是合并到其他下载的观察者任务，且已到重试时间"""
+    return not task.get('primary_task_id') and (task.get('retry_at') or 0) <= time.time()
+
+
+def _claim_order(task):
+    return -(task.get('priority') or 0), task.get('created_at') or 0
+
+
+def _extra_values(task):
+    """SQLite中 _EXTRA_COLUMNS 的值：kind, priority, primary_task_id, retry_at, dedup_key"""
+    return (task.get('kind'), task.get('priority') or 0, task.get('primary_task_id') or None,
+            task.get('retry_at') or None, task.get('dedup_key') or None)
+
+
+def _joinable(task):
+    """新建的任务是否需要查找相同的进行中下载"""
+    return bool(task.get('dedup_key')) and not task.get('primary_task_id') and not task.get('kind') \
+        and task.get('status') in INTERRUPTED_STATUSES
+
+
+def _queued_primary(task):
+    """是否是等待下载的主任务（count_queued_primaries 计入的任务）"""
+    return task.get('status') == 'queued' and not task.get('primary_task_id') and task.get('kind') is None
+
+
+def _discard(index, key, task_id):
+    if key is None:
+        return
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(task_id)
+        if not ids:
+            del index[key]
+
+
+def _claim_fields(worker, lease):
+    fields = {'status': 'downloading', 'worker': worker}
+    if lease:
+        fields['lease_expires'] = time.time() + lease
+    return fields
+
+
+def _holds_lease(task, worker):
+    """任务是否仍由该节点下载"""
+    return task is not None and task.get('status') == 'downloading' and task.get('worker') == worker
+
+
+def _lease_expired(task, now):
+    """只处理带租约领取的任务（单进程模式下的下载没有租约）"""
+    return task.get('lease_expires') is not None and task['lease_expires'] < now
+
+
+def _requeue_fields(task):
+    return {
+        'status': 'queued', 'worker': None, 'lease_expires': None, 'progress': 0, 'speed': 0, 'eta': 0,
+        'previous_worker': task.get('worker'), 'reassigned': (task.get('reassigned') or 0) + 1,
+    }
+
+
+def _recent_nodes(nodes, max_age):
+    if max_age is not None:
+        cutoff = time.time() - max_age
+        nodes = [node for node in nodes if node.get('last_seen', 0) >= cutoff]
+    return sorted(nodes, key=lambda node: node['node'])
+
+
+def _select_expired(finished, max_finished, finished_ttl):
+    """从已结束的任务中挑出需要清理的（超时的 + 超出数量的最早部分）"""
+    finished = sorted(finished, key=lambda t: t.get('finished_at') or t.get('updated_at') or 0)
+    expired = []
+    if finished_ttl:
+        cutoff = time.time() - finished_ttl
+        while finished and (finished[0].get('finished_at') or finished[0].get('updated_at') or 0) < cutoff:
+            expired.append(finished.pop(0))
+    if max_finished is not None and len(finished) > max_finished:
+        overflow = len(finished) - max_finished
+        expired.extend(finished[:overflow])
+    return expired
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""下载带宽分配（bandwidth.py）"""
+
+import time
+
+import pytest
+
+import bandwidth
+from bandwidth import BandwidthManager, fair_share, parse_rate
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('500K', 500 * 1024),
+    ('2M', 2 * 1024 ** 2),
+    ('1.5MiB', int(1.5 * 1024 ** 2)),
+    ('2MB/s', 2 * 1024 ** 2),
+    ('1000', 1000),
+    (2048, 2048),
+    ('', None),
+    (None, None),
+])
+def test_parse_rate(value, expected):
+    assert parse_rate(value) == expected
+
+
+@pytest.mark.parametrize('value', ['fast', '0', '-1M'])
+def test_parse_rate_invalid(value):
+    with pytest.raises(ValueError):
+        parse_rate(value)
+
+
+def test_fair_share_by_weight():
+    assert fair_share(300, {'a': (1, None), 'b': (2, None)}) == {'a': 100, 'b': 200}
+
+
+def test_fair_share_redistributes_unused_limit():
+    allocation = fair_share(300, {'slow': (1, 50), 'a': (1, None), 'b': (1, None)})
+    assert allocation == {'slow': 50, 'a': 125, 'b': 125}
+
+
+def test_fair_share_unlimited_total():
+    assert fair_share(None, {'a': (1, None), 'b': (1, 100)}) == {'a': None, 'b': 100}
+
+
+def test_manager_rebalances_on_register():
+    manager = BandwidthManager(1000)
+    manager.register('a')
+    assert manager.allocation('a') == 1000
+    manager.register('b', priority=2)
+    assert (manager.allocation('a'), manager.allocation('b')) == (250, 750)
+    manager.unregister('b')
+    assert manager.allocation('a') == 1000
+    assert manager.stats() == {'total_rate': 1000, 'active': 1, 'allocations': {'a': 1000}}
+
+
+def test_throttle_waits_when_over_rate(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(bandwidth.time, 'sleep', sleeps.append)
+    manager = BandwidthManager(1000)
+    manager.register('a')
+    # 第一次回调只确定起点
+    assert manager.throttle('a', {'downloaded_bytes': 0, 'tmpfilename': 'v.part'}) == 0
+    assert manager.throttle('a', {'downloaded_bytes': 3000, 'tmpfilename': 'v.part'}) == 3000
+    assert sleeps and sleeps[0] == pytest.approx(3.0, abs=0.1)
+
+    # 新文件从当前位置开始计数
+    assert manager.throttle('a', {'downloaded_bytes': 5000, 'tmpfilename': 'a.part'}) == 0
+
+
+def test_throttle_without_limit_counts_bytes():
+    manager = BandwidthManager()
+    manager.register('a')
+    manager.throttle('a', {'downloaded_bytes': 0, 'tmpfilename': 'v.part'})
+    started = time.monotonic()
+    assert manager.throttle('a', {'downloaded_bytes': 10 ** 9, 'tmpfilename': 'v.part'}) == 10 ** 9
+    assert time.monotonic() - started < 0.5
+    assert manager.throttle('unknown', {'downloaded_bytes': 10}) == 0
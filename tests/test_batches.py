@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""批量/播放列表下载（batches.py）"""
+
+import time
+
+from batches import BatchManager
+from scheduler import QueueFullError
+from task_store import MemoryTaskStore
+
+
+def wait_expanded(manager, batch_id):
+    deadline = time.time() + 5
+    while manager.summary(batch_id)['expanding']:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return manager.summary(batch_id)
+
+
+def make_manager(store, expand, full=0):
+    """submit_item 为每个链接新建任务；前 full 次提交时队列已满"""
+    attempts = []
+
+    def submit_item(url, batch_id, **params):
+        attempts.append(url)
+        if len(attempts) <= full:
+            raise QueueFullError('队列已满')
+        task_id = f'task{len(attempts)}'
+        store.create({'task_id': task_id, 'url': url, 'status': 'queued', 'batch_id': batch_id, **params})
+        return task_id
+
+    return BatchManager(store, submit_item, expand=expand, retry_interval=0.01), attempts
+
+
+def fake_expand(url, max_items=None):
+    if url == 'bad':
+        raise RuntimeError('无法解析')
+    entries = [{'url': f'{url}/{i}'} for i in range(3)]
+    return iter(entries[:max_items])
+
+
+def test_expand_and_summary():
+    store = MemoryTaskStore()
+    manager, attempts = make_manager(store, fake_expand, full=2)
+    batch_id = manager.create(['list', 'bad'], max_items=2, quality='720p')
+
+    summary = wait_expanded(manager, batch_id)
+    # 队列已满时等待后重试
+    assert attempts == ['list/0', 'list/0', 'list/0', 'list/1']
+    assert summary['total'] == 2 and summary['status'] == 'running'
+    assert summary['counts'] == {'queued': 2}
+    assert store.get(summary['children'][0])['quality'] == '720p'
+    assert summary['expand_errors'] == []
+
+    for task_id in summary['children']:
+        store.update(task_id, status='completed')
+    assert manager.summary(batch_id)['status'] == 'completed'
+    assert manager.summary(batch_id)['progress'] == 100
+
+
+def test_expand_errors_recorded():
+    store = MemoryTaskStore()
+    manager, _ = make_manager(store, fake_expand)
+    batch_id = manager.create(['bad'])
+    summary = wait_expanded(manager, batch_id)
+    assert summary['status'] == 'error'
+    assert summary['expand_errors'] == [{'url': 'bad', 'error': '无法解析'}]
+
+
+def test_recover_interrupted_batches():
+    store = MemoryTaskStore()
+    store.create({'task_id': 'b1', 'kind': 'batch', 'status': 'expanding', 'children': ['t1'], 'expand_errors': []})
+    store.create({'task_id': 'b2', 'kind': 'batch', 'status': 'expanding', 'children': [], 'expand_errors': []})
+    manager, _ = make_manager(store, fake_expand)
+    assert manager.recover() == 2
+    assert store.get('b1')['status'] == 'running'
+    assert store.get('b2')['status'] == 'error'
+    # 批次记录不计入下载任务
+    assert store.count_by_status() == {}
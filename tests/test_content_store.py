@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""内容寻址存储（content_store.py）"""
+
+import os
+
+import pytest
+
+from content_store import ContentStore, parse_size
+from fix_videos import store_fixed
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        stores.append(ContentStore(tmp_path / '.store', **kwargs))
+        return stores[-1]
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def test_parse_size():
+    assert parse_size('500M') == 500 * 1024 ** 2
+    assert parse_size('1.5G') == int(1.5 * 1024 ** 3)
+    assert parse_size('') is None
+    with pytest.raises(ValueError):
+        parse_size('abc')
+
+
+def test_ingest_hardlinks_same_content(tmp_path, make_store):
+    store = make_store()
+    a = write(tmp_path / 'a' / 'video.mp4', b'same content')
+    b = write(tmp_path / 'b' / 'copy.mp4', b'same content')
+
+    first = store.ingest(a, video_id='vid', format_id='137+140')
+    assert not first['deduplicated']
+    assert os.path.samefile(first['object'], a)
+    assert first['object'].endswith(os.path.join('objects', 'vid', f"137+140-{first['sha256'][:16]}.mp4"))
+
+    second = store.ingest(b, video_id='vid', format_id='137+140')
+    assert second['deduplicated'] and second['sha256'] == first['sha256']
+    assert os.path.samefile(a, b)
+    stats = store.stats()
+    assert (stats['objects'], stats['links'], stats['saved_bytes']) == (1, 2, len(b'same content'))
+    assert store.lookup(b) == {'sha256': first['sha256'], 'video_id': 'vid', 'format_id': '137+140'}
+
+
+def test_forget_removes_unlinked_object(tmp_path, make_store):
+    store = make_store()
+    path = write(tmp_path / 'video.mp4', b'data')
+    stored = store.ingest(path, video_id='vid')
+    path.unlink()
+    store.forget(path)
+    assert not os.path.exists(stored['object'])
+    assert store.stats()['objects'] == 0
+
+
+def test_prune_drops_replaced_files(tmp_path, make_store):
+    store = make_store()
+    path = write(tmp_path / 'video.mp4', b'old')
+    stored = store.ingest(path, video_id='vid')
+    # 文件被替换（不再是对象的硬链接）
+    path.unlink()
+    write(path, b'new')
+    assert store.prune() == 1
+    assert not os.path.exists(stored['object'])
+    assert path.read_bytes() == b'new'
+
+
+def fill(tmp_path, store):
+    paths = []
+    for i in range(3):
+        path = write(tmp_path / f'v{i}.mp4', bytes([i]) * 100)
+        store.ingest(path, video_id=f'v{i}')
+        paths.append(path)
+    return paths
+
+
+def test_quota_without_delete_files_keeps_files(tmp_path, make_store, capsys):
+    store = make_store(quota=150)
+    paths = fill(tmp_path, store)
+    assert store.evict() == []
+    assert store.evict() == []
+    assert all(path.exists() for path in paths)
+    assert capsys.readouterr().out.count('超出磁盘配额') == 1
+
+
+def test_lru_eviction(tmp_path, make_store):
+    store = make_store(quota=200, delete_files=True)
+    paths = fill(tmp_path, store)
+    store.record_access(paths[0])
+    protected = store.lookup(paths[2])['sha256']
+    assert store.evict(protect={protected}) == [str(paths[1])]
+    assert paths[0].exists() and paths[2].exists() and not paths[1].exists()
+    assert store.stats()['bytes'] == 200
+
+
+def test_lfu_eviction(tmp_path, make_store):
+    store = make_store(quota=250, policy='lfu', delete_files=True)
+    paths = fill(tmp_path, store)
+    store.record_access(paths[0])
+    store.record_access(paths[2])
+    assert store.evict() == [str(paths[1])]
+
+
+def test_fixed_output_ingested_with_source_video_id(tmp_path, make_store):
+    store = make_store()
+    source = write(tmp_path / 'video.mp4', b'broken')
+    store.ingest(source, video_id='vid', format_id='22')
+    store.close()
+    fixed = write(tmp_path / 'video_fixed.mp4', b'fixed')
+
+    store_fixed(str(tmp_path / '.store'), str(source), str(fixed))
+    store = make_store()
+    assert store.lookup(fixed)['video_id'] == 'vid'
+    assert store.lookup(fixed)['format_id'] == '22-fixed'
+
+    # --replace 删除了原文件
+    source.unlink()
+    store_fixed(str(tmp_path / '.store'), str(source), str(fixed))
+    assert store.lookup(source) is None
+    assert store.stats()['objects'] == 1
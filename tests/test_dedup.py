@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""下载去重（dedup.py）"""
+
+import threading
+
+import pytest
+
+from dedup import DownloadDeduplicator, download_key
+from task_store import MemoryTaskStore, SQLiteTaskStore
+
+
+def new_task(task_id, key='k'):
+    return {'task_id': task_id, 'status': 'queued', 'dedup_key': key}
+
+
+def test_download_key_depends_on_quality_and_directory(tmp_path):
+    url = 'https://www.youtube.com/watch?v=abcdefghijk'
+    assert download_key(url, 'best', tmp_path) == download_key(url, 'best', tmp_path)
+    assert download_key(url, 'best', tmp_path) != download_key(url, '720p', tmp_path)
+    assert download_key(url, 'best', tmp_path) != download_key(url, 'best', tmp_path / 'other')
+
+
+def test_same_key_joins_running_download():
+    store = MemoryTaskStore()
+    dedup = DownloadDeduplicator(store)
+    started = []
+    assert dedup.submit(new_task('a'), lambda: started.append('a')) == 'a'
+    assert dedup.submit(new_task('b'), lambda: started.append('b')) == 'a'
+    assert started == ['a']
+    assert store.get('b')['primary_task_id'] == 'a'
+    assert dedup.stats() == {'inflight': 1, 'observers': 1, 'completed': 0}
+
+
+def test_finish_syncs_observers_and_indexes_file(tmp_path):
+    store = MemoryTaskStore()
+    dedup = DownloadDeduplicator(store)
+    dedup.submit(new_task('a'), lambda: None)
+    dedup.submit(new_task('b'), lambda: None)
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'data')
+
+    assert dedup.finish('a', status='completed', filepath=str(path), filename=path.name) == ['b']
+    assert store.get('b')['status'] == 'completed'
+    assert dedup.find_completed('k')['filepath'] == str(path)
+    assert dedup.stats() == {'inflight': 0, 'observers': 0, 'completed': 1}
+
+    path.unlink()
+    assert dedup.find_completed('k') is None
+
+
+def test_key_none_never_deduplicates():
+    store = MemoryTaskStore()
+    dedup = DownloadDeduplicator(store)
+    for task_id in ('a', 'b'):
+        assert dedup.submit(new_task(task_id, key=None), lambda: None) == task_id
+    assert store.get('b').get('primary_task_id') is None
+
+
+def test_start_failure_is_not_registered():
+    store = MemoryTaskStore()
+    dedup = DownloadDeduplicator(store)
+
+    def fail():
+        raise RuntimeError('队列已满')
+
+    with pytest.raises(RuntimeError):
+        dedup.submit(new_task('a'), fail)
+    store.delete('a')
+    assert dedup.submit(new_task('b'), lambda: None) == 'b'
+
+
+def test_start_or_join_existing_records():
+    store = MemoryTaskStore()
+    dedup = DownloadDeduplicator(store)
+    for task_id in ('a', 'b'):
+        store.create(new_task(task_id))
+    assert dedup.start_or_join('a', 'k', lambda: None) == 'a'
+    assert dedup.start_or_join('b', 'k', lambda: None) == 'a'
+    assert store.get('b')['primary_task_id'] == 'a'
+
+
+@pytest.fixture
+def open_shared(request, tmp_path):
+    backend = getattr(request, 'param', 'memory')
+    stores = []
+    memory = MemoryTaskStore()
+
+    def open_store():
+        if backend == 'memory':
+            return memory
+        stores.append(SQLiteTaskStore(tmp_path / 'tasks.db'))
+        return stores[-1]
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+shared_backends = pytest.mark.parametrize('open_shared', ['memory', 'sqlite'], indirect=True)
+
+
+@shared_backends
+def test_shared_joins_download_from_other_process(open_shared):
+    web, worker = open_shared(), open_shared()
+    web_dedup, worker_dedup = DownloadDeduplicator(web, shared=True), DownloadDeduplicator(worker, shared=True)
+    started = []
+    assert web_dedup.submit(new_task('a'), lambda: started.append('a')) == 'a'
+    assert web_dedup.submit(new_task('b'), lambda: started.append('b')) == 'a'
+    assert started == ['a']
+    # shared 时不在进程中记录进行中的下载
+    assert web_dedup.stats() == {'shared': True, 'completed': 0}
+
+    worker.update('a', status='error', error='失败')
+    assert worker_dedup.finish('a', status='error', error='失败') == ['b']
+    assert web.get('b')['status'] == 'error'
+
+
+@shared_backends
+def test_shared_finished_primary_is_not_joined(open_shared):
+    """下载进程结束主任务后（web进程收不到 finish()），新请求开始新的下载"""
+    store = open_shared()
+    web = DownloadDeduplicator(store, shared=True)
+    web.submit(new_task('a'), lambda: None)
+    store.update('a', status='error', error='失败')
+
+    assert web.submit(new_task('b'), lambda: None) == 'b'
+    assert store.get('b').get('primary_task_id') is None
+
+
+@shared_backends
+def test_shared_completed_file_reused(open_shared, tmp_path):
+    store = open_shared()
+    worker, web = DownloadDeduplicator(store, shared=True), DownloadDeduplicator(open_shared(), shared=True)
+    web.submit(new_task('a'), lambda: None)
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'data')
+    store.update('a', status='completed', filepath=str(path), filename=path.name)
+    worker.finish('a', status='completed', filepath=str(path), filename=path.name)
+
+    assert web.find_completed('k')['task_id'] == 'a'
+    path.unlink()
+    assert web.find_completed('k') is None
+
+
+@shared_backends
+def test_shared_concurrent_submits_start_once(open_shared):
+    """多个进程同时提交相同的下载，只有一个成为主任务"""
+    dedups = [DownloadDeduplicator(open_shared(), shared=True) for _ in range(4)]
+    started = []
+    barrier = threading.Barrier(len(dedups) * 5)
+
+    def submit(dedup, task_id):
+        barrier.wait()
+        dedup.submit(new_task(task_id), lambda: started.append(task_id))
+
+    threads = [threading.Thread(target=submit, args=(dedup, f't{i}{j}'))
+               for i, dedup in enumerate(dedups) for j in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(started) == 1
+    store = dedups[0].store
+    assert len(store.find_by_dedup_key('k', 'queued')) == 1
+    assert len(store.find_observers(started[0])) == len(threads) - 1
+
+
+@shared_backends
+def test_shared_start_failure_fails_joined_observers(open_shared):
+    store = open_shared()
+    dedup = DownloadDeduplicator(store, shared=True)
+
+    def start():
+        # 开始前其他进程中的请求已经加入
+        DownloadDeduplicator(open_shared(), shared=True).submit(new_task('b'), lambda: None)
+        raise RuntimeError('队列已满')
+
+    with pytest.raises(RuntimeError):
+        dedup.submit(new_task('a'), start)
+    assert store.get('b')['status'] == 'error'
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""已下载文件的传输（delivery.py）"""
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+from delivery import FileDelivery  # noqa: E402
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    (tmp_path / 'video.mp4').write_bytes(DATA)
+    (tmp_path / '视频.mp4').write_bytes(DATA)
+
+    def make(**kwargs):
+        app = flask.Flask(__name__)
+        delivery = FileDelivery(**kwargs)
+
+        @app.route('/file/<name>')
+        def send(name):
+            return delivery.send(tmp_path / name, as_attachment=flask.request.args.get('dl') == '1')
+
+        return app.test_client()
+
+    return make
+
+
+def test_full_file_with_etag_and_304(make_client):
+    client = make_client()
+    response = client.get('/file/video.mp4')
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    etag = response.headers['ETag']
+
+    cached = client.get('/file/video.mp4', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+
+def test_range_request(make_client):
+    client = make_client()
+    response = client.get('/file/video.mp4', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == DATA[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(DATA)}'
+
+    unsatisfiable = client.get('/file/video.mp4', headers={'Range': f'bytes={len(DATA) + 10}-'})
+    assert unsatisfiable.status_code == 416
+
+
+def test_x_accel_offload(make_client, tmp_path):
+    client = make_client(mode='x-accel', accel_root=tmp_path, accel_prefix='/protected/')
+    response = client.get('/file/视频.mp4?dl=1')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == '/protected/%E8%A7%86%E9%A2%91.mp4'
+    assert "filename*=UTF-8''%E8%A7%86%E9%A2%91.mp4" in response.headers['Content-Disposition']
+
+    cached = client.get('/file/视频.mp4', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+
+
+def test_x_accel_outside_root_sent_directly(make_client, tmp_path):
+    client = make_client(mode='x-accel', accel_root=tmp_path / 'elsewhere')
+    response = client.get('/file/video.mp4')
+    assert 'X-Accel-Redirect' not in response.headers
+    assert response.data == DATA
+
+
+def test_x_sendfile(make_client, tmp_path):
+    response = make_client(mode='x-sendfile', max_age=60).get('/file/video.mp4')
+    assert response.headers['X-Sendfile'] == str((tmp_path / 'video.mp4').resolve())
+    assert 'max-age=60' in response.headers['Cache-Control']
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        FileDelivery(mode='ftp')
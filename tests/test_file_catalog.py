@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""已下载文件目录索引（file_catalog.py）"""
+
+import os
+
+import pytest
+
+from file_catalog import FileCatalog
+
+
+def write(path, size=10, mtime=None):
+    path.write_bytes(b'x' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def catalog():
+    return FileCatalog(refresh_interval=0)
+
+
+def test_scan_sort_search_and_page(tmp_path, catalog):
+    write(tmp_path / 'b.mp4', 30, mtime=1000)
+    write(tmp_path / 'a.webm', 10, mtime=3000)
+    write(tmp_path / 'c.mkv', 20, mtime=2000)
+    write(tmp_path / 'notes.txt')
+    catalog.add_directory(tmp_path)
+    catalog.refresh()
+
+    entries, total = catalog.query()
+    assert total == 3
+    assert [e['name'] for e in entries] == ['a.webm', 'c.mkv', 'b.mp4']
+    assert [e['name'] for e in catalog.query(sort='size', reverse=False)[0]] == ['a.webm', 'c.mkv', 'b.mp4']
+    assert [e['name'] for e in catalog.query(sort='name', reverse=False, offset=1, limit=1)[0]] == ['b.mp4']
+    assert catalog.query(ext='mp4')[1] == 1
+    assert catalog.query(search='C.')[0][0]['name'] == 'c.mkv'
+
+
+def test_add_file_without_rescan(tmp_path, catalog):
+    catalog.add_directory(tmp_path)
+    catalog.refresh()
+    etag = catalog.etag()
+    entry = catalog.add_file(write(tmp_path / 'new.mp4'))
+    assert entry['size'] == 10
+    assert catalog.query()[1] == 1
+    assert catalog.etag() != etag
+    assert catalog.add_file(write(tmp_path / 'ignored.txt')) is None
+
+
+def test_refresh_picks_up_external_changes(tmp_path, catalog):
+    catalog.add_directory(tmp_path)
+    catalog.refresh()
+    write(tmp_path / 'outside.mp4')
+    # 目录的mtime改变后重新扫描
+    os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 1_000_000_000))
+    catalog.refresh()
+    assert catalog.query()[1] == 1
+
+
+def test_temporary_directories_limited(tmp_path):
+    catalog = FileCatalog(max_temporary=1)
+    downloads, first, second = (tmp_path / name for name in ('downloads', 'first', 'second'))
+    for directory in (downloads, first, second):
+        directory.mkdir()
+    catalog.add_directory(downloads)
+    catalog.add_directory(first, temporary=True)
+    catalog.add_directory(second, temporary=True)
+    assert catalog.directories() == [str(downloads.resolve()), str(second.resolve())]
+
+
+def test_resolve_by_id_name_and_directory(tmp_path, catalog):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = catalog.add_file(write(tmp_path / 'a' / 'same.mp4'))
+    second = catalog.add_file(write(tmp_path / 'b' / 'same.mp4'))
+
+    assert first['id'] != second['id']
+    assert catalog.get(first['id'])['path'] == first['path']
+    assert [e['id'] for e in catalog.find_by_name('same.mp4')] == [first['id'], second['id']]
+    assert catalog.lookup(tmp_path / 'b', 'same.mp4')['id'] == second['id']
+    assert catalog.lookup(tmp_path / 'b', 'other.mp4') is None
+
+
+def test_remove_file_updates_indexes(tmp_path, catalog):
+    path = write(tmp_path / 'gone.mp4')
+    entry = catalog.add_file(path)
+    path.unlink()
+    catalog.remove_file(path)
+    assert catalog.get(entry['id']) is None
+    assert catalog.find_by_name('gone.mp4') == []
+    assert catalog.query()[1] == 0
+
+
+def test_rescan_replaces_index_entries(tmp_path, catalog):
+    catalog.add_directory(tmp_path)
+    path = write(tmp_path / 'old.mp4')
+    catalog.refresh(force=True)
+    path.rename(tmp_path / 'new.mp4')
+    catalog.refresh(force=True)
+    assert catalog.find_by_name('old.mp4') == []
+    assert catalog.find_by_name('new.mp4')[0]['name'] == 'new.mp4'
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""下载格式选择策略（format_policy.py）"""
+
+import pytest
+
+from format_policy import format_options, parse_quality, policy_key
+
+# 按质量从低到高排列（yt-dlp按 DEFAULT_FORMAT_SORT 排序后的顺序，相同分辨率优先H.264）
+FORMATS = [
+    {'format_id': '18', 'ext': 'mp4', 'height': 360, 'vcodec': 'avc1', 'acodec': 'mp4a', 'protocol': 'https'},
+    {'format_id': '96', 'ext': 'mp4', 'height': 1080, 'vcodec': 'avc1', 'acodec': 'mp4a', 'protocol': 'm3u8_native'},
+    {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a', 'protocol': 'https'},
+    {'format_id': '22', 'ext': 'mp4', 'height': 720, 'vcodec': 'avc1', 'acodec': 'mp4a', 'protocol': 'https'},
+    {'format_id': '136', 'ext': 'mp4', 'height': 720, 'vcodec': 'avc1', 'acodec': 'none', 'protocol': 'https'},
+    {'format_id': '399', 'ext': 'mp4', 'height': 1080, 'vcodec': 'av01', 'acodec': 'none', 'protocol': 'https'},
+    {'format_id': '137', 'ext': 'mp4', 'height': 1080, 'vcodec': 'avc1', 'acodec': 'none', 'protocol': 'https'},
+]
+
+
+def select(**kwargs):
+    """用yt-dlp的格式选择器在 FORMATS 中选择，返回 format_id"""
+    yt_dlp = pytest.importorskip('yt_dlp')
+    spec = format_options(**kwargs)['format']
+    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+        selector = ydl.build_format_selector(spec)
+        chosen = list(selector({'formats': [dict(f) for f in FORMATS], 'has_merged_format': True}))
+    return chosen[0]['format_id'] if chosen else None
+
+
+@pytest.mark.parametrize('quality, expected', [
+    ('best', ('best', None)),
+    ('720p', ('best', 720)),
+    ('1440', ('best', 1440)),
+    ('economy-480p', ('economy', 480)),
+    ('worst', ('worst', None)),
+])
+def test_parse_quality(quality, expected):
+    assert parse_quality(quality) == expected
+
+
+@pytest.mark.parametrize('quality', ['8k', '100p', 'economy-abc'])
+def test_parse_quality_invalid(quality):
+    with pytest.raises(ValueError):
+        parse_quality(quality)
+
+
+def test_policy_key():
+    assert policy_key('720p') == 'best-720-auto'
+    assert policy_key('best', codec='av1', single=True) == 'best-any-av1-single'
+
+
+def test_options_are_copies():
+    options = format_options('best', merge=True)
+    options['format_sort'].append('x')
+    assert 'x' not in format_options('best', merge=True)['format_sort']
+    assert options['merge_output_format'] == 'mp4'
+    assert 'merge_output_format' not in format_options('best', merge=False)
+    with pytest.raises(ValueError):
+        format_options(codec='mpeg2')
+
+
+def test_merge_selects_video_plus_audio_without_hls():
+    assert select(quality='best', merge=True) == '137+140'
+    assert select(quality='720p', merge=True) == '136+140'
+
+
+def test_single_format_needs_audio_and_video():
+    assert select(quality='best', merge=False) == '22'
+    assert select(quality='worst', merge=False) == '18'
+
+
+def test_strict_excludes_format_96():
+    assert '96' not in select(quality='best', strict=True)
+    assert select(quality='best', strict=True) == '22'
+
+
+def test_codec_preference():
+    assert select(quality='best', merge=True, codec='av1') == '399+140'
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""批量获取视频信息（info_batch.py）"""
+
+import threading
+import time
+
+import pytest
+
+from info_batch import BatchInfoResolver
+
+
+class Resolver:
+    """记录同时解析的链接数；链接以 slow 开头时解析 slow_delay 秒"""
+
+    def __init__(self, slow_delay=0.5):
+        self.slow_delay = slow_delay
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.calls.append(url)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.slow_delay if url.startswith('slow') else 0.01)
+            if url.startswith('bad'):
+                raise RuntimeError('解析失败')
+            return {'success': True, 'title': url}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def resolvers():
+    created = []
+
+    def make(*args, **kwargs):
+        resolver = BatchInfoResolver(*args, **kwargs)
+        created.append(resolver)
+        return resolver
+
+    yield make
+    for resolver in created:
+        resolver.shutdown()
+
+
+def test_per_batch_defaults_to_fraction_of_workers(resolvers):
+    assert resolvers(Resolver(), workers=8).per_batch == 4
+    assert resolvers(Resolver(), workers=1).per_batch == 1
+    assert resolvers(Resolver(), workers=8, per_batch=3).per_batch == 3
+
+
+def test_returns_every_url_once(resolvers):
+    resolve = Resolver()
+    resolver = resolvers(resolve, workers=4)
+    urls = [f'u{i}' for i in range(10)] + ['bad']
+    results = {index: info for index, _, info in resolver.iter_results(urls)}
+
+    assert sorted(results) == list(range(len(urls)))
+    assert results[0] == {'success': True, 'title': 'u0'}
+    assert results[10] == {'success': False, 'error': '解析失败'}
+    assert resolve.peak <= 2
+
+
+def test_cached_urls_first_without_resolving(resolvers):
+    resolve = Resolver()
+    resolver = resolvers(resolve, cached=lambda url: {'success': True, 'cached': True} if url == 'hit' else None)
+    results = list(resolver.iter_results(['miss', 'hit']))
+
+    assert results[0] == (1, 'hit', {'success': True, 'cached': True})
+    assert resolve.calls == ['miss']
+
+
+def test_timeout_returns_error(resolvers):
+    resolver = resolvers(Resolver(slow_delay=1.0), workers=2, per_batch=2)
+    started = time.monotonic()
+    results = dict((url, info) for _, url, info in resolver.iter_results(['slow', 'fast'], timeout=0.2))
+
+    assert time.monotonic() - started < 0.8
+    assert results['slow']['timeout'] is True
+    assert results['fast']['success'] is True
+
+
+def test_timed_out_urls_keep_batch_slots(resolvers):
+    """超时后仍在后台解析的链接占用批次名额，批次同时解析的链接数不超过 per_batch"""
+    resolve = Resolver(slow_delay=0.6)
+    resolver = resolvers(resolve, workers=8, per_batch=2)
+    urls = ['slow1', 'slow2'] + [f'u{i}' for i in range(4)]
+    results = list(resolver.iter_results(urls, timeout=0.1))
+
+    assert len(results) == len(urls)
+    assert sum(1 for _, _, info in results if info.get('timeout')) == 2
+    assert resolve.peak <= 2
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""视频元数据缓存（metadata_cache.py）"""
+
+import threading
+import time
+
+from metadata_cache import MetadataCache, cache_key, normalize_url
+
+VIDEO = 'https://www.youtube.com/watch?v=abcdefghijk'
+
+
+def test_cache_key_shared_by_link_forms():
+    assert cache_key(VIDEO) == cache_key('https://youtu.be/abcdefghijk?si=x') == 'youtube:abcdefghijk'
+    assert cache_key('https://www.youtube.com/shorts/abcdefghijk') == 'youtube:abcdefghijk'
+    assert normalize_url('HTTPS://Example.com/v?b=2&utm_source=x&a=1#t') == 'https://example.com/v?a=1&b=2'
+
+
+def test_returns_copies():
+    cache = MetadataCache()
+    cache.put(VIDEO, {'title': 'T', 'formats': [1]})
+    info = cache.get(VIDEO)
+    info['formats'].append(2)
+    assert cache.get('https://youtu.be/abcdefghijk') == {'title': 'T', 'formats': [1]}
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    cache = MetadataCache(ttl=60)
+    cache.put(VIDEO, {'title': 'T'})
+    now[0] += 59
+    assert cache.get(VIDEO) is not None
+    now[0] += 2
+    assert cache.get(VIDEO) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_lru_eviction():
+    cache = MetadataCache(max_entries=2)
+    for name in ('a', 'b'):
+        cache.put(f'https://example.com/{name}', {'title': name})
+    cache.get('https://example.com/a')
+    cache.put('https://example.com/c', {'title': 'c'})
+    assert cache.get('https://example.com/b') is None
+    assert cache.get('https://example.com/a') == {'title': 'a'}
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['size'] == 2
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    db = tmp_path / 'metadata.db'
+    MetadataCache(db_path=db).put(VIDEO, {'title': 'T'})
+    cache = MetadataCache(db_path=db)
+    assert cache.get(VIDEO) == {'title': 'T'}
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_concurrent_extracts_once():
+    cache = MetadataCache()
+    calls = []
+    release = threading.Event()
+
+    def extractor(url):
+        calls.append(url)
+        release.wait(5)
+        return {'title': 'T'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_extract(VIDEO, extractor)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{'title': 'T'}] * 5
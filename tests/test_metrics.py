@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""运行指标（metrics.py）"""
+
+import urllib.request
+
+import pytest
+
+from metrics import CONTENT_TYPE, Registry, start_metrics_server
+
+
+def test_counter_and_gauge_text_format():
+    registry = Registry()
+    downloads = registry.counter('ytd_downloads_total', '完成的下载数', labels=('status',))
+    downloads.inc(status='completed')
+    downloads.inc(2, status='error')
+    registry.gauge('ytd_queue_length', '等待下载的任务数', callback=lambda: 3)
+    registry.gauge('ytd_tasks', '各状态的任务数', labels=('status',),
+                   callback=lambda: {'queued': 1, 'downloading': None})
+
+    assert registry.render() == (
+        '# HELP ytd_downloads_total 完成的下载数\n'
+        '# TYPE ytd_downloads_total counter\n'
+        'ytd_downloads_total{status="completed"} 1\n'
+        'ytd_downloads_total{status="error"} 2\n'
+        '# HELP ytd_queue_length 等待下载的任务数\n'
+        '# TYPE ytd_queue_length gauge\n'
+        'ytd_queue_length 3\n'
+        '# HELP ytd_tasks 各状态的任务数\n'
+        '# TYPE ytd_tasks gauge\n'
+        'ytd_tasks{status="queued"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('ytd_stage_seconds', '阶段耗时', labels=('stage',), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage='merge')
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'ytd_stage_seconds_bucket{stage="merge",le="0.1"} 1',
+        'ytd_stage_seconds_bucket{stage="merge",le="1"} 3',
+        'ytd_stage_seconds_bucket{stage="merge",le="+Inf"} 4',
+        'ytd_stage_seconds_sum{stage="merge"} 6.05',
+        'ytd_stage_seconds_count{stage="merge"} 4',
+    ]
+
+
+def test_timer_and_label_escaping():
+    registry = Registry()
+    histogram = registry.histogram('ytd_seconds', '耗时')
+
+    @histogram.time()
+    def work():
+        return 'done'
+
+    assert work() == 'done'
+    with histogram.time():
+        pass
+    assert 'ytd_seconds_count 2' in registry.render()
+
+    counter = registry.counter('ytd_errors_total', '错误', labels=('error',))
+    counter.inc(error='say "hi"\n')
+    assert 'ytd_errors_total{error="say \\"hi\\"\\n"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        counter.inc(reason='x')
+    with pytest.raises(ValueError):
+        registry.counter('ytd_errors_total', '重复')
+
+
+def test_failing_callback_skipped():
+    registry = Registry()
+    registry.gauge('ytd_broken', '出错的回调', callback=lambda: 1 / 0)
+    registry.gauge('ytd_ok', '正常', callback=lambda: 1)
+    assert registry.render() == '# HELP ytd_ok 正常\n# TYPE ytd_ok gauge\nytd_ok 1\n'
+
+
+def test_metrics_server():
+    registry = Registry()
+    registry.counter('ytd_total', '计数').inc()
+    server = start_metrics_server(registry, port=0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert b'ytd_total 1' in response.read()
+    finally:
+        server.shutdown()
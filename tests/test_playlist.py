@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""播放列表/频道展开（playlist.py）"""
+
+import pytest
+
+import playlist
+
+
+class FakeExtractor:
+    def __init__(self, single):
+        self.single = single
+
+    def is_single_video(self, url):
+        return self.single
+
+
+class FakeYDL:
+    """extract_info 返回预先准备的结果，并记录请求过的链接"""
+
+    EXTRACTORS = {'Video': FakeExtractor(True), 'Tab': FakeExtractor(None), 'Playlist': FakeExtractor(False)}
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def extract_info(self, url, download=False, process=True):
+        self.requested.append(url)
+        return self.pages[url]
+
+    def get_info_extractor(self, ie_key):
+        return self.EXTRACTORS[ie_key]
+
+
+def url_entry(url, ie_key=None):
+    return {'_type': 'url', 'url': url, 'ie_key': ie_key, 'id': url.rsplit('/', 1)[-1], 'title': url}
+
+
+def walk(ydl, url):
+    return [entry['url'] for entry in playlist._walk(ydl, url, 0, {'expansions': playlist.MAX_EXPANSIONS})]
+
+
+def test_single_video():
+    ydl = FakeYDL({'v': {'id': 'v', 'title': 'T', 'webpage_url': 'https://x/v'}})
+    assert walk(ydl, 'v') == ['https://x/v']
+
+
+def test_video_entries_not_requested():
+    """已知是单个视频、或没有专门提取器的条目直接生成，不逐条请求"""
+    ydl = FakeYDL({'list': {'_type': 'playlist', 'entries': [
+        url_entry('https://x/a', 'Video'), url_entry('https://x/b', 'Generic'), None, url_entry('https://x/c'),
+    ]}})
+    assert walk(ydl, 'list') == ['https://x/a', 'https://x/b', 'https://x/c']
+    assert ydl.requested == ['list']
+
+
+def test_channel_tabs_expanded():
+    ydl = FakeYDL({
+        'channel': {'_type': 'playlist', 'entries': [url_entry('tab1', 'Tab'), url_entry('list2', 'Playlist')]},
+        'tab1': {'_type': 'playlist', 'entries': [url_entry('https://x/a', 'Video')]},
+        'list2': {'_type': 'playlist', 'entries': [url_entry('https://x/b', 'Video')]},
+    })
+    assert walk(ydl, 'channel') == ['https://x/a', 'https://x/b']
+
+
+def test_expansions_capped(monkeypatch):
+    monkeypatch.setattr(playlist, 'MAX_EXPANSIONS', 1)
+    ydl = FakeYDL({
+        'channel': {'_type': 'playlist', 'entries': [url_entry('tab1', 'Tab'), url_entry('tab2', 'Tab')]},
+        'tab1': {'_type': 'playlist', 'entries': [url_entry('https://x/a', 'Video')]},
+    })
+    # 超过上限的条目不展开，下载时再处理
+    assert walk(ydl, 'channel') == ['https://x/a', 'tab2']
+    assert ydl.requested == ['channel', 'tab1']
+
+
+def test_depth_limited():
+    pages = {f'p{i}': {'_type': 'playlist', 'entries': [url_entry(f'p{i + 1}', 'Playlist')]} for i in range(10)}
+    ydl = FakeYDL(pages)
+    assert walk(ydl, 'p0') == [f'p{playlist.MAX_DEPTH + 1}']
+    assert len(ydl.requested) == playlist.MAX_DEPTH + 1
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.youtube.com/watch?v=abcdefghijk', False),
+    ('https://www.youtube.com/playlist?list=PLabc', True),
+    ('https://example.com/video', False),
+])
+def test_is_playlist_by_url(url, expected):
+    yt_dlp = pytest.importorskip('yt_dlp')
+    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+        assert playlist._is_playlist(ydl, {}, url) is expected
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""下载后的处理流水线（postprocess.py）"""
+
+import hashlib
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+import postprocess
+from postprocess import PostProcessJob, PostProcessPipeline, parse_stage_workers, parse_stages
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='需要ffmpeg')
+
+
+class Recorder:
+    """记录 on_stage / on_done 的回调，等待处理结束"""
+
+    def __init__(self):
+        self.stages = []
+        self.result = None
+        self.done = threading.Event()
+
+    def on_stage(self, task_id, stage, index, count):
+        self.stages.append((stage, index, count))
+
+    def on_done(self, job, error):
+        self.result = (job, error)
+        self.done.set()
+
+    def wait(self):
+        assert self.done.wait(10)
+        return self.result
+
+
+@pytest.fixture
+def run_pipeline():
+    pipelines = []
+
+    def run(job, **kwargs):
+        recorder = Recorder()
+        pipeline = PostProcessPipeline(on_stage=recorder.on_stage, on_done=recorder.on_done, **kwargs)
+        pipelines.append(pipeline)
+        pipeline.submit(job)
+        return recorder.wait() + (recorder.stages,)
+
+    yield run
+    for pipeline in pipelines:
+        pipeline.drain(timeout=5)
+
+
+def test_parse_stages():
+    assert parse_stages('verify, checksum') == ('verify', 'checksum')
+    assert parse_stages('') == ()
+    with pytest.raises(ValueError):
+        parse_stages('verify,upload')
+    assert parse_stage_workers('transcode=2')['transcode'] == 2
+    with pytest.raises(ValueError):
+        parse_stage_workers('merge=x')
+
+
+def test_plan(monkeypatch):
+    monkeypatch.setattr(postprocess, 'has_ffmpeg', lambda: True)
+    pipeline = PostProcessPipeline(stages=('verify', 'checksum'))
+    assert pipeline.plan(PostProcessJob('t', 'a.mp4')) == ['verify', 'checksum']
+    job = PostProcessJob('t', 'a.mp4', parts=[{'path': 'a.f1.mp4'}], options={'transcode': True})
+    assert pipeline.plan(job) == ['merge', 'verify', 'transcode', 'checksum']
+
+    monkeypatch.setattr(postprocess, 'has_ffmpeg', lambda: False)
+    assert pipeline.plan(job) == ['verify', 'checksum']
+    with pytest.raises(postprocess.StageError):
+        pipeline.submit(job)
+    pipeline.drain(timeout=1)
+
+
+def test_checksum_stage(tmp_path, run_pipeline):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'video data')
+    job, error, stages = run_pipeline(PostProcessJob('t', path), stages=('checksum',))
+    assert error is None
+    assert stages == [('checksum', 0, 1)]
+    assert job.fields['sha256'] == hashlib.sha256(b'video data').hexdigest()
+
+
+def test_required_stage_failure_stops(tmp_path, run_pipeline):
+    job, error, stages = run_pipeline(PostProcessJob('t', tmp_path / 'missing.mp4'), stages=('verify', 'checksum'))
+    assert isinstance(error, postprocess.StageError)
+    assert [stage for stage, _, _ in stages] == ['verify']
+
+
+def test_optional_stage_failure_keeps_going(tmp_path, run_pipeline, monkeypatch):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'video data')
+    monkeypatch.setattr(postprocess, 'has_ffmpeg', lambda: True)
+
+    def fail(cmd):
+        raise postprocess.StageError('ffmpeg失败')
+
+    monkeypatch.setattr(postprocess, 'run_ffmpeg', fail)
+    monkeypatch.setattr(postprocess, 'probe_video', lambda path: None)
+    job, error, stages = run_pipeline(PostProcessJob('t', path), stages=('thumbnail', 'checksum'))
+    assert error is None
+    assert job.warnings == ['thumbnail: ffmpeg失败']
+    assert 'sha256' in job.fields
+
+
+def test_replacing_stage_postponed_while_busy(tmp_path, run_pipeline, monkeypatch):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(b'video data')
+    monkeypatch.setattr(postprocess, 'POSTPONE_INTERVAL', 0.01)
+    monkeypatch.setattr(postprocess, 'has_ffmpeg', lambda: True)
+    remuxed = []
+    monkeypatch.setattr(PostProcessPipeline, '_remux', lambda self, job: remuxed.append(job.postponed))
+    checks = iter([True, True, False])
+    job, error, stages = run_pipeline(PostProcessJob('t', path), stages=('remux',), busy=lambda job: next(checks))
+    assert error is None
+    assert remuxed == [2]
+
+    monkeypatch.setattr(postprocess, 'MAX_POSTPONES', 1)
+    remuxed.clear()
+    job, error, stages = run_pipeline(PostProcessJob('t', path), stages=('remux',), busy=lambda job: True)
+    assert remuxed == [] and job.warnings
+
+
+@needs_ffmpeg
+def test_merge_parts(tmp_path, run_pipeline):
+    video, audio = tmp_path / 'v.f1.mp4', tmp_path / 'v.f2.m4a'
+    ffmpeg = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi']
+    subprocess.run(ffmpeg + ['-i', 'color=c=black:s=64x64:d=0.5', '-c:v', 'mpeg4', str(video)], check=True)
+    subprocess.run(ffmpeg + ['-i', 'sine=d=0.5', '-c:a', 'aac', str(audio)], check=True)
+    output = tmp_path / 'v.mp4'
+    # 编码未知（None）的部分使用可选映射，音频文件中没有视频流也能合并
+    parts = [{'path': str(video), 'vcodec': 'mp4v', 'acodec': 'none'},
+             {'path': str(audio), 'vcodec': None, 'acodec': None}]
+    job, error, stages = run_pipeline(PostProcessJob('t', output, parts=parts), stages=())
+    assert error is None
+    assert [stage for stage, _, _ in stages] == ['merge']
+    assert output.stat().st_size > 0
+    assert not video.exists() and not audio.exists()
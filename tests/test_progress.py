@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""下载进度跟踪（progress.py）"""
+
+from progress import DOWNLOAD_SHARE, ProgressRecord, ProgressTracker
+from task_store import MemoryTaskStore
+
+
+def test_fraction_weighted_by_bytes():
+    record = ProgressRecord()
+    record.sizes = [300, 100]
+    record.current_file = 'video'
+    record.current_total = 300
+    record.current_downloaded = 150
+    assert record.fraction() == 150 / 400
+
+    record.index, record.done_bytes = 1, 300
+    record.current_file, record.current_total, record.current_downloaded = 'audio', 100, 50
+    assert record.fraction() == 350 / 400
+    assert record.progress() == int(350 / 400 * DOWNLOAD_SHARE)
+
+
+def test_fraction_by_file_count_when_size_unknown():
+    record = ProgressRecord()
+    record.sizes = [None, None]
+    record.current_file = 'video'
+    record.current_total = 200
+    record.current_downloaded = 100
+    assert record.fraction() == 0.25
+    record.index = 2
+    record.current_file = None
+    assert record.fraction() == 1.0
+
+
+def test_postprocessing_phases_use_download_share():
+    record = ProgressRecord()
+    record.phase = 'merging'
+    assert record.progress() == DOWNLOAD_SHARE
+
+
+def download(filename, downloaded, total, vcodec='avc1', acodec='none', status='downloading'):
+    return {'status': status, 'filename': filename, 'tmpfilename': f'{filename}.part', 'downloaded_bytes': downloaded,
+            'total_bytes': total, 'speed': 1000, 'eta': 1, 'info_dict': {'vcodec': vcodec, 'acodec': acodec}}
+
+
+def test_tracker_phases_and_store_writes():
+    store = MemoryTaskStore()
+    store.create({'task_id': 't', 'status': 'downloading'})
+    tracker = ProgressTracker(store, flush_interval=60)
+    tracker.start('t')
+    assert store.get('t')['phase'] == 'extracting'
+    tracker.plan('t', [{'filesize': 100}, {'filesize': 100}])
+
+    tracker.on_download('t', download('v.f1.mp4', 10, 100))
+    assert store.get('t')['phase'] == 'downloading_video'
+    assert store.get('t')['partial'] == 'v.f1.mp4.part'
+    # 同一阶段内间隔未到时只更新内存中的记录
+    tracker.on_download('t', download('v.f1.mp4', 50, 100))
+    assert store.get('t')['downloaded_bytes'] == 10
+    assert tracker.snapshot('t')['downloaded_bytes'] == 50
+
+    tracker.on_download('t', download('v.f1.mp4', 100, 100, status='finished'))
+    tracker.on_download('t', download('v.f2.m4a', 10, 100, vcodec='none', acodec='mp4a'))
+    assert store.get('t')['phase'] == 'downloading_audio'
+    assert store.get('t')['progress'] == int(110 / 200 * DOWNLOAD_SHARE)
+
+    tracker.on_postprocessor('t', {'status': 'started', 'postprocessor': 'Merger'})
+    assert store.get('t')['phase'] == 'merging'
+    tracker.finish('t')
+    assert tracker.snapshot('t') is None
+
+
+def test_postprocessor_timing_kept_in_record():
+    store = MemoryTaskStore()
+    store.create({'task_id': 't', 'status': 'downloading'})
+    tracker = ProgressTracker(store)
+    tracker.start('t')
+    assert tracker.on_postprocessor('t', {'status': 'started', 'postprocessor': 'FixupM3u8'}) is None
+    assert tracker.on_postprocessor('t', {'status': 'finished', 'postprocessor': 'FixupM3u8'}) >= 0
+    assert tracker.on_postprocessor('t', {'status': 'finished', 'postprocessor': 'FixupM3u8'}) is None
+
+    # 任务出错结束时，未结束的后处理器的开始时间随进度记录一起清除
+    tracker.on_postprocessor('t', {'status': 'started', 'postprocessor': 'Merger'})
+    tracker.finish('t')
+    tracker.start('t')
+    assert tracker.on_postprocessor('t', {'status': 'finished', 'postprocessor': 'Merger'}) is None
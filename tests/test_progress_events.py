@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""下载进度推送（progress_events.py）"""
+
+import json
+import threading
+import time
+
+from progress_events import TaskEventBroker
+from task_store import MemoryTaskStore
+
+
+def serialize(task):
+    return {'status': task['status'], 'progress': task.get('progress', 0)}
+
+
+def parse(chunk):
+    """SSE文本 -> (event, data)；注释（心跳）返回 ('comment', 文本)"""
+    if chunk.startswith(':'):
+        return 'comment', chunk.strip()
+    fields = dict(line.split(': ', 1) for line in chunk.strip().splitlines())
+    return fields.get('event'), json.loads(fields['data']) if 'data' in fields else None
+
+
+def collect(stream, until, timeout=5):
+    """在后台线程中读取事件，直到 until(events) 为True或超时"""
+    events = []
+    done = threading.Event()
+
+    def read():
+        for chunk in stream:
+            events.append(parse(chunk))
+            if until(events):
+                break
+        done.set()
+
+    threading.Thread(target=read, daemon=True).start()
+    assert done.wait(timeout), events
+    return events
+
+
+def test_sends_changed_fields_until_finished():
+    store = MemoryTaskStore()
+    store.create({'task_id': 't', 'status': 'downloading', 'progress': 10})
+    broker = TaskEventBroker(store, serialize, min_interval=0.01, poll_interval=1)
+    stream = broker.stream(['t'])
+    assert next(stream) == 'retry: 2000\n\n'
+    assert parse(next(stream)) == ('progress', {'status': 'downloading', 'progress': 10, 'task_id': 't'})
+
+    store.update('t', progress=50)
+    assert parse(next(stream)) == ('progress', {'progress': 50, 'task_id': 't'})
+    store.update('t', status='completed', progress=100)
+    assert parse(next(stream)) == ('progress', {'status': 'completed', 'progress': 100, 'task_id': 't'})
+    assert parse(next(stream)) == ('end', {})
+
+
+def test_coalesces_changes_within_min_interval():
+    store = MemoryTaskStore()
+    store.create({'task_id': 't', 'status': 'downloading', 'progress': 0})
+    broker = TaskEventBroker(store, serialize, min_interval=0.3, poll_interval=1)
+    stream = broker.stream(['t'])
+    next(stream)
+    next(stream)
+
+    def updates():
+        for progress in range(1, 11):
+            store.update('t', progress=progress)
+            time.sleep(0.01)
+
+    writer = threading.Thread(target=updates)
+    writer.start()
+    events = collect(stream, lambda events: events[-1][1].get('progress') == 10)
+    writer.join()
+    assert len(events) <= 3
+
+
+def test_keepalive_while_other_tasks_change():
+    """其他任务一直在变化时，跟踪的任务没有变化也按时间发送心跳"""
+    store = MemoryTaskStore()
+    store.create({'task_id': 't', 'status': 'downloading'})
+    store.create({'task_id': 'other', 'status': 'downloading'})
+    broker = TaskEventBroker(store, serialize, min_interval=0, heartbeat=0.2, poll_interval=1)
+    stop = threading.Event()
+
+    def churn():
+        progress = 0
+        while not stop.is_set():
+            progress += 1
+            store.update('other', progress=progress)
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        stream = broker.stream(['t'])
+        events = collect(stream, lambda events: events[-1][0] == 'comment', timeout=2)
+    finally:
+        stop.set()
+        thread.join()
+    assert events[-1] == ('comment', ': keepalive')
+    assert [event for event, _ in events].count('progress') == 1
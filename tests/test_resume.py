@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""临时文件的清理（resume.PartialJanitor）"""
+
+import os
+import time
+
+from resume import PartialJanitor, is_partial_file, partial_stem
+
+
+def touch(path, age=0):
+    path.write_bytes(b'x' * 10)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_partial_stem():
+    assert partial_stem('Title.f137.mp4.part') == 'Title'
+    assert partial_stem('/videos/Title.mp4.part-Frag3') == 'Title'
+    assert partial_stem('Title.mp4.ytdl') == 'Title'
+
+
+def test_finished_file_with_format_like_title_is_kept(tmp_path):
+    """标题以 .f数字 结尾的已完成文件（'Race F1.f1.mp4'）不是临时文件"""
+    assert not is_partial_file('Race F1.f1.mp4')
+    finished = touch(tmp_path / 'Race F1.f1.mp4', age=7200)
+
+    janitor = PartialJanitor(lambda: [str(tmp_path)], set, max_age=3600)
+    assert janitor.run_once() == (0, 0)
+    assert finished.exists()
+
+
+def test_format_files_removed_with_partial_sibling_or_known_task(tmp_path):
+    video = touch(tmp_path / 'Title.f137.mp4', age=7200)
+    audio = touch(tmp_path / 'Title.f140.m4a.part', age=7200)
+    orphan = touch(tmp_path / 'Other.f137.mp4', age=7200)
+    known = touch(tmp_path / 'Failed.f137.mp4', age=7200)
+
+    janitor = PartialJanitor(lambda: [str(tmp_path)], set, max_age=3600, known=lambda: {'Failed'})
+    assert janitor.run_once()[0] == 3
+    assert not video.exists() and not audio.exists() and not known.exists()
+    assert orphan.exists()
+
+
+def test_run_once_removes_only_old_unprotected_partials(tmp_path):
+    old = touch(tmp_path / 'Old.mp4.part', age=7200)
+    fresh = touch(tmp_path / 'Fresh.mp4.part')
+    active = touch(tmp_path / 'Active.f137.mp4.part', age=7200)
+    video = touch(tmp_path / 'Done.mp4', age=7200)
+
+    janitor = PartialJanitor(lambda: [str(tmp_path)], lambda: {'Active'}, max_age=3600)
+    assert janitor.run_once() == (1, 10)
+    assert not old.exists()
+    assert fresh.exists() and active.exists() and video.exists()
+
+
+def test_only_listed_directories_are_cleaned(tmp_path):
+    listed, other = tmp_path / 'downloads', tmp_path / 'other'
+    listed.mkdir()
+    other.mkdir()
+    touch(listed / 'A.mp4.part', age=7200)
+    kept = touch(other / 'B.mp4.part', age=7200)
+
+    janitor = PartialJanitor(lambda: [str(listed)], set, max_age=3600)
+    assert janitor.run_once()[0] == 1
+    assert kept.exists()
+
+
+def test_missing_directory_is_ignored(tmp_path):
+    janitor = PartialJanitor(lambda: [str(tmp_path / 'missing')], set, max_age=0)
+    assert janitor.run_once() == (0, 0)
+
+
+def test_background_thread_stops(tmp_path):
+    touch(tmp_path / 'Old.mp4.part', age=7200)
+    janitor = PartialJanitor(lambda: [str(tmp_path)], set, max_age=3600, interval=0.05)
+    janitor.start()
+    deadline = time.monotonic() + 2
+    while (tmp_path / 'Old.mp4.part').exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    janitor.stop()
+    janitor._thread.join(1)
+    assert not (tmp_path / 'Old.mp4.part').exists()
+    assert not janitor._thread.is_alive()
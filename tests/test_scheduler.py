@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""下载任务调度器（scheduler.py）"""
+
+import threading
+
+import pytest
+
+from scheduler import DownloadScheduler, QueueFullError, SchedulerStoppedError
+
+
+class Recorder:
+    """记录执行顺序的handler；'block' 任务一直运行到 release()"""
+
+    def __init__(self):
+        self.calls = []
+        self.started = threading.Event()
+        self._release = threading.Event()
+
+    def __call__(self, task_id, *args):
+        if task_id == 'block':
+            self.started.set()
+            self._release.wait(5)
+        else:
+            self.calls.append((task_id,) + args)
+            if task_id == 'fail':
+                raise RuntimeError('下载失败')
+
+    def release(self):
+        self._release.set()
+
+
+@pytest.fixture
+def blocked():
+    """只有一个工作线程、并且它正在执行 'block' 任务的调度器"""
+    handler = Recorder()
+    scheduler = DownloadScheduler(handler, max_workers=1, max_queue=3)
+    scheduler.submit('block')
+    assert handler.started.wait(5)
+    yield scheduler, handler
+    handler.release()
+    scheduler.shutdown(timeout=5)
+
+
+def test_priority_then_fifo(blocked):
+    scheduler, handler = blocked
+    scheduler.submit('a')
+    scheduler.submit('b')
+    scheduler.submit('urgent', priority=5)
+    assert [scheduler.position(t) for t in ('urgent', 'a', 'b')] == [1, 2, 3]
+    assert scheduler.position('block') is None and scheduler.is_running('block')
+
+    handler.release()
+    assert scheduler.drain(timeout=5) == 0
+    assert [call[0] for call in handler.calls] == ['urgent', 'a', 'b']
+
+
+def test_queue_full(blocked):
+    scheduler, handler = blocked
+    for task_id in ('a', 'b', 'c'):
+        scheduler.submit(task_id)
+    with pytest.raises(QueueFullError):
+        scheduler.submit('d')
+    # 恢复的任务不受队列长度限制
+    scheduler.submit('recovered', enforce_limit=False)
+    assert scheduler.stats() == {'workers': 1, 'running': 1, 'queued': 4, 'max_queue': 3}
+
+
+def test_duplicate_submit_replaces_entry(blocked):
+    scheduler, handler = blocked
+    scheduler.submit('a', 'old')
+    scheduler.submit('b')
+    scheduler.submit('a', 'new', priority=1)
+    assert scheduler.stats()['queued'] == 2
+    assert scheduler.position('a') == 1
+
+    handler.release()
+    assert scheduler.drain(timeout=5) == 0
+    assert handler.calls == [('a', 'new'), ('b',)]
+
+
+def test_handler_error_keeps_worker(blocked):
+    scheduler, handler = blocked
+    scheduler.submit('fail')
+    scheduler.submit('after')
+    handler.release()
+    assert scheduler.drain(timeout=5) == 0
+    assert [call[0] for call in handler.calls] == ['fail', 'after']
+
+
+def test_drain_returns_unfinished_and_rejects_new(blocked):
+    scheduler, handler = blocked
+    scheduler.submit('a')
+    assert scheduler.drain(timeout=0.2) == 2
+    with pytest.raises(SchedulerStoppedError):
+        scheduler.submit('b')
+
+
+def test_source_claims_when_queue_empty():
+    claimed = [('s1', ('url1',)), ('s2', ('url2',))]
+    done = threading.Event()
+
+    def source():
+        return claimed.pop(0) if claimed else None
+
+    def handler(task_id, *args):
+        calls.append((task_id,) + args)
+        if len(calls) == 2:
+            done.set()
+
+    calls = []
+    scheduler = DownloadScheduler(handler, max_workers=1, source=source, poll_interval=0.05)
+    scheduler.start()
+    assert done.wait(5)
+    assert scheduler.drain(timeout=5) == 0
+    assert calls == [('s1', 'url1'), ('s2', 'url2')]
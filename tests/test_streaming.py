@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""边下载边传输（streaming.py）"""
+
+from streaming import available_bytes, iter_growing_file
+
+
+class Download:
+    """模拟正在下载的文件：每次等待时追加一块数据，写完后重命名为最终文件"""
+
+    def __init__(self, tmp_path, chunks):
+        self.part = tmp_path / 'video.mp4.part'
+        self.final = tmp_path / 'video.mp4'
+        self.chunks = list(chunks)
+        self.status = 'downloading'
+        self.waits = 0
+        self.part.write_bytes(b'')
+
+    def locate(self):
+        return (str(self.part) if self.part.exists() else str(self.final)), self.status
+
+    def wait(self, timeout):
+        self.waits += 1
+        if self.chunks:
+            with open(self.part, 'ab') as f:
+                f.write(self.chunks.pop(0))
+        elif self.status == 'downloading':
+            self.part.rename(self.final)
+            self.status = 'completed'
+
+
+def test_reads_while_growing_and_across_rename(tmp_path):
+    download = Download(tmp_path, [b'abc', b'def', b'gh'])
+    data = b''.join(iter_growing_file(download.locate, wait=download.wait, chunk_size=2))
+    assert data == b'abcdefgh'
+    assert download.final.exists()
+
+
+def test_range_stops_at_end(tmp_path):
+    download = Download(tmp_path, [b'0123', b'4567', b'89'])
+    data = b''.join(iter_growing_file(download.locate, start=2, end=5, wait=download.wait))
+    assert data == b'2345'
+    # 请求的范围读完后不再等待剩余的下载
+    assert download.chunks == [b'89']
+
+
+def test_stops_on_error(tmp_path):
+    download = Download(tmp_path, [b'abc'])
+
+    def fail(timeout):
+        download.wait(timeout)
+        download.status = 'error'
+
+    assert b''.join(iter_growing_file(download.locate, wait=fail)) == b'abc'
+
+
+def test_missing_file(tmp_path):
+    assert available_bytes(tmp_path / 'missing') is None
+    assert available_bytes(None) is None
+    assert list(iter_growing_file(lambda: (None, 'error'))) == []
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""任务存储（task_store.py）：内存和SQLite后端的领取、清理"""
+
+import json
+import sqlite3
+import time
+
+import pytest
+
+from task_store import MemoryTaskStore, SQLiteTaskStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        if request.param == 'memory':
+            store = MemoryTaskStore(**kwargs)
+        else:
+            store = SQLiteTaskStore(tmp_path / f'tasks{len(stores)}.db', **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def queued(task_id, created_at, **fields):
+    return dict({'task_id': task_id, 'status': 'queued', 'url': f'https://example.com/{task_id}',
+                 'created_at': created_at}, **fields)
+
+
+def test_claim_order_priority_then_created_at(make_store):
+    store = make_store()
+    now = time.time()
+    store.create(queued('old', now - 10))
+    store.create(queued('new', now))
+    store.create(queued('urgent', now + 5, priority=5))
+
+    assert [store.claim('w')['task_id'] for _ in range(3)] == ['urgent', 'old', 'new']
+    assert store.claim('w') is None
+
+
+def test_claim_skips_observers_and_pending_retries(make_store):
+    store = make_store()
+    now = time.time()
+    store.create(queued('primary', now))
+    store.create(queued('observer', now - 10, primary_task_id='primary', priority=9))
+    store.create(queued('retry', now - 10, retry_at=now + 3600, priority=9))
+
+    task = store.claim('w', lease=30)
+    assert task['task_id'] == 'primary'
+    assert task['status'] == 'downloading'
+    assert task['worker'] == 'w'
+    assert task['lease_expires'] > now
+    assert store.claim('w') is None
+    assert store.get('primary')['status'] == 'downloading'
+
+
+def test_claim_sees_updated_priority(make_store):
+    store = make_store()
+    now = time.time()
+    store.create(queued('a', now - 10))
+    store.create(queued('b', now))
+    store.update('b', priority=3)
+    assert store.claim('w')['task_id'] == 'b'
+
+
+def test_create_or_join_by_dedup_key(make_store):
+    store = make_store()
+    now = time.time()
+    assert store.create_or_join(queued('a', now, dedup_key='k'))[1] == 'a'
+    task, primary = store.create_or_join(queued('b', now + 1, dedup_key='k'))
+    assert primary == 'a' and task['primary_task_id'] == 'a'
+    assert store.create_or_join(queued('c', now + 2, dedup_key='other'))[1] == 'c'
+    assert [t['task_id'] for t in store.find_by_dedup_key('k', 'queued')] == ['a']
+    assert [t['task_id'] for t in store.find_observers('a')] == ['b']
+
+    # 主任务结束后不再加入
+    store.update('a', status='completed')
+    assert store.find_by_dedup_key('k', 'queued') == []
+    assert store.create_or_join(queued('d', now + 3, dedup_key='k'))[1] == 'd'
+
+
+def test_sqlite_unique_active_primary(tmp_path):
+    store = SQLiteTaskStore(tmp_path / 'tasks.db')
+    store.create(queued('a', time.time(), dedup_key='k'))
+    with pytest.raises(sqlite3.IntegrityError):
+        store.create(queued('b', time.time(), dedup_key='k'))
+    store.create(queued('c', time.time(), dedup_key='k', primary_task_id='a'))
+    store.close()
+
+
+def test_count_queued_primaries(make_store):
+    store = make_store()
+    now = time.time()
+    store.create(queued('a', now))
+    store.create(queued('b', now + 1))
+    store.create(queued('observer', now + 2, primary_task_id='a'))
+    store.create(queued('batch', now + 3, kind='batch'))
+    store.create(dict(queued('done', now + 4), status='completed'))
+    assert store.count_queued_primaries() == 2
+    assert store.count_queued_primaries(exclude='b') == 1
+    assert store.count_queued_primaries(exclude='observer') == 2
+
+    store.claim('node')
+    store.update('b', status='error')
+    assert store.count_queued_primaries() == 0
+    store.update('b', status='queued')
+    store.delete('b')
+    assert store.count_queued_primaries() == 0
+
+
+def test_evict_keeps_newest_finished(make_store):
+    store = make_store(max_finished=2, finished_ttl=0)
+    now = time.time()
+    for i in range(4):
+        store.create({'task_id': f't{i}', 'status': 'queued', 'created_at': now + i})
+    for i in range(4):
+        store.update(f't{i}', status='completed' if i % 2 else 'error', finished_at=now + i)
+    store.create(queued('waiting', now))
+
+    store.evict()
+    assert [store.get(f't{i}') is not None for i in range(4)] == [False, False, True, True]
+    assert store.get('waiting') is not None
+
+
+def test_evict_by_age(make_store):
+    store = make_store(max_finished=100, finished_ttl=60)
+    store.create(queued('old', time.time()))
+    store.update('old', status='completed', finished_at=time.time() - 120)
+    store.create(queued('recent', time.time()))
+    store.update('recent', status='completed')
+
+    store.evict()
+    assert store.get('old') is None
+    assert store.get('recent') is not None
+
+
+def test_sqlite_evict_archives(tmp_path):
+    store = SQLiteTaskStore(tmp_path / 'tasks.db', max_finished=0, finished_ttl=0)
+    store.create(queued('done', time.time()))
+    store.update('done', status='completed')
+    store.evict()
+    store.close()
+
+    conn = sqlite3.connect(tmp_path / 'tasks.db')
+    assert conn.execute('SELECT task_id FROM tasks').fetchall() == []
+    assert conn.execute('SELECT task_id, status FROM tasks_archive').fetchall() == [('done', 'completed')]
+    conn.close()
+
+
+def test_sqlite_migrates_old_schema(tmp_path):
+    """旧版本的数据库（没有 priority 等列）打开时补上各列，领取顺序仍按优先级"""
+    db_path = tmp_path / 'tasks.db'
+    conn = sqlite3.connect(db_path)
+    for table in ('tasks', 'tasks_archive'):
+        conn.execute(f'CREATE TABLE {table} (task_id TEXT PRIMARY KEY, status TEXT, url TEXT, '
+                     'created_at REAL, updated_at REAL, finished_at REAL, data TEXT NOT NULL)')
+    now = time.time()
+    for task in (queued('low', now - 10), queued('high', now, priority=2),
+                 queued('observer', now - 20, primary_task_id='low')):
+        conn.execute('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (task['task_id'], 'queued', task['url'], task['created_at'], None, None, json.dumps(task)))
+    conn.commit()
+    conn.close()
+
+    store = SQLiteTaskStore(db_path)
+    assert [store.claim('w')['task_id'] for _ in range(2)] == ['high', 'low']
+    assert store.claim('w') is None
+    store.close()
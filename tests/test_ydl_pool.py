@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""YoutubeDL实例池（ydl_pool.py）"""
+
+import pytest
+
+pytest.importorskip('yt_dlp')
+
+from ydl_pool import YoutubeDLPool, profile_key  # noqa: E402
+
+BEST = {'quiet': True, 'format': 'best'}
+WORST = {'quiet': True, 'format': 'worst'}
+
+
+def test_profile_key_ignores_order():
+    assert profile_key({'a': 1, 'b': 2}) == profile_key({'b': 2, 'a': 1})
+    assert profile_key(BEST) != profile_key(WORST)
+
+
+def test_reuses_instance_per_profile():
+    pool = YoutubeDLPool(size=2)
+    with pool.acquire(BEST) as first:
+        pass
+    with pool.acquire(dict(BEST)) as second:
+        assert second is first
+        assert pool.stats()['in_use'] == 1
+    with pool.acquire(WORST) as other:
+        assert other is not first
+    stats = pool.stats()
+    assert (stats['created'], stats['reused'], stats['profiles'], stats['idle']) == (2, 1, 2, 2)
+    pool.close()
+
+
+def test_hooks_bound_to_current_task():
+    pool = YoutubeDLPool()
+    received = []
+    with pool.acquire(BEST, progress_hooks=[lambda d: received.append(('a', d))]) as ydl:
+        for hook in ydl.params['progress_hooks']:
+            hook({'status': 'downloading'})
+    with pool.acquire(BEST, postprocessor_hooks=[lambda d: received.append(('b', d))]) as ydl:
+        for hook in ydl.params['progress_hooks']:
+            hook({'status': 'downloading'})
+        for hook in ydl.params['postprocessor_hooks']:
+            hook({'status': 'started'})
+    # 第二个任务借用时，第一个任务的进度回调已经解除
+    assert received == [('a', {'status': 'downloading'}), ('b', {'status': 'started'})]
+    pool.close()
+
+
+def test_instance_discarded_after_error():
+    pool = YoutubeDLPool()
+    with pytest.raises(RuntimeError):
+        with pool.acquire(BEST) as failed:
+            raise RuntimeError('下载中断')
+    with pool.acquire(BEST) as ydl:
+        assert ydl is not failed
+    assert pool.stats()['in_use'] == 0
+    pool.close()
+
+
+def test_max_uses_and_no_reuse():
+    pool = YoutubeDLPool(max_uses=2)
+    seen = []
+    for _ in range(3):
+        with pool.acquire(BEST) as ydl:
+            seen.append(ydl)
+    assert seen[0] is seen[1] and seen[2] is not seen[0]
+    pool.close()
+
+    pool = YoutubeDLPool(size=0)
+    with pool.acquire(BEST) as first:
+        pass
+    with pool.acquire(BEST) as second:
+        assert second is not first
+    assert pool.stats()['idle'] == 0
+
+
+def test_idle_timeout_and_profile_limit():
+    pool = YoutubeDLPool(idle_timeout=0)
+    with pool.acquire(BEST) as first:
+        pass
+    with pool.acquire(BEST) as second:
+        assert second is not first
+    pool.close()
+
+    pool = YoutubeDLPool(max_profiles=1)
+    with pool.acquire(BEST):
+        pass
+    with pool.acquire(WORST):
+        pass
+    assert pool.stats()['profiles'] == 1
+    with pool.acquire(WORST):
+        assert pool.stats()['reused'] == 1
+    pool.close()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频文件检查
+判断文件是否需要修复：MPEG-TS被封装在MP4中、moov不在文件开头（没有faststart）、
+缺少moov（文件不完整）、缺少音频或视频流等。
+优先使用纯Python读取容器结构（只读文件头和moov），有ffprobe时补充编码信息。
+检查结果按 (路径, 大小, 修改时间) 缓存，重复运行时只检查有变化的文件。
+"""
+
+import json
+import os
+import shutil
+import struct
+import subprocess
+import threading
+
+# MP4容器可以直接封装（不需要重新编码）的编码格式
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'opus', 'ac3', 'eac3', 'alac', 'flac'}
+
+MP4_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+
+# MPEG-TS 每个包188字节，以0x47开头（M2TS为192字节，前面多4字节时间戳）
+TS_PACKET_SIZES = ((188, 0), (192, 4))
+
+# 缓存文件名（保存在被检查的目录中）
+CACHE_FILENAME = '.fix_videos_cache.json'
+
+# 各问题对应的处理方式
+ISSUE_ACTIONS = {
+    'mpegts_in_mp4': 'remux',
+    'no_faststart': 'remux',
+    'non_mp4_container': 'remux',
+    'incompatible_codec': 'reencode',
+    'unreadable': 'reencode',
+    'missing_moov': 'broken',
+    'missing_video': 'redownload',
+    'missing_audio': 'redownload',
+}
+
+# 处理方式的严重程度，取最严重的一个
+ACTION_ORDER = ('none', 'remux', 'reencode', 'redownload', 'broken')
+
+
+def probe_video(input_file):
+    """
+    使用ffprobe读取容器和音视频流信息
+
+    Returns:
+        {'format': 容器格式, 'duration': 时长（秒）, 'video': 视频编码, 'audio': 音频编码}，
+        ffprobe不可用时返回None，文件无法解析时 'format' 为None
+    """
+    if not shutil.which('ffprobe'):
+        return None
+    cmd = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', str(input_file)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout)
+    except (subprocess.CalledProcessError, ValueError):
+        return {'format': None, 'duration': None, 'video': None, 'audio': None}
+
+    streams = data.get('streams', [])
+    video = next((s.get('codec_name') for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s.get('codec_name') for s in streams if s.get('codec_type') == 'audio'), None)
+    try:
+        duration = float(data.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        'format': data.get('format', {}).get('format_name'),
+        'duration': duration,
+        'video': video,
+        'audio': audio,
+    }
+
+
+def can_remux(probe):
+    """音视频编码都能直接放进MP4容器时，只需要重新封装（-c copy），不需要重新编码"""
+    if probe is None:
+        # 没有ffprobe，先尝试重新封装，失败后再重新编码
+        return True
+    if probe['format'] is None or probe['video'] is None:
+        return False
+    return probe['video'] in MP4_VIDEO_CODECS and (probe['audio'] is None or probe['audio'] in MP4_AUDIO_CODECS)
+
+
+def sniff_container(path):
+    """
+    读取文件头判断真实的容器格式
+
+    Returns:
+        'mp4' / 'mpegts' / 'matroska' / 'flv' / 'avi' / None（无法识别）
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(192 * 4)
+    except OSError:
+        return None
+
+    if len(head) >= 8 and head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+        return 'mp4'
+    for packet_size, offset in TS_PACKET_SIZES:
+        if len(head) >= packet_size * 3 + offset and all(
+                head[offset + i * packet_size] == 0x47 for i in range(3)):
+            return 'mpegts'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'matroska'
+    if head[:3] == b'FLV':
+        return 'flv'
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return 'avi'
+    return None
+
+
+def read_mp4_layout(path):
+    """
+    扫描MP4顶层box，不读取媒体数据
+
+    Returns:
+        {'boxes': 顶层box类型列表, 'faststart': moov是否在mdat之前,
+         'has_moov': 是否有moov, 'tracks': 轨道类型集合（'vide'/'soun'）}
+    """
+    boxes = []
+    tracks = set()
+    size_total = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= size_total:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            size, box_type = struct.unpack('>I4s', header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+                header_size = 16
+            elif size == 0:
+                size = size_total - offset
+            if size < header_size:
+                break
+            box_type = box_type.decode('latin-1')
+            boxes.append(box_type)
+            if box_type == 'moov':
+                tracks = _moov_tracks(f.read(min(size - header_size, 64 * 1024 * 1024)))
+            offset += size
+
+    has_moov = 'moov' in boxes
+    faststart = has_moov and ('mdat' not in boxes or boxes.index('moov') < boxes.index('mdat'))
+    return {'boxes': boxes, 'faststart': faststart, 'has_moov': has_moov, 'tracks': tracks}
+
+
+def _moov_tracks(data):
+    """从moov中找出各trak的handler类型（moov/trak/mdia/hdlr）"""
+    tracks = set()
+    for trak in _child_boxes(data, 'trak'):
+        for mdia in _child_boxes(trak, 'mdia'):
+            for hdlr in _child_boxes(mdia, 'hdlr'):
+                # version/flags(4) + pre_defined(4) + handler_type(4)
+                if len(hdlr) >= 12:
+                    tracks.add(hdlr[8:12].decode('latin-1'))
+    return tracks
+
+
+def _child_boxes(data, wanted):
+    offset = 0
+    while offset + 8 <= len(data):
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header_size = 8
+        if size == 1 and offset + 16 <= len(data):
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header_size = 16
+        elif size == 0:
+            size = len(data) - offset
+        if size < header_size:
+            break
+        if box_type.decode('latin-1') == wanted:
+            yield data[offset + header_size:offset + size]
+        offset += size
+
+
+def classify_video(path, use_ffprobe=True):
+    """
+    检查视频文件是否需要修复
+
+    Returns:
+        {'container': 真实容器格式, 'issues': 问题列表,
+         'action': none（不需要处理）/ remux / reencode / redownload（缺少音视频，只能重新下载）/ broken（文件不完整）}
+    """
+    ext = os.path.splitext(str(path))[1].lower()
+    container = sniff_container(path)
+    issues = []
+
+    if container == 'mp4':
+        try:
+            layout = read_mp4_layout(path)
+        except (OSError, struct.error):
+            layout = None
+        if layout is None:
+            issues.append('unreadable')
+        elif not layout['has_moov']:
+            issues.append('missing_moov')
+        else:
+            if not layout['faststart']:
+                issues.append('no_faststart')
+            if 'vide' not in layout['tracks']:
+                issues.append('missing_video')
+            if 'soun' not in layout['tracks']:
+                issues.append('missing_audio')
+    elif container == 'mpegts':
+        issues.append('mpegts_in_mp4' if ext in MP4_EXTENSIONS else 'non_mp4_container')
+    elif container is None:
+        issues.append('unreadable')
+    else:
+        issues.append('non_mp4_container')
+
+    # ffprobe可以给出编码信息，判断能否只重新封装
+    probe = probe_video(path) if use_ffprobe and issues and 'missing_moov' not in issues else None
+    if probe is not None:
+        if probe['format'] is None:
+            if 'unreadable' not in issues:
+                issues.append('unreadable')
+        else:
+            if probe['video'] is None and 'missing_video' not in issues:
+                issues.append('missing_video')
+            if probe['audio'] is None and 'missing_audio' not in issues:
+                issues.append('missing_audio')
+            if not can_remux(probe) and probe['video'] is not None:
+                issues.append('incompatible_codec')
+
+    action = 'none'
+    for issue in issues:
+        candidate = ISSUE_ACTIONS[issue]
+        if ACTION_ORDER.index(candidate) > ACTION_ORDER.index(action):
+            action = candidate
+    return {'container': container, 'issues': issues, 'action': action}
+
+
+class ProbeCache:
+    """
+    检查结果缓存，按 (路径, 大小, 修改时间) 判断文件是否变化
+
+    Args:
+        cache_file: 缓存文件路径（JSON），为None时只在内存中缓存
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def classify(self, path, use_ffprobe=True):
+        """返回 (检查结果, 是否来自缓存)"""
+        key = os.path.abspath(str(path))
+        stat = os.stat(key)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.get('signature') == signature:
+                return entry['result'], True
+        result = classify_video(key, use_ffprobe)
+        with self._lock:
+            self._entries[key] = {'signature': signature, 'result': result}
+            self._dirty = True
+        return result, False
+
+    def forget(self, path):
+        """文件被修改/删除后移出缓存"""
+        with self._lock:
+            if self._entries.pop(os.path.abspath(str(path)), None) is not None:
+                self._dirty = True
+
+    def save(self):
+        """写回缓存文件（删除已经不存在的文件）"""
+        if not self.cache_file:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {k: v for k, v in self._entries.items() if os.path.exists(k)}
+            tmp_file = f'{self.cache_file}.tmp'
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False)
+                os.replace(tmp_file, self.cache_file)
+                self._entries = entries
+                self._dirty = False
+            except OSError:
+                pass
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+YoutubeDL实例池
+每次解析、下载都新建 YoutubeDL 时，解析器、cookies和HTTP连接都要重新初始化：到CDN的keep-alive连接不能复用，
+解析器实例中缓存的内容（YouTube的播放器代码等）也随之丢失。实例池按选项（画质、是否合并、下载目录等）
+分组保留用过的实例，选项相同的解析和下载直接取用。
+- 实例同一时间只借给一个任务；进度回调和后处理回调在借出时绑定到该任务，归还时解除
+- 任务中抛出异常时实例不再归还（下载中断后的状态不确定），直接关闭
+- 空闲超过 idle_timeout、或已使用 max_uses 次的实例关闭后重建；选项组合超过 max_profiles 时关闭最久没有用到的一组
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 单个实例最多使用的次数（yt-dlp的实例会累积一些只输出一次的提示等状态）
+MAX_USES = 50
+
+# 最多保留的选项组合数
+MAX_PROFILES = 16
+
+
+def profile_key(params):
+    """选项的唯一标识（选项相同的请求共用实例）"""
+    return json.dumps(params, sort_keys=True, ensure_ascii=False, default=repr)
+
+
+class _PooledYoutubeDL:
+    """池中的一个实例：yt-dlp的回调固定指向这里，再转发给当前借用的任务"""
+
+    def __init__(self, params):
+        import yt_dlp
+        self.progress_hooks = ()
+        self.postprocessor_hooks = ()
+        self.uses = 0
+        self.released_at = time.monotonic()
+        self.ydl = yt_dlp.YoutubeDL(dict(params, progress_hooks=[self._on_progress],
+                                         postprocessor_hooks=[self._on_postprocessor]))
+
+    def bind(self, progress_hooks, postprocessor_hooks):
+        self.progress_hooks = tuple(progress_hooks)
+        self.postprocessor_hooks = tuple(postprocessor_hooks)
+        self.uses += 1
+
+    def unbind(self):
+        self.progress_hooks = self.postprocessor_hooks = ()
+        self.released_at = time.monotonic()
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"[警告] 关闭YoutubeDL实例失败: {e}")
+
+    def _on_progress(self, d):
+        for hook in self.progress_hooks:
+            hook(d)
+
+    def _on_postprocessor(self, d):
+        for hook in self.postprocessor_hooks:
+            hook(d)
+
+
+class YoutubeDLPool:
+    """
+    YoutubeDL实例池
+
+    Args:
+        size: 每组选项最多保留的空闲实例数，0表示不复用（每次新建，用完关闭）
+        idle_timeout: 空闲实例的保留时间（秒）
+        max_uses: 单个实例最多使用的次数
+        max_profiles: 最多保留的选项组合数
+    """
+
+    def __init__(self, size=2, idle_timeout=300, max_uses=MAX_USES, max_profiles=MAX_PROFILES):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_uses = max_uses
+        self.max_profiles = max_profiles
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._created = 0
+        self._reused = 0
+
+    @contextmanager
+    def acquire(self, params, progress_hooks=(), postprocessor_hooks=()):
+        """
+        借出一个YoutubeDL实例，用法与 `with yt_dlp.YoutubeDL(params) as ydl:` 相同
+
+        Args:
+            params: YoutubeDL选项，不含回调；选项相同的请求共用实例
+            progress_hooks: 本次任务的下载进度回调
+            postprocessor_hooks: 本次任务的后处理回调
+
+        实例只在本次任务中使用，不要在 with 语句之外保留；需要本次任务专用的后处理器时不要使用实例池
+        """
+        key = profile_key(params)
+        pooled = self._take(key)
+        if pooled is None:
+            pooled = _PooledYoutubeDL(params)
+            with self._lock:
+                self._created += 1
+        pooled.bind(progress_hooks, postprocessor_hooks)
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield pooled.ydl
+        except BaseException:
+            pooled.unbind()
+            self._done(key, pooled, reusable=False)
+            raise
+        pooled.unbind()
+        self._done(key, pooled, reusable=True)
+
+    def stats(self):
+        """实例池统计：空闲/借出的实例数、新建和复用的次数"""
+        with self._lock:
+            return {
+                'profiles': len(self._idle),
+                'idle': sum(len(entries) for entries in self._idle.values()),
+                'in_use': self._in_use,
+                'created': self._created,
+                'reused': self._reused,
+                'size': self.size,
+            }
+
+    def close(self):
+        """关闭所有空闲实例（停止服务时调用；借出的实例归还时关闭）"""
+        with self._lock:
+            closing = [pooled for entries in self._idle.values() for pooled in entries]
+            self._idle.clear()
+            self.size = 0
+        for pooled in closing:
+            pooled.close()
+
+    def _take(self, key):
+        closing = []
+        with self._lock:
+            closing += self._expire()
+            entries = self._idle.get(key)
+            pooled = entries.pop() if entries else None
+            if pooled is not None:
+                self._reused += 1
+                self._idle.move_to_end(key)
+        for item in closing:
+            item.close()
+        return pooled
+
+    def _done(self, key, pooled, reusable):
+        closing = []
+        with self._lock:
+            self._in_use -= 1
+            if reusable and self.size > 0 and pooled.uses < self.max_uses:
+                entries = self._idle.setdefault(key, [])
+                self._idle.move_to_end(key)
+                entries.append(pooled)
+                if len(entries) > self.size:
+                    closing.append(entries.pop(0))
+                while len(self._idle) > self.max_profiles:
+                    closing += self._idle.popitem(last=False)[1]
+            else:
+                closing.append(pooled)
+        for item in closing:
+            item.close()
+
+    def _expire(self):
+        """取出空闲太久的实例（在锁内调用，关闭在锁外进行）"""
+        deadline = time.monotonic() - self.idle_timeout
+        expired = []
+        for key in list(self._idle):
+            entries = self._idle[key]
+            expired += [pooled for pooled in entries if pooled.released_at < deadline]
+            entries[:] = [pooled for pooled in entries if pooled.released_at >= deadline]
+            if not entries:
+                del self._idle[key]
+        return expired
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行统一入口
+  python yt_downloader.py download ...    下载视频（download_youtube.py）
+  python yt_downloader.py redownload ...  Plan B重新下载（redownload_fixed.py）
+  python yt_downloader.py fix ...         检查、修复视频（fix_videos.py）
+  python yt_downloader.py serve ...       运行网页服务（app.py）
+只导入所选子命令需要的模块；yt-dlp、Flask 在真正下载、启动服务时才导入，
+--help 和参数错误时很快返回（cron等频繁调用时也不必每次加载）。
+"""
+
+import importlib
+import os
+import runpy
+import sys
+
+# 子命令 -> (模块, 说明)
+COMMANDS = {
+    'download': ('download_youtube', '下载视频、播放列表，或从文件批量下载'),
+    'redownload': ('redownload_fixed', 'Plan B：使用更严格的格式过滤重新下载'),
+    'fix': ('fix_videos', '检查并修复已下载的视频（MPEG-TS、moov位置等）'),
+    'serve': ('app', '运行网页服务（--serve 为生产模式）'),
+}
+
+# 设置Windows控制台编码为UTF-8
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except:
+        pass
+
+
+def usage(prog):
+    lines = [f'用法: {prog} <命令> [参数...]', '', '命令:']
+    lines += [f'  {name:<12}{description}' for name, (_, description) in COMMANDS.items()]
+    lines += ['', f'各命令的参数: {prog} <命令> --help']
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    prog = os.path.basename(sys.argv[0]) or 'yt_downloader.py'
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(prog))
+        return 0 if argv else 2
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(usage(prog), file=sys.stderr)
+        print(f'\n{prog}: 未知的命令: {command}', file=sys.stderr)
+        return 2
+
+    # 脚本所在目录中的模块（直接运行本文件时已在 sys.path 中）
+    here = os.path.dirname(os.path.abspath(__file__))
+    if here not in sys.path:
+        sys.path.insert(0, here)
+
+    module_name = COMMANDS[command][0]
+    if command == 'serve':
+        # 先检查参数再加载Flask；app.py 按 python app.py 的方式运行（作为 __main__），
+        # gunicorn的网页进程各自导入app，调试服务器的重载器也重新运行 app.py
+        from server import build_parser
+        build_parser(f'{prog} {command}').parse_args(args)
+        app_path = os.path.join(here, 'app.py')
+        sys.argv = [app_path] + args
+        runpy.run_path(app_path, run_name='__main__')
+        return 0
+
+    module = importlib.import_module(module_name)
+    module.main(args, prog=f'{prog} {command}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())